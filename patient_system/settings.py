@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'records.instrumentation.QueryInstrumentationMiddleware',  # Off unless QUERY_INSTRUMENTATION_ENABLED
+    'records.replicas.ReplicaPinMiddleware',  # Read-your-writes for @use_replica views
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,10 +86,22 @@ WSGI_APPLICATION = 'patient_system.wsgi.application'
 #     }
 # }
 
+# Database connection reuse. By default (DB_POOL_SIZE=0) the stock backend is
+# used and DB_CONN_MAX_AGE keeps one persistent connection per thread. Setting
+# DB_POOL_SIZE > 0 opts in to a per-process pool (records.backends.mysql_pool)
+# that works under both WSGI and ASGI; Django hands its connection back at the
+# end of each request.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
 # MySQL/MariaDB Configuration (Active - Requires MySQL 8.0+ or MariaDB 10.6+)
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'records.backends.mysql_pool' if DB_POOL_SIZE else 'django.db.backends.mysql',
         'NAME': 'patient_records_db',
         'USER': 'root',
         'PASSWORD': '',  # Empty password
@@ -97,8 +111,137 @@ DATABASES = {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
             'charset': 'utf8mb4',
         },
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'SIZE': DB_POOL_SIZE,
+            'MAX_OVERFLOW': DB_POOL_MAX_OVERFLOW,
+            'TIMEOUT': DB_POOL_TIMEOUT,
+            'MAX_LIFETIME': DB_POOL_MAX_LIFETIME,
+            'PRE_PING': DB_POOL_PRE_PING,
+        },
+    }
+}
+
+# Read replicas: DB_REPLICA_HOSTS is a comma-separated list of host[:port]
+# with the same credentials as 'default'. List, search and dashboard views
+# read from a replica unless the browser wrote recently or the replica is
+# more than REPLICA_MAX_LAG seconds behind (checked every
+# REPLICA_LAG_CHECK_INTERVAL seconds). A browser that wrote stays on the
+# primary for REPLICA_PIN_SECONDS, but never less than REPLICA_MAX_LAG +
+# REPLICA_LAG_CHECK_INTERVAL, the furthest behind a replica still counted as
+# healthy can be. Under test replicas mirror 'default'.
+DB_REPLICA_HOSTS = [host.strip() for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+REPLICA_DATABASES = []
+for number, replica_host in enumerate(DB_REPLICA_HOSTS, start=1):
+    replica_host, _, replica_port = replica_host.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica_{number}')
+DATABASE_ROUTERS = ['records.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 0))
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 10))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5))
+
+# Patient search backend: 'auto' uses MySQL FULLTEXT on MySQL and the
+# application-maintained token index elsewhere; 'fulltext' or 'token' force one
+PATIENT_SEARCH_BACKEND = os.environ.get('PATIENT_SEARCH_BACKEND', 'auto')
+
+# Must match the server's innodb_ft_min_token_size. Search terms shorter than
+# this are not in the FULLTEXT index and are matched with a prefix LIKE instead
+FULLTEXT_MIN_TOKEN_SIZE = int(os.environ.get('FULLTEXT_MIN_TOKEN_SIZE', 3))
+
+# In-process autocomplete index for the AJAX patient search. At most every
+# AUTOCOMPLETE_VERSION_CHECK_INTERVAL seconds workers apply the patients other
+# processes changed since, or reload when the shared version counter moved.
+AUTOCOMPLETE_INDEX_ENABLED = True
+AUTOCOMPLETE_VERSION_CHECK_INTERVAL = 2.0
+
+# Cache: 'locmem' (per process) or 'file' (shared by the processes on one
+# host, under CACHE_LOCATION). Both count hits and misses per key group for
+# the performance page. Template fragments and list pages are cached for
+# FRAGMENT_CACHE_TTL seconds and invalidated on change by version counters,
+# which live in the database so every process sees a bump at once.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': 'records.backends.cache.LocMemCache',
+    'file': 'records.backends.cache.FileBasedCache',
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache') if CACHE_BACKEND == 'file' else 'records'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000))},
     }
 }
+FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+
+# Seconds the dashboard statistics counters are cached between reads
+DASHBOARD_STATS_CACHE_TTL = int(os.environ.get('DASHBOARD_STATS_CACHE_TTL', 60))
+
+# Tables with more rows than this (per database statistics) get approximate
+# counts in list views and Django admin changelists
+ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('ESTIMATED_COUNT_THRESHOLD', 100000))
+
+# Patient ID allocation: 'sequence' hands out PAT000000001-style IDs from
+# blocks of PATIENT_ID_BLOCK_SIZE leased from a database counter; 'uuid' is
+# the original random scheme
+PATIENT_ID_ALLOCATOR = os.environ.get('PATIENT_ID_ALLOCATOR', 'sequence')
+PATIENT_ID_BLOCK_SIZE = int(os.environ.get('PATIENT_ID_BLOCK_SIZE', 100))
+
+# Per-request SQL and template timing: Server-Timing headers and the
+# /management/performance/ summary of the last QUERY_STATS_SAMPLES requests
+# per URL. With QUERY_BUDGET_STRICT, views over their @query_budget raise
+# instead of logging a warning.
+QUERY_INSTRUMENTATION_ENABLED = os.environ.get('QUERY_INSTRUMENTATION_ENABLED', '') == '1'
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '') == '1'
+QUERY_STATS_SAMPLES = int(os.environ.get('QUERY_STATS_SAMPLES', 200))
+
+# Serve the dashboard, list and patient search pages from the async views in
+# records/async_views.py. Enable when running under ASGI (patient_system.asgi);
+# under WSGI the sync views are faster.
+ASYNC_VIEWS_ENABLED = os.environ.get('ASYNC_VIEWS_ENABLED', '') == '1'
+
+# Background jobs (records/jobs.py), run by `manage.py run_workers` in
+# JOB_WORKER_PROCESSES processes. JOBS_RUN_INLINE runs each job in the web
+# process once its transaction commits instead (development without
+# workers). Failed jobs are retried up to JOB_MAX_ATTEMPTS times, waiting
+# from JOB_RETRY_BASE_DELAY seconds doubling up to JOB_RETRY_MAX_DELAY; jobs
+# running longer than JOB_LOCK_TIMEOUT seconds are taken to be abandoned.
+JOBS_RUN_INLINE = os.environ.get('JOBS_RUN_INLINE', '') == '1'
+JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', 2))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BASE_DELAY = int(os.environ.get('JOB_RETRY_BASE_DELAY', 10))
+JOB_RETRY_MAX_DELAY = int(os.environ.get('JOB_RETRY_MAX_DELAY', 3600))
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+
+# Deleted patients are hidden at once and their rows purged by a background
+# job, PATIENT_PURGE_BATCH_SIZE rows per transaction (records/deletion.py)
+PATIENT_PURGE_BATCH_SIZE = int(os.environ.get('PATIENT_PURGE_BATCH_SIZE', 500))
+
+# Audit log of reads and changes of patient data (records/audit.py). Events
+# are buffered per process and written by a background thread every
+# AUDIT_FLUSH_INTERVAL seconds, in batches of AUDIT_BATCH_SIZE; a request
+# writes the buffer itself once AUDIT_MAX_BUFFER events are waiting. On
+# MySQL the table is partitioned by month: `manage.py audit_partitions`
+# (run monthly) keeps AUDIT_PARTITIONS_AHEAD months ready and drops months
+# older than AUDIT_RETENTION_MONTHS.
+AUDIT_LOG_ENABLED = os.environ.get('AUDIT_LOG_ENABLED', '1') == '1'
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 2.0))
+AUDIT_MAX_BUFFER = int(os.environ.get('AUDIT_MAX_BUFFER', 10000))
+AUDIT_PARTITIONS_AHEAD = int(os.environ.get('AUDIT_PARTITIONS_AHEAD', 3))
+AUDIT_RETENTION_MONTHS = int(os.environ.get('AUDIT_RETENTION_MONTHS', 84))
+
+# Seconds between keepalive comments on the dashboard's live event stream
+# (served under ASGI only)
+DASHBOARD_EVENTS_HEARTBEAT = int(os.environ.get('DASHBOARD_EVENTS_HEARTBEAT', 15))
 
 
 # Password validation
@@ -141,6 +284,24 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media storage: 'hashed' stores uploads once per distinct content under
+# MEDIA_ROOT/blobs/ab/cd/<sha256>.<ext>; unreferenced blobs are removed by
+# `manage.py collect_media_garbage`. 'filesystem' keeps upload file names.
+MEDIA_STORAGE = os.environ.get('MEDIA_STORAGE', 'hashed')
+MEDIA_STORAGE_BACKENDS = {
+    'hashed': 'records.backends.storage.ContentAddressedStorage',
+    'filesystem': 'django.core.files.storage.FileSystemStorage',
+}
+STORAGES = {
+    'default': {'BACKEND': MEDIA_STORAGE_BACKENDS[MEDIA_STORAGE]},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Uploaded photos are processed by a background job: originals are capped at
+# IMAGE_MAX_DIMENSION pixels and stripped of EXIF, and thumbnails are written
+# for the templates (records/images.py)
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 2048))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'patient_system.settings')
 
 application = get_wsgi_application()
+
+# Build the patient autocomplete index in the background, starting with each
+# worker process's first request, so keystroke lookups do not have to wait
+from records.autocomplete import warm_patient_index_on_first_request  # noqa: E402
+
+warm_patient_index_on_first_request()
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
+from .counting import EstimatedCountPaginator
 from .models import CustomUser, Patient, MedicalHistory, Diagnosis, Allergy, Medication
 
 class CustomUserAdmin(UserAdmin):
@@ -21,6 +22,8 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = ['patient_id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'phone']
     search_fields = ['patient_id', 'first_name', 'last_name', 'email']
     list_filter = ['gender', 'blood_group']
@@ -32,6 +35,8 @@ class PatientAdmin(admin.ModelAdmin):
 
 @admin.register(MedicalHistory)
 class MedicalHistoryAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = ['patient', 'date_recorded', 'recorded_by']
     list_filter = ['date_recorded']
     search_fields = ['patient__first_name', 'patient__last_name', 'patient__patient_id', 'notes']
@@ -43,6 +48,8 @@ class MedicalHistoryAdmin(admin.ModelAdmin):
 
 @admin.register(Diagnosis)
 class DiagnosisAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = ['medical_history', 'diagnosis_name', 'diagnosis_date', 'severity']
     list_filter = ['severity', 'diagnosis_date']
     search_fields = ['diagnosis_name', 'description']
@@ -54,6 +61,8 @@ class DiagnosisAdmin(admin.ModelAdmin):
 
 @admin.register(Allergy)
 class AllergyAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     change_form_template = 'admin/records/allergy_change_form.html'
     list_display = ['get_patient_name', 'allergen', 'severity_badge', 'identified_date', 'reaction_preview']
     list_filter = ['severity', 'identified_date']
@@ -128,6 +137,8 @@ class AllergyAdmin(admin.ModelAdmin):
 
 @admin.register(Medication)
 class MedicationAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = ['medical_history', 'medication_name', 'dosage', 'start_date', 'end_date', 'is_active']
     list_filter = ['is_active', 'start_date']
     search_fields = ['medication_name', 'purpose']
@@ -2,37 +2,52 @@
 Custom Admin URLs - Separate from Django's built-in admin
 """
 
+from django.conf import settings
 from django.urls import path
-from . import admin_views
+from . import admin_views, async_views
+
+# Read-heavy pages have async versions for ASGI deployments
+read_views = async_views if settings.ASYNC_VIEWS_ENABLED else admin_views
 
 app_name = 'custom_admin'
 
 urlpatterns = [
     # Dashboard
-    path('', admin_views.custom_admin_dashboard, name='dashboard'),
+    path('', read_views.custom_admin_dashboard, name='dashboard'),
+    path('events/', async_views.dashboard_events_view, name='dashboard_events'),
     
     # Patient Management
-    path('patients/', admin_views.patient_list_view, name='patient_list'),
+    path('patients/', read_views.patient_list_view, name='patient_list'),
     path('patients/create/', admin_views.patient_create_view, name='patient_create'),
+    path('patients/import/', admin_views.patient_import_view, name='patient_import'),
     path('patients/<int:pk>/', admin_views.patient_detail_view, name='patient_detail'),
     path('patients/<int:pk>/update/', admin_views.patient_update_view, name='patient_update'),
     path('patients/<int:pk>/delete/', admin_views.patient_delete_view, name='patient_delete'),
     
     # Allergy Management
-    path('allergies/', admin_views.allergy_list_view, name='allergy_list'),
+    path('allergies/', read_views.allergy_list_view, name='allergy_list'),
     path('allergies/create/', admin_views.allergy_create_view, name='allergy_create'),
     path('allergies/<int:pk>/update/', admin_views.allergy_update_view, name='allergy_update'),
     path('allergies/<int:pk>/delete/', admin_views.allergy_delete_view, name='allergy_delete'),
     
     # Diagnosis Management
-    path('diagnoses/', admin_views.diagnosis_list_view, name='diagnosis_list'),
+    path('diagnoses/', read_views.diagnosis_list_view, name='diagnosis_list'),
     path('diagnoses/create/', admin_views.diagnosis_create_view, name='diagnosis_create'),
     
     # Medication Management
-    path('medications/', admin_views.medication_list_view, name='medication_list'),
+    path('medications/', read_views.medication_list_view, name='medication_list'),
+    
+    # Exports
+    path('exports/<slug:dataset>/', admin_views.export_view, name='export'),
+    
+    # Performance
+    path('performance/', admin_views.performance_view, name='performance'),
+    
+    # Audit Log
+    path('audit/', admin_views.audit_log_view, name='audit_log'),
     
     # AJAX Endpoints
-    path('ajax/patient-search/', admin_views.ajax_patient_search, name='ajax_patient_search'),
+    path('ajax/patient-search/', read_views.ajax_patient_search, name='ajax_patient_search'),
     
     # Profile Management
     path('profile/', admin_views.profile_view, name='profile'),
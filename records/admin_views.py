@@ -3,14 +3,40 @@ Custom Admin Views - Not using Django's built-in admin
 Modern medical-grade admin interface with purple gradient theme
 """
 
+import io
+from datetime import timedelta
+
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import JsonResponse
-from django.core.paginator import Paginator
-from .models import Patient, MedicalHistory, Diagnosis, Allergy, Medication, CustomUser
-from .forms import PatientForm, MedicalHistoryForm, DiagnosisForm, AllergyForm, MedicationForm, ProfileForm
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from .models import Patient, MedicalHistory, Diagnosis, Allergy, Medication, CustomUser, AuditEvent
+from .forms import (PatientForm, MedicalHistoryForm, DiagnosisForm, AllergyForm, MedicationForm, ProfileForm,
+                    PatientPickerForm, PatientImportForm)
+from .audit import audited
+from .autocomplete import patient_index
+from .backends.cache import cache_stats, reset_cache_stats
+from .backends.pool import pool_stats
+from .caching import cached_page, fragment_context
+from .conditional import conditional_on, conditional_on_versions, patient_validator
+from .counting import approximate_count
+from .exports import DATASETS as EXPORT_DATASETS, FORMATS as EXPORT_FORMATS, stream_export
+from .imports import import_patients
+from .instrumentation import query_budget, query_stats
+from .jobs import job_metrics, running_jobs
+from .deletion import delete_patient
+from .filters import exclude_deleted_patients, filter_allergies, filter_diagnoses, filter_medications, filter_patients
+from .pagination import KeysetPaginator
+from .replicas import use_replica
+from .search import search_patients
+from .stats import get_statistics
+
+
+AJAX_SEARCH_PAGE_SIZE = 10
+AJAX_SEARCH_MAX_PAGES = 20
 
 
 def is_staff_or_admin(user):
@@ -18,49 +44,59 @@ def is_staff_or_admin(user):
     return user.is_authenticated and (user.is_staff or user.role in ['admin', 'doctor'])
 
 
+def _child_count(model):
+    """Subquery counting ``model`` rows that belong to the outer medical history"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(medical_history=OuterRef('pk'))
+            .order_by()
+            .values('medical_history')
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
 @login_required
 @user_passes_test(is_staff_or_admin)
+@use_replica
 def custom_admin_dashboard(request):
     """Custom Admin Dashboard"""
+    stats = get_statistics()
     context = {
-        'total_patients': Patient.objects.count(),
-        'total_allergies': Allergy.objects.count(),
-        'total_diagnoses': Diagnosis.objects.count(),
-        'total_medications': Medication.objects.count(),
+        'total_patients': stats['patients'],
+        'total_allergies': stats['allergies'],
+        'total_diagnoses': stats['diagnoses'],
+        'total_medications': stats['medications'],
         'recent_patients': Patient.objects.order_by('-created_at')[:5],
-        'critical_allergies': Allergy.objects.filter(severity__in=['severe', 'life_threatening']).order_by('-identified_date')[:5],
-        'recent_diagnoses': Diagnosis.objects.order_by('-diagnosis_date')[:5],
+        'critical_allergies': exclude_deleted_patients(Allergy.objects.select_related('medical_history__patient')).filter(severity__in=['severe', 'life_threatening']).order_by('-identified_date')[:5],
+        'recent_diagnoses': exclude_deleted_patients(Diagnosis.objects.select_related('medical_history__patient')).order_by('-diagnosis_date')[:5],
+        'fragment_cache': fragment_context('patients', 'allergies', 'diagnoses'),
     }
     return render(request, 'custom_admin/dashboard.html', context)
 
 
+@query_budget(6)
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('list', 'patient')
+@use_replica
+@conditional_on_versions('patients')
 def patient_list_view(request):
     """List all patients with search and filter"""
     query = request.GET.get('q', '')
     gender_filter = request.GET.get('gender', '')
     blood_filter = request.GET.get('blood_group', '')
     
-    patients = Patient.objects.all()
+    patients = filter_patients(Patient.objects.all(), request.GET)
     
+    ordering = ['-created_at', '-pk']
     if query:
-        patients = patients.filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(patient_id__icontains=query) |
-            Q(email__icontains=query)
-        )
+        ordering = ['-search_rank'] + ordering
     
-    if gender_filter:
-        patients = patients.filter(gender=gender_filter)
-    
-    if blood_filter:
-        patients = patients.filter(blood_group=blood_filter)
-    
-    paginator = Paginator(patients, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(patients, 20, ordering)
+    page_obj = cached_page(paginator, 'patients', request)
     
     context = {
         'page_obj': page_obj,
@@ -73,12 +109,14 @@ def patient_list_view(request):
 
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('create', 'patient')
 def patient_create_view(request):
     """Create new patient"""
     if request.method == 'POST':
         form = PatientForm(request.POST, request.FILES)
         if form.is_valid():
             patient = form.save()
+            request.audit_object = patient
             messages.success(request, f'Patient {patient.first_name} {patient.last_name} created successfully!')
             return redirect('custom_admin:patient_detail', pk=patient.pk)
     else:
@@ -90,6 +128,33 @@ def patient_create_view(request):
 
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('import', 'patient')
+def patient_import_view(request):
+    """Bulk import patients from an uploaded CSV or NDJSON file"""
+    result = None
+    if request.method == 'POST':
+        form = PatientImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['file'], encoding='utf-8-sig', newline='')
+            result = import_patients(stream, form.cleaned_data['format'], registered_by=request.user)
+            request.audit_object = None
+            messages.success(request, f'Imported {result.created} patients.')
+            if result.rejected:
+                messages.warning(request, f'{len(result.rejected)} rows were rejected.')
+    else:
+        form = PatientImportForm()
+    
+    context = {
+        'form': form,
+        'result': result,
+        'rejected_preview': result.rejected[:50] if result else [],
+    }
+    return render(request, 'custom_admin/patient_import.html', context)
+
+
+@login_required
+@user_passes_test(is_staff_or_admin)
+@audited('update', 'patient')
 def patient_update_view(request, pk):
     """Update existing patient"""
     patient = get_object_or_404(Patient, pk=pk)
@@ -107,29 +172,51 @@ def patient_update_view(request, pk):
     return render(request, 'custom_admin/patient_form.html', context)
 
 
+@query_budget(9)
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('view', 'patient')
+@conditional_on(patient_validator)
 def patient_detail_view(request, pk):
     """View patient details"""
     patient = get_object_or_404(Patient, pk=pk)
-    medical_histories = patient.medical_histories.all().order_by('-date_recorded')
+    # Per-history counts come from correlated subqueries so the three
+    # child tables are not joined into one multiplied row set; the rows
+    # themselves are prefetched, one query per child table
+    medical_histories = (
+        patient.medical_histories
+        .select_related('recorded_by')
+        .annotate(
+            allergy_count=_child_count(Allergy),
+            diagnosis_count=_child_count(Diagnosis),
+            medication_count=_child_count(Medication),
+        )
+        .prefetch_related(
+            Prefetch('allergies', queryset=Allergy.objects.order_by('-identified_date', 'pk')),
+            Prefetch('diagnoses', queryset=Diagnosis.objects.order_by('-diagnosis_date', 'pk')),
+            Prefetch('medications', queryset=Medication.objects.order_by('-start_date', 'pk')),
+        )
+        .order_by('-date_recorded')
+    )
     
     context = {
         'patient': patient,
         'medical_histories': medical_histories,
+        'fragment_cache': fragment_context(patient=patient),
     }
     return render(request, 'custom_admin/patient_detail.html', context)
 
 
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('delete', 'patient')
 def patient_delete_view(request, pk):
     """Delete patient"""
     patient = get_object_or_404(Patient, pk=pk)
     
     if request.method == 'POST':
         name = f"{patient.first_name} {patient.last_name}"
-        patient.delete()
+        delete_patient(patient)
         messages.success(request, f'Patient {name} deleted successfully!')
         return redirect('custom_admin:patient_list')
     
@@ -137,44 +224,34 @@ def patient_delete_view(request, pk):
     return render(request, 'custom_admin/patient_confirm_delete.html', context)
 
 
+@query_budget(6)
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('list', 'allergy')
+@use_replica
+@conditional_on_versions('allergies')
 def allergy_list_view(request):
     """List all allergies with filters"""
     query = request.GET.get('q', '')
     severity_filter = request.GET.get('severity', '')
     
-    allergies = Allergy.objects.select_related('medical_history__patient').all()
+    allergies = filter_allergies(Allergy.objects.select_related('medical_history__patient').all(), request.GET)
     
-    if query:
-        allergies = allergies.filter(
-            Q(allergen__icontains=query) |
-            Q(reaction__icontains=query) |
-            Q(medical_history__patient__first_name__icontains=query) |
-            Q(medical_history__patient__last_name__icontains=query)
-        )
-    
-    if severity_filter:
-        allergies = allergies.filter(severity=severity_filter)
-    
-    paginator = Paginator(allergies, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Get all patients for the modal dropdown
-    patients = Patient.objects.all().order_by('first_name', 'last_name')
+    paginator = KeysetPaginator(allergies, 20, ['-identified_date', '-pk'])
+    page_obj = cached_page(paginator, 'allergies', request)
     
     context = {
         'page_obj': page_obj,
         'query': query,
         'severity_filter': severity_filter,
-        'patients': patients,
+        'patient_picker': PatientPickerForm(),
     }
     return render(request, 'custom_admin/allergy_list.html', context)
 
 
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('create', 'allergy')
 def allergy_create_view(request):
     """Create new allergy"""
     if request.method == 'POST':
@@ -195,6 +272,7 @@ def allergy_create_view(request):
             
             allergy.medical_history = medical_history
             allergy.save()
+            request.audit_object = allergy
             messages.success(request, f'Allergy record for {allergy.allergen} created successfully!')
             return redirect('custom_admin:allergy_list')
     else:
@@ -206,6 +284,7 @@ def allergy_create_view(request):
 
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('update', 'allergy')
 def allergy_update_view(request, pk):
     """Update existing allergy"""
     allergy = get_object_or_404(Allergy, pk=pk)
@@ -228,6 +307,7 @@ def allergy_update_view(request, pk):
 
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('delete', 'allergy')
 def allergy_delete_view(request, pk):
     """Delete allergy"""
     allergy = get_object_or_404(Allergy, pk=pk)
@@ -242,45 +322,36 @@ def allergy_delete_view(request, pk):
     return render(request, 'custom_admin/allergy_confirm_delete.html', context)
 
 
+@query_budget(8)
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('list', 'diagnosis')
+@use_replica
+@conditional_on_versions('diagnoses')
 def diagnosis_list_view(request):
     """List all diagnoses"""
     query = request.GET.get('q', '')
     severity_filter = request.GET.get('severity', '')
     
-    diagnoses = Diagnosis.objects.select_related('medical_history__patient').all()
+    diagnoses = exclude_deleted_patients(Diagnosis.objects.select_related('medical_history__patient').all())
     
     # Calculate statistics
     from django.utils import timezone
-    from datetime import datetime
-    total_count = diagnoses.count()
-    unique_patients = diagnoses.values('medical_history__patient').distinct().count()
-    current_month = timezone.now().month
-    current_year = timezone.now().year
+    total_count = get_statistics()['diagnoses']
+    unique_patients = approximate_count(diagnoses.values('medical_history__patient').distinct())
+    # Filter on a date range rather than __year/__month so the
+    # diagnosis_date index can serve the count
+    month_start = timezone.now().date().replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
     this_month_count = diagnoses.filter(
-        diagnosis_date__year=current_year,
-        diagnosis_date__month=current_month
+        diagnosis_date__gte=month_start,
+        diagnosis_date__lt=next_month_start
     ).count()
     
-    if query:
-        diagnoses = diagnoses.filter(
-            Q(diagnosis_name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(icd_code__icontains=query) |
-            Q(medical_history__patient__first_name__icontains=query) |
-            Q(medical_history__patient__last_name__icontains=query)
-        )
+    diagnoses = filter_diagnoses(diagnoses, request.GET)
     
-    if severity_filter:
-        diagnoses = diagnoses.filter(severity=severity_filter)
-    
-    paginator = Paginator(diagnoses, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Get all patients for the modal dropdown
-    patients = Patient.objects.all().order_by('first_name', 'last_name')
+    paginator = KeysetPaginator(diagnoses, 20, ['-diagnosis_date', '-pk'])
+    page_obj = cached_page(paginator, 'diagnoses', request)
     
     context = {
         'page_obj': page_obj,
@@ -289,13 +360,14 @@ def diagnosis_list_view(request):
         'total_count': total_count,
         'unique_patients': unique_patients,
         'this_month_count': this_month_count,
-        'patients': patients,
+        'patient_picker': PatientPickerForm(),
     }
     return render(request, 'custom_admin/diagnosis_list.html', context)
 
 
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('create', 'diagnosis')
 def diagnosis_create_view(request):
     """Create new diagnosis"""
     if request.method == 'POST':
@@ -323,6 +395,7 @@ def diagnosis_create_view(request):
             icd_code=request.POST.get('icd_code', ''),
             description=request.POST.get('description', '')
         )
+        request.audit_object = diagnosis
         
         messages.success(request, f'Diagnosis "{diagnosis.diagnosis_name}" created successfully for {patient.first_name} {patient.last_name}!')
         return redirect('custom_admin:diagnosis_list')
@@ -330,36 +403,31 @@ def diagnosis_create_view(request):
     return redirect('custom_admin:diagnosis_list')
 
 
+@query_budget(8)
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('list', 'medication')
+@use_replica
+@conditional_on_versions('medications')
 def medication_list_view(request):
     """List all medications"""
     query = request.GET.get('q', '')
     active_filter = request.GET.get('is_active', '')
     
-    medications = Medication.objects.select_related('medical_history__patient', 'prescribed_by').all()
+    medications = exclude_deleted_patients(
+        Medication.objects.select_related('medical_history__patient', 'prescribed_by').all()
+    )
     
     # Calculate statistics
-    total_count = medications.count()
-    active_count = medications.filter(is_active=True).count()
-    unique_patients = medications.values('medical_history__patient').distinct().count()
+    stats = get_statistics()
+    total_count = stats['medications']
+    active_count = stats['active_medications']
+    unique_patients = approximate_count(medications.values('medical_history__patient').distinct())
     
-    if query:
-        medications = medications.filter(
-            Q(medication_name__icontains=query) |
-            Q(purpose__icontains=query) |
-            Q(medical_history__patient__first_name__icontains=query) |
-            Q(medical_history__patient__last_name__icontains=query) |
-            Q(prescribed_by__first_name__icontains=query) |
-            Q(prescribed_by__last_name__icontains=query)
-        )
+    medications = filter_medications(medications, request.GET)
     
-    if active_filter:
-        medications = medications.filter(is_active=active_filter == 'true')
-    
-    paginator = Paginator(medications, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(medications, 20, ['-start_date', '-pk'])
+    page_obj = cached_page(paginator, 'medications', request)
     
     context = {
         'page_obj': page_obj,
@@ -374,27 +442,120 @@ def medication_list_view(request):
 
 @login_required
 @user_passes_test(is_staff_or_admin)
+@audited('export')
+def export_view(request, dataset):
+    """Stream a CSV or NDJSON export, filtered like the matching list view"""
+    export_format = request.GET.get('format', 'csv')
+    if dataset not in EXPORT_DATASETS or export_format not in EXPORT_FORMATS:
+        raise Http404('Unknown export')
+    
+    response = StreamingHttpResponse(
+        stream_export(dataset, request.GET, export_format),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{export_format}"'
+    return response
+
+
+@query_budget(4)
+@login_required
+@user_passes_test(is_staff_or_admin)
+@audited('search', 'patient')
+@use_replica
+@conditional_on_versions('patients')
 def ajax_patient_search(request):
     """AJAX endpoint for patient search"""
     query = request.GET.get('q', '')
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), AJAX_SEARCH_MAX_PAGES)
+    except ValueError:
+        page = 1
     
     if len(query) < 2:
-        return JsonResponse({'results': []})
-    
-    patients = Patient.objects.filter(
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query) |
-        Q(patient_id__icontains=query)
-    )[:10]
+        return JsonResponse({'results': [], 'pagination': {'more': False}})
+    
+    # Served from the in-process prefix index; the database is only
+    # queried while the index is still warming up. One extra row is
+    # fetched to tell whether another page exists.
+    start = (page - 1) * AJAX_SEARCH_PAGE_SIZE
+    stop = start + AJAX_SEARCH_PAGE_SIZE + 1
+    patients = patient_index.lookup(query, limit=stop)
+    if patients is None:
+        patients = search_patients(query).values('pk', 'first_name', 'last_name', 'patient_id')
+    patients = list(patients[start:stop])
+    more = len(patients) > AJAX_SEARCH_PAGE_SIZE and page < AJAX_SEARCH_MAX_PAGES
+    patients = patients[:AJAX_SEARCH_PAGE_SIZE]
     
     results = [{
-        'id': p.pk,
-        'text': f"{p.first_name} {p.last_name} ({p.patient_id})",
-        'patient_id': p.patient_id,
-        'name': f"{p.first_name} {p.last_name}"
+        'id': p['pk'],
+        'text': f"{p['first_name']} {p['last_name']} ({p['patient_id']})",
+        'patient_id': p['patient_id'],
+        'name': f"{p['first_name']} {p['last_name']}"
     } for p in patients]
     
-    return JsonResponse({'results': results})
+    return JsonResponse({'results': results, 'pagination': {'more': more}})
+
+
+@login_required
+@user_passes_test(is_staff_or_admin)
+def performance_view(request):
+    """Recent query counts and timings per view, from the instrumentation middleware"""
+    if request.method == 'POST':
+        query_stats.reset()
+        reset_cache_stats()
+        messages.success(request, 'Performance statistics cleared.')
+        return redirect('custom_admin:performance')
+    
+    context = {
+        'rows': query_stats.summary(),
+        'pools': pool_stats(),
+        'caches': cache_stats(),
+        'jobs': job_metrics(),
+        'running_jobs': running_jobs(),
+        'instrumentation_enabled': getattr(settings, 'QUERY_INSTRUMENTATION_ENABLED', False),
+        'sample_size': getattr(settings, 'QUERY_STATS_SAMPLES', 200),
+    }
+    return render(request, 'custom_admin/performance.html', context)
+
+
+@login_required
+@user_passes_test(is_staff_or_admin)
+@use_replica
+def audit_log_view(request):
+    """Audit events, newest first, by patient, user or action"""
+    patient_filter = request.GET.get('patient', '')
+    user_filter = request.GET.get('user', '')
+    action_filter = request.GET.get('action', '')
+    
+    events = AuditEvent.objects.all()
+    if patient_filter.isdigit():
+        events = events.filter(patient_id=int(patient_filter))
+    if user_filter:
+        events = events.filter(username=user_filter)
+    if action_filter:
+        events = events.filter(action=action_filter)
+    
+    paginator = KeysetPaginator(events, 50, ['-timestamp', '-pk'])
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    # Deleted patients are named too: their access history is still shown
+    patient_ids = {event.patient_id for event in page_obj if event.patient_id}
+    patients = {
+        patient['pk']: patient
+        for patient in Patient.all_objects.filter(pk__in=patient_ids)
+        .values('pk', 'first_name', 'last_name', 'patient_id', 'deleted_at')
+    }
+    for event in page_obj:
+        event.patient = patients.get(event.patient_id)
+    
+    context = {
+        'page_obj': page_obj,
+        'patient_filter': patient_filter,
+        'user_filter': user_filter,
+        'action_filter': action_filter,
+        'actions': AuditEvent.ACTION_CHOICES,
+        'filtered_patient': patients.get(int(patient_filter)) if patient_filter.isdigit() else None,
+    }
+    return render(request, 'custom_admin/audit_log.html', context)
 
 
 @login_required
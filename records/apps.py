@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RecordsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'records'
+
+    def ready(self):
+        # Signal handlers, and the job functions run by run_workers
+        from . import deletion, signals  # noqa: F401
@@ -0,0 +1,265 @@
+"""
+Async versions of the read-heavy custom admin views
+
+Under ASGI a sync view holds a worker thread for the whole request. These
+views query through the async ORM instead, so the event loop serves other
+requests while a query runs. Django runs async ORM calls through
+thread-sensitive ``sync_to_async``, on one shared thread, so the queries
+gathered with ``asyncio.gather`` still run one after another; they are not
+parallel. They render the same templates with the same context as their
+``admin_views`` counterparts; every queryset is fetched before rendering,
+because templates cannot query the database from the event loop.
+
+``admin_urls`` serves them instead of the sync views when
+``ASYNC_VIEWS_ENABLED`` is set, which only pays off under ASGI: under WSGI
+each async view runs in its own event loop.
+
+The dashboard's live event stream is always async; it needs the ASGI app.
+"""
+
+import asyncio
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+
+from .admin_views import AJAX_SEARCH_MAX_PAGES, AJAX_SEARCH_PAGE_SIZE, is_staff_or_admin
+from .audit import audited
+from .autocomplete import patient_index
+from .caching import acached_page, afragment_context
+from .conditional import conditional_on_versions
+from .counting import aapproximate_count
+from .events import dashboard_events
+from .filters import exclude_deleted_patients, filter_allergies, filter_diagnoses, filter_medications, filter_patients
+from .forms import PatientPickerForm
+from .instrumentation import query_budget
+from .models import Allergy, Diagnosis, Medication, Patient
+from .pagination import KeysetPaginator
+from .replicas import use_replica
+from .search import search_patients
+from .stats import aget_statistics
+
+
+def staff_required(view_func):
+    """Async ``@login_required`` + ``@user_passes_test(is_staff_or_admin)``"""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not is_staff_or_admin(user):
+            return redirect_to_login(request.get_full_path())
+        # Templates read request.user; hand them the loaded user
+        request.user = user
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+async def _list(queryset):
+    return [obj async for obj in queryset]
+
+
+@staff_required
+@use_replica
+async def custom_admin_dashboard(request):
+    """Custom Admin Dashboard"""
+    stats, recent_patients, critical_allergies, recent_diagnoses, fragment_cache = await asyncio.gather(
+        aget_statistics(),
+        _list(Patient.objects.order_by('-created_at')[:5]),
+        _list(exclude_deleted_patients(Allergy.objects.select_related('medical_history__patient')).filter(severity__in=['severe', 'life_threatening']).order_by('-identified_date')[:5]),
+        _list(exclude_deleted_patients(Diagnosis.objects.select_related('medical_history__patient')).order_by('-diagnosis_date')[:5]),
+        afragment_context('patients', 'allergies', 'diagnoses'),
+    )
+    context = {
+        'total_patients': stats['patients'],
+        'total_allergies': stats['allergies'],
+        'total_diagnoses': stats['diagnoses'],
+        'total_medications': stats['medications'],
+        'recent_patients': recent_patients,
+        'critical_allergies': critical_allergies,
+        'recent_diagnoses': recent_diagnoses,
+        'fragment_cache': fragment_cache,
+    }
+    return render(request, 'custom_admin/dashboard.html', context)
+
+
+@query_budget(6)
+@staff_required
+@audited('list', 'patient')
+@use_replica
+@conditional_on_versions('patients')
+async def patient_list_view(request):
+    """List all patients with search and filter"""
+    query = request.GET.get('q', '')
+
+    ordering = ['-created_at', '-pk']
+    if query:
+        ordering = ['-search_rank'] + ordering
+
+    paginator = KeysetPaginator(filter_patients(Patient.objects.all(), request.GET), 20, ordering)
+    context = {
+        'page_obj': await acached_page(paginator, 'patients', request),
+        'query': query,
+        'gender_filter': request.GET.get('gender', ''),
+        'blood_filter': request.GET.get('blood_group', ''),
+    }
+    return render(request, 'custom_admin/patient_list.html', context)
+
+
+@query_budget(6)
+@staff_required
+@audited('list', 'allergy')
+@use_replica
+@conditional_on_versions('allergies')
+async def allergy_list_view(request):
+    """List all allergies with filters"""
+    allergies = filter_allergies(Allergy.objects.select_related('medical_history__patient').all(), request.GET)
+
+    paginator = KeysetPaginator(allergies, 20, ['-identified_date', '-pk'])
+    context = {
+        'page_obj': await acached_page(paginator, 'allergies', request),
+        'query': request.GET.get('q', ''),
+        'severity_filter': request.GET.get('severity', ''),
+        'patient_picker': PatientPickerForm(),
+    }
+    return render(request, 'custom_admin/allergy_list.html', context)
+
+
+@query_budget(8)
+@staff_required
+@audited('list', 'diagnosis')
+@use_replica
+@conditional_on_versions('diagnoses')
+async def diagnosis_list_view(request):
+    """List all diagnoses"""
+    diagnoses = exclude_deleted_patients(Diagnosis.objects.select_related('medical_history__patient').all())
+
+    month_start = timezone.now().date().replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    paginator = KeysetPaginator(filter_diagnoses(diagnoses, request.GET), 20, ['-diagnosis_date', '-pk'])
+    stats, unique_patients, this_month_count, page_obj = await asyncio.gather(
+        aget_statistics(),
+        aapproximate_count(diagnoses.values('medical_history__patient').distinct()),
+        diagnoses.filter(diagnosis_date__gte=month_start, diagnosis_date__lt=next_month_start).acount(),
+        acached_page(paginator, 'diagnoses', request),
+    )
+
+    context = {
+        'page_obj': page_obj,
+        'query': request.GET.get('q', ''),
+        'severity_filter': request.GET.get('severity', ''),
+        'total_count': stats['diagnoses'],
+        'unique_patients': unique_patients,
+        'this_month_count': this_month_count,
+        'patient_picker': PatientPickerForm(),
+    }
+    return render(request, 'custom_admin/diagnosis_list.html', context)
+
+
+@query_budget(8)
+@staff_required
+@audited('list', 'medication')
+@use_replica
+@conditional_on_versions('medications')
+async def medication_list_view(request):
+    """List all medications"""
+    medications = exclude_deleted_patients(
+        Medication.objects.select_related('medical_history__patient', 'prescribed_by').all()
+    )
+
+    paginator = KeysetPaginator(filter_medications(medications, request.GET), 20, ['-start_date', '-pk'])
+    stats, unique_patients, page_obj = await asyncio.gather(
+        aget_statistics(),
+        aapproximate_count(medications.values('medical_history__patient').distinct()),
+        acached_page(paginator, 'medications', request),
+    )
+
+    context = {
+        'page_obj': page_obj,
+        'query': request.GET.get('q', ''),
+        'active_filter': request.GET.get('is_active', ''),
+        'total_count': stats['medications'],
+        'active_count': stats['active_medications'],
+        'unique_patients': unique_patients,
+    }
+    return render(request, 'custom_admin/medication_list.html', context)
+
+
+@query_budget(4)
+@staff_required
+@audited('search', 'patient')
+@use_replica
+@conditional_on_versions('patients')
+async def ajax_patient_search(request):
+    """AJAX endpoint for patient search"""
+    query = request.GET.get('q', '')
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), AJAX_SEARCH_MAX_PAGES)
+    except ValueError:
+        page = 1
+
+    if len(query) < 2:
+        return JsonResponse({'results': [], 'pagination': {'more': False}})
+
+    start = (page - 1) * AJAX_SEARCH_PAGE_SIZE
+    stop = start + AJAX_SEARCH_PAGE_SIZE + 1
+    # The index checks the shared version counter, which may query
+    patients = await sync_to_async(patient_index.lookup)(query, limit=stop)
+    if patients is None:
+        patients = await _list(search_patients(query).values('pk', 'first_name', 'last_name', 'patient_id')[start:stop])
+    else:
+        patients = list(patients[start:stop])
+    more = len(patients) > AJAX_SEARCH_PAGE_SIZE and page < AJAX_SEARCH_MAX_PAGES
+    patients = patients[:AJAX_SEARCH_PAGE_SIZE]
+
+    results = [{
+        'id': p['pk'],
+        'text': f"{p['first_name']} {p['last_name']} ({p['patient_id']})",
+        'patient_id': p['patient_id'],
+        'name': f"{p['first_name']} {p['last_name']}"
+    } for p in patients]
+
+    return JsonResponse({'results': results, 'pagination': {'more': more}})
+
+
+async def _event_stream(last_event_id):
+    # Subscribe on the loop that serves the response, not the view's
+    subscription, backlog = dashboard_events.subscribe(last_event_id)
+    heartbeat = getattr(settings, 'DASHBOARD_EVENTS_HEARTBEAT', 15)
+    try:
+        yield 'retry: 5000\n\n'
+        for message in backlog:
+            yield message
+        # A stream that fell behind ends; the browser reconnects and
+        # catches up from the history
+        while not subscription.overflowed:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+            else:
+                yield message
+    finally:
+        dashboard_events.unsubscribe(subscription)
+
+
+@staff_required
+async def dashboard_events_view(request):
+    """Server-sent events for the admin dashboard"""
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would hold a worker thread; 204 tells
+        # EventSource not to reconnect
+        return HttpResponse(status=204)
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+
+    response = StreamingHttpResponse(_event_stream(last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
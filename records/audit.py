@@ -0,0 +1,306 @@
+"""
+Audit log of who read or changed patient data
+
+Views are decorated with ``@audited(action, resource)``. After the view
+responds, an ``AuditEvent`` (user, action, record, patient, time) is added
+to an in-memory buffer. Nothing is written in the request: a background
+thread writes the buffer with ``bulk_create`` every
+``AUDIT_FLUSH_INTERVAL`` seconds, or sooner once ``AUDIT_BATCH_SIZE``
+events are waiting. The writer also looks up, in one query per batch, the
+patient behind events that name a visit, diagnosis, allergy or
+medication.
+
+The buffer is per process and is flushed at exit. If writes keep failing
+it grows to ``AUDIT_MAX_BUFFER`` events; after that, requests write it
+themselves rather than drop events. With an in-memory SQLite database,
+which other threads cannot reliably share, there is no writer thread and
+events are written whenever a batch fills or ``flush()`` is called.
+
+On MySQL the table is partitioned by month of ``timestamp``, so an old
+month is dropped as a whole rather than deleted row by row.
+``manage.py audit_partitions`` adds upcoming months and drops those past
+``AUDIT_RETENTION_MONTHS``. Partitioned tables cannot have foreign keys,
+and every unique key must include the partitioning column, so the
+primary key is (id, timestamp).
+"""
+
+import atexit
+import logging
+import threading
+from datetime import date
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import Allergy, AuditEvent, Diagnosis, MedicalHistory, Medication, Patient
+
+
+logger = logging.getLogger(__name__)
+
+READ_ACTIONS = {'view', 'list', 'search', 'export'}
+
+# Resource -> (model, lookup of its patient's id)
+RESOURCES = {
+    'patient': (Patient, 'pk'),
+    'medical_history': (MedicalHistory, 'patient_id'),
+    'diagnosis': (Diagnosis, 'medical_history__patient_id'),
+    'allergy': (Allergy, 'medical_history__patient_id'),
+    'medication': (Medication, 'medical_history__patient_id'),
+}
+RESOURCE_NAMES = {model: name for name, (model, _) in RESOURCES.items()}
+
+
+def resolve_patients(events):
+    """Fill in ``patient_id`` for events naming a patient's record"""
+    pending = {}
+    for event in events:
+        if event.patient_id is None and event.object_id is not None and event.resource in RESOURCES:
+            if event.resource == 'patient':
+                event.patient_id = event.object_id
+            else:
+                pending.setdefault(event.resource, []).append(event)
+    for resource, resource_events in pending.items():
+        model, lookup = RESOURCES[resource]
+        # _base_manager: the record's patient may be deleted by now
+        patients = dict(
+            model._base_manager.filter(pk__in={event.object_id for event in resource_events})
+            .values_list('pk', lookup)
+        )
+        for event in resource_events:
+            event.patient_id = patients.get(event.object_id)
+
+
+def _in_memory_database():
+    return connection.vendor == 'sqlite' and connection.is_in_memory_db()
+
+
+class AuditWriter:
+    """Per-process buffer of audit events, written in batches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def pending(self):
+        return len(self._events)
+
+    def record(self, event, can_write=True):
+        """Buffer ``event``; ``can_write`` is False in async code"""
+        with self._lock:
+            self._events.append(event)
+            pending = len(self._events)
+        threaded = self._start()
+        if pending >= settings.AUDIT_MAX_BUFFER or (not threaded and pending >= settings.AUDIT_BATCH_SIZE):
+            if can_write:
+                # Nothing else will write these in time
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('Could not write %s audit events; will retry', self.pending)
+                return
+        if threaded and pending >= settings.AUDIT_BATCH_SIZE:
+            self._wake.set()
+
+    def flush(self):
+        """Write every buffered event; returns the number written"""
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+        try:
+            resolve_patients(events)
+            AuditEvent.objects.bulk_create(events, batch_size=settings.AUDIT_BATCH_SIZE)
+        except Exception:
+            with self._lock:
+                # Back in front of newer events, for the next attempt
+                self._events[:0] = events
+            raise
+        return len(events)
+
+    def discard(self):
+        with self._lock:
+            self._events = []
+
+    def _start(self):
+        """Start the writer thread if needed; False if there can be none"""
+        if self._thread is not None:
+            return True
+        if _in_memory_database():
+            return False
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.AUDIT_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not write %s audit events; will retry', self.pending)
+            finally:
+                close_old_connections()
+
+
+audit_log = AuditWriter()
+
+
+def _event(request, response, action, resource, object_id):
+    """The AuditEvent for a view's response, or None if it is not logged"""
+    user = getattr(request, 'user', None)
+    if not settings.AUDIT_LOG_ENABLED or user is None or not user.is_authenticated:
+        return None
+    if request.method in ('GET', 'HEAD'):
+        if response.status_code not in (200, 304):
+            return None
+        if action not in READ_ACTIONS:
+            # The form or confirmation page of a write shows the record
+            if object_id is None:
+                return None
+            action = 'view'
+    elif action in READ_ACTIONS:
+        return None
+    elif not 300 <= response.status_code < 400 and not hasattr(request, 'audit_object'):
+        # A write succeeded if it redirected or the view says so
+        return None
+    created = getattr(request, 'audit_object', None)
+    if created is not None:
+        resource, object_id = RESOURCE_NAMES[type(created)], created.pk
+    return AuditEvent(
+        timestamp=timezone.now(),
+        user_id=user.pk,
+        username=user.get_username(),
+        action=action,
+        resource=resource or '',
+        object_id=object_id,
+        path=request.get_full_path()[:255],
+    )
+
+
+def audited(action, resource=None, kwarg='pk'):
+    """Log each successful call of the view to the audit log
+
+    Reads (``READ_ACTIONS``) are logged for GET or HEAD requests answered
+    with 200 or 304. Writes are logged for POSTs that redirect; a GET of a
+    write view that names a record is logged as a view of it. ``resource``
+    names what the URL argument ``kwarg`` identifies. A view that creates
+    a record sets ``request.audit_object`` to it; one that writes without
+    redirecting sets it too, to None if no single record was written.
+
+    Place below the login decorators, so ``request.user`` is loaded, and
+    above ``@conditional_on``, so 304 responses are logged too.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                response = await view_func(request, *args, **kwargs)
+                event = _event(request, response, action, resource, kwargs.get(kwarg))
+                if event is not None:
+                    audit_log.record(event, can_write=False)
+                return response
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = view_func(request, *args, **kwargs)
+            event = _event(request, response, action, resource, kwargs.get(kwarg))
+            if event is not None:
+                audit_log.record(event)
+            return response
+        return wrapper
+    return decorator
+
+
+# Monthly partitions (MySQL)
+
+TABLE = AuditEvent._meta.db_table
+FUTURE_PARTITION = 'pfuture'
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month():
+    return timezone.now().date().replace(day=1)
+
+
+def partition_name(month):
+    return f'p{month:%Y%m}'
+
+
+def partition_definition(month):
+    """Partition holding rows from before the month after ``month``"""
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{add_months(month, 1)}'))"
+
+
+def partition_table(schema_editor, months_ahead):
+    """Partition the (empty) audit table by month, from this month on"""
+    month = current_month()
+    definitions = [partition_definition(add_months(month, offset)) for offset in range(months_ahead + 1)]
+    definitions.append(f'PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE')
+    schema_editor.execute(f'ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)')
+    schema_editor.execute(
+        f'ALTER TABLE {TABLE} PARTITION BY RANGE (TO_DAYS(timestamp)) ({", ".join(definitions)})'
+    )
+
+
+def existing_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL',
+            [TABLE],
+        )
+        return [name for (name,) in cursor.fetchall()]
+
+
+def maintain_partitions(months_ahead=None, retention_months=None):
+    """Add partitions for the coming months and drop expired ones
+
+    Returns (partitions added, partitions or rows dropped). Without
+    partitioning (other databases), expired rows are deleted instead.
+    """
+    months_ahead = settings.AUDIT_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    retention_months = settings.AUDIT_RETENTION_MONTHS if retention_months is None else retention_months
+    month = current_month()
+    cutoff = add_months(month, -retention_months)
+
+    if connection.vendor != 'mysql':
+        expired = AuditEvent.objects.filter(timestamp__date__lt=cutoff)
+        return [], expired.delete()[0]
+
+    existing = set(existing_partitions())
+    wanted = [add_months(month, offset) for offset in range(months_ahead + 1)]
+    added = [month for month in wanted if partition_name(month) not in existing and month > _last_month(existing)]
+    with connection.cursor() as cursor:
+        if added:
+            definitions = [partition_definition(month) for month in added]
+            definitions.append(f'PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE')
+            cursor.execute(
+                f'ALTER TABLE {TABLE} REORGANIZE PARTITION {FUTURE_PARTITION} INTO ({", ".join(definitions)})'
+            )
+        expired = sorted(name for name in existing if name != FUTURE_PARTITION and name < partition_name(cutoff))
+        if expired:
+            cursor.execute(f'ALTER TABLE {TABLE} DROP PARTITION {", ".join(expired)}')
+    return [partition_name(month) for month in added], expired
+
+
+def _last_month(partitions):
+    months = [name for name in partitions if name != FUTURE_PARTITION]
+    if not months:
+        return date.min
+    latest = max(months)
+    return date(int(latest[1:5]), int(latest[5:7]), 1)
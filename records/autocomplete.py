@@ -0,0 +1,303 @@
+"""
+In-process prefix index for patient autocomplete
+
+Keystroke lookups from ``ajax_patient_search`` are answered from a sorted
+array of lowercase keys (first name, last name, full name and patient ID)
+with a parallel array of patient primary keys. A prefix maps to one
+contiguous slice of the sorted keys, found with two binary searches, so a
+lookup never touches the database.
+
+The index is warmed in a background thread when a process serves its first
+request and updated incrementally from model signals. Other processes pick
+up a change without a rebuild: at most every
+``AUTOCOMPLETE_VERSION_CHECK_INTERVAL`` seconds a lookup re-reads the
+patients whose ``updated_at`` moved since the last check (soft deletes
+included) and upserts or removes just those entries. The window overlaps
+the previous one by ``SYNC_OVERLAP`` so rows committed late are not
+missed. Changes that leave no ``updated_at`` behind (hard deletes, raw
+bulk writes) bump the ``patient_autocomplete`` version counter
+(``records.caching``) instead, which makes every process reload the whole
+index. While the index is cold, lookups return ``None`` and callers fall
+back to the database.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connection
+from django.utils import timezone
+
+from .caching import bump_versions, get_versions
+from .models import Patient
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = 'patient_autocomplete'
+WARM_DISPATCH_UID = 'warm_patient_index'
+
+# Longest a saved patient may take to commit and still be picked up
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def patient_keys(first_name, last_name, patient_id):
+    """Lowercase keys a patient can be found under"""
+    keys = {
+        first_name.lower(),
+        last_name.lower(),
+        f"{first_name} {last_name}".lower(),
+        patient_id.lower(),
+    }
+    keys.discard('')
+    return keys
+
+
+class PatientPrefixIndex:
+    """Sorted-array prefix index over patient names and IDs"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []
+        self._pks = array('q')
+        self._entries = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._synced_at = None
+        self._building = False
+
+    @property
+    def is_warm(self):
+        return self._version is not None
+
+    def build(self):
+        """Load every patient and replace the index contents"""
+        version = get_versions(VERSION_NAME)[VERSION_NAME]
+        synced_at = timezone.now()
+        pairs = []
+        entries = {}
+        rows = Patient.objects.values_list('pk', 'first_name', 'last_name', 'patient_id')
+        for pk, first_name, last_name, patient_id in rows.iterator(chunk_size=5000):
+            entries[pk] = (first_name, last_name, patient_id)
+            pairs.extend((key, pk) for key in patient_keys(first_name, last_name, patient_id))
+        pairs.sort()
+
+        with self._lock:
+            self._keys = [key for key, _ in pairs]
+            self._pks = array('q', (pk for _, pk in pairs))
+            self._entries = entries
+            self._version = version
+            self._synced_at = synced_at
+            self._checked_at = time.monotonic()
+
+    def warm_async(self):
+        """Build the index in a background thread unless a build is running"""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+
+        def run():
+            try:
+                self.build()
+            except Exception:
+                # Stays cold; the next lookup starts another build
+                logger.warning('Could not build the patient autocomplete index', exc_info=True)
+            finally:
+                self._building = False
+                connection.close()
+
+        threading.Thread(target=run, name='patient-autocomplete-warm', daemon=True).start()
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = []
+            self._pks = array('q')
+            self._entries = {}
+            self._version = None
+
+    def _remove_locked(self, pk):
+        entry = self._entries.pop(pk, None)
+        if entry is None:
+            return
+        for key in patient_keys(*entry):
+            position = bisect_left(self._keys, key)
+            while position < len(self._keys) and self._keys[position] == key:
+                if self._pks[position] == pk:
+                    del self._keys[position]
+                    del self._pks[position]
+                    break
+                position += 1
+
+    def _add_locked(self, pk, first_name, last_name, patient_id):
+        self._entries[pk] = (first_name, last_name, patient_id)
+        for key in patient_keys(first_name, last_name, patient_id):
+            position = bisect_left(self._keys, key)
+            # Keep equal keys ordered by pk so _remove_locked finds them
+            while position < len(self._keys) and self._keys[position] == key and self._pks[position] < pk:
+                position += 1
+            self._keys.insert(position, key)
+            self._pks.insert(position, pk)
+
+    def _upsert_locked(self, pk, first_name, last_name, patient_id):
+        if self._entries.get(pk) == (first_name, last_name, patient_id):
+            return
+        self._remove_locked(pk)
+        self._add_locked(pk, first_name, last_name, patient_id)
+
+    def update(self, patient):
+        """Apply a saved patient to this process's copy of the index"""
+        with self._lock:
+            if self.is_warm:
+                self._upsert_locked(patient.pk, patient.first_name, patient.last_name, patient.patient_id)
+
+    def update_many(self, rows):
+        """Apply many saved patients, as (pk, first_name, last_name, patient_id)
+
+        The new keys are merged into the sorted arrays in one pass rather
+        than inserted one at a time, for bulk imports.
+        """
+        with self._lock:
+            if not self.is_warm:
+                return
+            added = []
+            for pk, first_name, last_name, patient_id in rows:
+                entry = (first_name, last_name, patient_id)
+                if self._entries.get(pk) == entry:
+                    continue
+                self._remove_locked(pk)
+                self._entries[pk] = entry
+                added.extend((key, pk) for key in patient_keys(*entry))
+            if not added:
+                return
+            added.sort()
+            merged = list(heapq.merge(zip(self._keys, self._pks), added))
+            self._keys = [key for key, _ in merged]
+            self._pks = array('q', (pk for _, pk in merged))
+
+    def remove(self, pk):
+        """Drop a deleted patient from this process's copy of the index"""
+        with self._lock:
+            if self.is_warm:
+                self._remove_locked(pk)
+
+    def sync(self):
+        """Apply patients changed by other processes since the last sync"""
+        with self._lock:
+            since = self._synced_at
+        if since is None:
+            return
+        synced_at = timezone.now()
+        rows = list(
+            Patient.all_objects.filter(updated_at__gte=since - SYNC_OVERLAP)
+            .values_list('pk', 'first_name', 'last_name', 'patient_id', 'deleted_at')
+        )
+        with self._lock:
+            if not self.is_warm:
+                return
+            for pk, first_name, last_name, patient_id, deleted_at in rows:
+                if deleted_at is None:
+                    self._upsert_locked(pk, first_name, last_name, patient_id)
+                else:
+                    self._remove_locked(pk)
+            self._synced_at = synced_at
+
+    def publish(self):
+        """Make every other process reload its index
+
+        Only for changes ``sync()`` cannot see, such as hard deletes. This
+        process already applied the change, so it adopts the new version
+        if it was current before the bump.
+        """
+        with self._lock:
+            was_current = self._version is not None
+            bump_versions(VERSION_NAME)
+            version = get_versions(VERSION_NAME)[VERSION_NAME]
+            if was_current and self._version == version - 1:
+                self._version = version
+            elif was_current:
+                self.invalidate()
+
+    def reset(self):
+        """Drop every process's copy after changes made outside the signals"""
+        self.invalidate()
+        bump_versions(VERSION_NAME)
+
+    def _check_version(self):
+        interval = getattr(settings, 'AUTOCOMPLETE_VERSION_CHECK_INTERVAL', 2.0)
+        now = time.monotonic()
+        if now - self._checked_at < interval:
+            return
+        self._checked_at = now
+        if get_versions(VERSION_NAME)[VERSION_NAME] != self._version:
+            self.invalidate()
+            self.warm_async()
+        else:
+            self.sync()
+
+    def lookup(self, query, limit=10):
+        """Return up to ``limit`` patient dicts whose keys start with ``query``.
+
+        Returns ``None`` when the index is cold so the caller can query the
+        database instead.
+        """
+        if not getattr(settings, 'AUTOCOMPLETE_INDEX_ENABLED', True):
+            return None
+        if not self.is_warm:
+            self.warm_async()
+            return None
+        self._check_version()
+
+        prefix = query.strip().lower()
+        with self._lock:
+            if not self.is_warm:
+                return None
+            start = bisect_left(self._keys, prefix)
+            stop = bisect_left(self._keys, prefix + '\uffff', start)
+            pks = []
+            for position in range(start, stop):
+                pk = self._pks[position]
+                if pk not in pks:
+                    pks.append(pk)
+                    if len(pks) >= limit:
+                        break
+            results = []
+            for pk in pks:
+                first_name, last_name, patient_id = self._entries[pk]
+                results.append({
+                    'pk': pk,
+                    'first_name': first_name,
+                    'last_name': last_name,
+                    'patient_id': patient_id,
+                })
+            return results
+
+
+patient_index = PatientPrefixIndex()
+
+
+def warm_patient_index():
+    """Start warming the autocomplete index in the background"""
+    if getattr(settings, 'AUTOCOMPLETE_INDEX_ENABLED', True):
+        patient_index.warm_async()
+
+
+def _warm_on_first_request(sender, **kwargs):
+    request_started.disconnect(dispatch_uid=WARM_DISPATCH_UID)
+    warm_patient_index()
+
+
+def warm_patient_index_on_first_request():
+    """Warm the index once this process starts serving requests
+
+    Not at import: a pre-forking server (gunicorn ``--preload``) imports the
+    application in its master process, whose connections and threads the
+    forked workers would inherit.
+    """
+    request_started.connect(_warm_on_first_request, dispatch_uid=WARM_DISPATCH_UID)
@@ -0,0 +1,60 @@
+"""
+Cache backends that count hits and misses
+
+Drop-in replacements for Django's local-memory and file-based caches. Every
+``get`` (and everything built on it: ``get_many``, ``get_or_set``, the
+``{% cache %}`` tag, the async methods) is counted per key group for the
+performance page. Counters are per process.
+"""
+
+import threading
+from collections import defaultdict
+
+from django.core.cache.backends import filebased, locmem
+
+
+_MISSING = object()
+_counters = defaultdict(lambda: [0, 0])
+_lock = threading.Lock()
+
+
+def key_group(key):
+    """'fragment <name>' for ``{% cache %}`` keys, else the first two ``:`` parts"""
+    if key.startswith('template.cache.'):
+        return f"fragment {key.split('.')[2]}"
+    return ':'.join(key.split(':')[:2])
+
+
+def _record(key, hit):
+    with _lock:
+        _counters[key_group(key)][0 if hit else 1] += 1
+
+
+def cache_stats():
+    """[{group, hits, misses, hit_rate}] for every key group seen, busiest first"""
+    with _lock:
+        counters = {group: tuple(counts) for group, counts in _counters.items()}
+    rows = []
+    for group, (hits, misses) in counters.items():
+        rows.append({'group': group, 'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) * 100})
+    return sorted(rows, key=lambda row: row['hits'] + row['misses'], reverse=True)
+
+
+def reset_cache_stats():
+    with _lock:
+        _counters.clear()
+
+
+class CacheMetricsMixin:
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        _record(key, value is not _MISSING)
+        return default if value is _MISSING else value
+
+
+class LocMemCache(CacheMetricsMixin, locmem.LocMemCache):
+    pass
+
+
+class FileBasedCache(CacheMetricsMixin, filebased.FileBasedCache):
+    pass
@@ -0,0 +1,57 @@
+"""
+MySQL backend whose connections come from a process-wide pool
+
+Use with ``CONN_MAX_AGE = 0``: Django then "closes" its connection at the
+end of every request, which hands it back to the pool instead of
+disconnecting. Pool options are read from the ``POOL`` entry of the
+database settings (see ``records.backends.pool.ConnectionPool``).
+"""
+
+from django.db.backends.mysql import base as mysql
+from django.utils.asyncio import async_unsafe
+
+from ..pool import ConnectionPool, PoolTimeout, get_pool
+
+
+class DatabaseWrapper(mysql.DatabaseWrapper):
+    def _get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL', {})
+
+        def connect():
+            connection = mysql.Database.connect(**conn_params)
+            if connection.encoders.get(bytes) is bytes:
+                connection.encoders.pop(bytes)
+            return connection
+
+        def create_pool():
+            return ConnectionPool(
+                connect,
+                size=options.get('SIZE', 10),
+                max_overflow=options.get('MAX_OVERFLOW', 10),
+                timeout=options.get('TIMEOUT', 30),
+                max_lifetime=options.get('MAX_LIFETIME', 3600),
+                pre_ping=options.get('PRE_PING', True),
+            )
+
+        # The test runner points the same alias at a different database
+        return get_pool((self.alias, conn_params.get('database')), create_pool)
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        self._pool = self._get_pool(conn_params)
+        try:
+            return self._pool.checkout()
+        except PoolTimeout as exc:
+            raise mysql.Database.OperationalError(str(exc)) from exc
+
+    def init_connection_state(self):
+        # Session settings survive on a pooled connection; apply them once
+        if getattr(self.connection, 'pool_initialized', False):
+            return
+        super().init_connection_state()
+        self.connection.pool_initialized = True
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._pool.checkin(self.connection)
@@ -0,0 +1,191 @@
+"""
+Process-wide database connection pool
+
+Without pooling, every request opens a new database connection and pays the
+TCP and authentication handshake; ``CONN_MAX_AGE`` only helps when the same
+thread serves the next request, which is not the case under ASGI. The pool
+keeps open connections per process and hands them to whichever thread
+connects next:
+
+- ``size`` connections are kept open; up to ``max_overflow`` more are
+  opened under load and closed again when returned;
+- ``checkout`` waits up to ``timeout`` seconds for a free connection and
+  then raises ``PoolTimeout``;
+- connections older than ``max_lifetime`` seconds are replaced, and with
+  ``pre_ping`` every connection is pinged before it is handed out;
+- returned connections are rolled back so no transaction leaks between
+  requests.
+
+Wait times and pool activity are counted for the performance page.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """LIFO pool of raw DB-API connections created by ``connect()``"""
+
+    def __init__(self, connect, size=10, max_overflow=10, timeout=30.0, max_lifetime=3600.0, pre_ping=True):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self._condition = threading.Condition()
+        # (connection, created_at); the most recently returned is reused
+        # first, so surplus connections go idle and age out
+        self._idle = deque()
+        self._created_at = {}
+        self._open = 0
+        self._counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait': 0.0,
+            'timeouts': 0,
+            'connects': 0,
+            'recycled': 0,
+            'failed_pings': 0,
+        }
+
+    def checkout(self):
+        """Return an open connection, waiting for one if the pool is exhausted"""
+        started = time.monotonic()
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, created_at = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    connection = created_at = None
+                    break
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection free after {self.timeout}s '
+                        f'({self.size + self.max_overflow} in use)'
+                    )
+                waited = True
+                self._condition.wait(remaining)
+            wait = time.monotonic() - started
+            self._counters['checkouts'] += 1
+            self._counters['wait_time'] += wait
+            self._counters['max_wait'] = max(self._counters['max_wait'], wait)
+            if waited:
+                self._counters['waits'] += 1
+
+        if connection is not None:
+            if self._expired(created_at):
+                self._count('recycled')
+                self._close_quietly(connection)
+                connection = None
+            elif self.pre_ping and not self._ping(connection):
+                self._count('failed_pings')
+                self._close_quietly(connection)
+                connection = None
+        if connection is None:
+            connection = self._new_connection()
+        return connection
+
+    def checkin(self, connection):
+        """Return a connection checked out from this pool"""
+        created_at = self._created_at.get(id(connection))
+        reusable = created_at is not None and not self._expired(created_at)
+        if reusable:
+            try:
+                connection.rollback()
+            except Exception:
+                reusable = False
+
+        with self._condition:
+            if reusable and len(self._idle) < self.size:
+                self._idle.append((connection, created_at))
+                self._condition.notify()
+                return
+        self._close_quietly(connection)
+        self._release()
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._counters)
+            stats.update(size=self.size, max_overflow=self.max_overflow, open=self._open, idle=len(self._idle))
+        stats['in_use'] = stats['open'] - stats['idle']
+        stats['avg_wait_ms'] = stats['wait_time'] / stats['checkouts'] * 1000 if stats['checkouts'] else 0.0
+        stats['max_wait_ms'] = stats.pop('max_wait') * 1000
+        stats.pop('wait_time')
+        return stats
+
+    def close_all(self):
+        """Close idle connections; connections in use are closed when returned"""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _ in idle:
+            self._close_quietly(connection)
+            self._release()
+
+    def _new_connection(self):
+        """Open a connection in a slot already reserved by checkout()"""
+        try:
+            connection = self._connect()
+        except Exception:
+            self._release()
+            raise
+        self._created_at[id(connection)] = time.monotonic()
+        self._count('connects')
+        return connection
+
+    def _expired(self, created_at):
+        return self.max_lifetime is not None and time.monotonic() - created_at > self.max_lifetime
+
+    def _ping(self, connection):
+        try:
+            connection.ping()
+        except Exception:
+            return False
+        return True
+
+    def _close_quietly(self, connection):
+        self._created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _release(self):
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    def _count(self, name):
+        with self._condition:
+            self._counters[name] += 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    """Return the pool registered under ``key``, creating it with ``factory()``"""
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = factory()
+        return _pools[key]
+
+
+def pool_stats():
+    """{pool name: stats} for every pool in this process"""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {name: pool.stats() for (name, _), pool in pools}
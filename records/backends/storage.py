@@ -0,0 +1,94 @@
+"""
+Content-addressed media storage
+
+Uploads are stored under the SHA-256 of their bytes, sharded two levels
+deep (``blobs/ab/cd/abcd....jpg``), instead of under their upload name:
+
+- identical files (a re-uploaded photo, the same scan attached twice) are
+  stored once and share a name;
+- no directory grows into one huge flat listing;
+- a name never changes content, so it can be served with far-future cache
+  headers (``records.media.serve_media``).
+
+Because a blob may be shared, ``delete()`` leaves it in place. Blobs no
+longer referenced by any file field are removed by the
+``collect_media_garbage`` command. Files stored before this backend keep
+their names, are served as before and are deleted as before.
+"""
+
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+BLOB_ROOT = 'blobs'
+BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def is_blob_name(name):
+    return bool(BLOB_NAME.match(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def blob_name(self, digest, extension):
+        return posixpath.join(BLOB_ROOT, digest[:2], digest[2:4], f'{digest}{extension}')
+
+    def get_available_name(self, name, max_length=None):
+        # The stored name comes from the content in _save; it never clashes
+        return name
+
+    def _save(self, name, content):
+        extension = posixpath.splitext(name)[1].lower()
+        staging = os.path.join(self.location, BLOB_ROOT, 'incoming')
+        os.makedirs(staging, exist_ok=True)
+
+        # Hash while writing so the upload is read once
+        digest = hashlib.sha256()
+        descriptor, staged = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(descriptor, 'wb') as staged_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    staged_file.write(chunk)
+            name = self.blob_name(digest.hexdigest(), extension)
+            path = self.path(name)
+            if os.path.exists(path):
+                # Already stored: refresh its age so garbage collection
+                # spares a blob that was just referenced again
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(staged, self.file_permissions_mode)
+                # Atomic, so concurrent identical uploads both succeed
+                os.replace(staged, path)
+        finally:
+            if os.path.exists(staged):
+                os.remove(staged)
+        return name
+
+    def delete(self, name):
+        """Delete a file stored before this backend; blobs are kept
+
+        Other rows may share a blob; ``collect_media_garbage`` removes it
+        once nothing references it.
+        """
+        if not is_blob_name(name):
+            super().delete(name)
+
+    def blob_names(self):
+        """Names of all stored blobs"""
+        root = self.path(BLOB_ROOT)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(directory, filename), self.location).replace(os.sep, '/')
+                if is_blob_name(name):
+                    yield name
+
+    def purge(self, name):
+        """Remove a blob; only for blobs nothing references"""
+        super().delete(name)
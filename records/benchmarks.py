@@ -0,0 +1,221 @@
+"""
+URL benchmark runner
+
+Times GET requests to every URL in ``records/urls.py`` and
+``records/admin_urls.py`` through the Django test client, logged in as a
+staff user, and records latency and query counts per URL name. URL
+arguments are filled with a patient, visit or allergy from the middle of
+the table so that detail pages are measured on real rows.
+
+``load_test()`` instead measures throughput: many concurrent requests to the
+read-heavy pages, through the WSGI handler on a thread pool or through the
+ASGI handler on one event loop.
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import admin_urls, urls
+from .models import Allergy, MedicalHistory, Patient
+
+
+# Ends the benchmark user's session
+SKIP_URL_NAMES = {'logout'}
+
+# Model a URL argument refers to, by argument name or by first route segment
+KWARG_MODELS = {'patient_pk': Patient, 'history_pk': MedicalHistory}
+ROUTE_MODELS = {'patients': Patient, 'medical-history': MedicalHistory, 'allergies': Allergy}
+SLUG_VALUES = {'dataset': 'patients'}
+
+# Pages served by records/async_views.py when ASYNC_VIEWS_ENABLED is set
+LOAD_TEST_URL_NAMES = [
+    'custom_admin:dashboard',
+    'custom_admin:patient_list',
+    'custom_admin:allergy_list',
+    'custom_admin:diagnosis_list',
+    'custom_admin:medication_list',
+]
+LOAD_TEST_SEARCH = 'an'
+
+
+def sample_pk(model):
+    """Primary key of a row from the middle of the table, or None if empty"""
+    bounds = model.objects.order_by('pk').values_list('pk', flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return None
+    return bounds.filter(pk__gte=(first + last) // 2).first()
+
+
+def benchmark_urls():
+    """[(URL name, path)] for every URL that can be requested with GET"""
+    samples = {}
+    found = []
+    for namespace, module in (('', urls), ('custom_admin', admin_urls)):
+        for pattern in module.urlpatterns:
+            if pattern.name in SKIP_URL_NAMES:
+                continue
+            route = str(pattern.pattern)
+            kwargs = {}
+            for name in pattern.pattern.converters:
+                if name in SLUG_VALUES:
+                    kwargs[name] = SLUG_VALUES[name]
+                    continue
+                model = KWARG_MODELS.get(name) or ROUTE_MODELS.get(route.split('/')[0])
+                if model not in samples:
+                    samples[model] = sample_pk(model) if model else None
+                kwargs[name] = samples[model]
+            if None in kwargs.values():
+                continue
+            url_name = f'{namespace}:{pattern.name}' if namespace else pattern.name
+            found.append((url_name, reverse(url_name, kwargs=kwargs)))
+    return found
+
+
+def time_url(client, path, repeat=5, warmup=1):
+    """Request ``path`` ``warmup + repeat`` times; return timings of the last ``repeat``"""
+    timings = []
+    queries = []
+    status_code = None
+    for attempt in range(warmup + repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if attempt >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+        status_code = response.status_code
+
+    timings.sort()
+    return {
+        'path': path,
+        'status': status_code,
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'min_ms': round(timings[0], 2),
+        'max_ms': round(timings[-1], 2),
+        'queries': max(queries),
+    }
+
+
+def run_benchmarks(user, repeat=5, warmup=1):
+    """Benchmark every URL as ``user``; returns {URL name: result}"""
+    client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+    client.force_login(user)
+    # Failing URLs are reported by status code; keep their tracebacks out of the output
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    try:
+        return {url_name: time_url(client, path, repeat, warmup) for url_name, path in benchmark_urls()}
+    finally:
+        request_logger.setLevel(level)
+
+
+def compare_reports(baseline, current):
+    """[(patients, URL name, baseline median, current median, change %)] for runs in both reports"""
+    baseline_runs = {run['target']: run for run in baseline['runs']}
+    rows = []
+    for run in current['runs']:
+        before = baseline_runs.get(run['target'])
+        if before is None:
+            continue
+        for url_name, result in run['urls'].items():
+            previous = before['urls'].get(url_name)
+            if previous is None or not previous['median_ms']:
+                continue
+            change = (result['median_ms'] - previous['median_ms']) / previous['median_ms'] * 100
+            rows.append((run['target'], url_name, previous['median_ms'], result['median_ms'], change))
+    return rows
+
+
+def load_test_paths():
+    paths = [reverse(url_name) for url_name in LOAD_TEST_URL_NAMES]
+    paths.append(f"{reverse('custom_admin:ajax_patient_search')}?q={LOAD_TEST_SEARCH}")
+    return paths
+
+
+def _summarize(latencies, statuses, elapsed):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status != 200),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'median_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        'max_ms': round(latencies[-1], 2),
+    }
+
+
+def _load_test_wsgi(session_cookies, paths, concurrency, total):
+    def worker(numbers):
+        client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+        for name, morsel in session_cookies.items():
+            client.cookies[name] = morsel.value
+        results = []
+        try:
+            for number in numbers:
+                started = time.perf_counter()
+                response = client.get(paths[number % len(paths)])
+                results.append(((time.perf_counter() - started) * 1000, response.status_code))
+        finally:
+            connections.close_all()
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        batches = executor.map(worker, [range(start, total, concurrency) for start in range(concurrency)])
+        results = [result for batch in batches for result in batch]
+    elapsed = time.perf_counter() - started
+    return _summarize([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+async def _load_test_asgi(client, paths, concurrency, total):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(number):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(paths[number % len(paths)])
+            return (time.perf_counter() - started) * 1000, response.status_code
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(request(number) for number in range(total)))
+    elapsed = time.perf_counter() - started
+    return _summarize([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+def load_test(user, handler='wsgi', concurrency=50, total=1000):
+    """Throughput of ``total`` requests, ``concurrency`` at a time, through ``handler``
+
+    Requests go through Django's test handlers in this process, so the
+    numbers compare the handlers and views, not a web server. Whether the
+    async views are used depends on ``ASYNC_VIEWS_ENABLED`` when the URLs
+    were loaded.
+    """
+    paths = load_test_paths()
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    try:
+        if handler == 'wsgi':
+            # One session shared by every thread
+            client = Client()
+            client.force_login(user)
+            return _load_test_wsgi(client.cookies, paths, concurrency, total)
+        client = AsyncClient(raise_request_exception=False)
+        client.force_login(user)
+        return asyncio.run(_load_test_asgi(client, paths, concurrency, total))
+    finally:
+        request_logger.setLevel(level)
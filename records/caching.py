@@ -0,0 +1,151 @@
+"""
+Template fragment and list page caching
+
+Cached fragments and list pages are keyed by version counters rather than
+deleted on change: signal handlers bump the counters of the models that
+changed (``records.signals.INVALIDATES``) once the change is committed,
+and later reads simply miss the old keys, which age out.
+
+The counters are ``CacheVersion`` rows, so a bump made by one process is
+seen by every other one even when each keeps its own local cache; a
+counter kept in a per-process cache would leave the other workers serving
+stale pages until the TTL ran out. Reading them costs one query for all
+the counters a page needs.
+
+Templates use Django's ``{% cache %}`` tag with a version from
+``fragment_context()`` among the vary-on arguments; list views cache their
+current page with ``cached_page()``.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import CacheVersion
+from .pagination import KeysetPage
+
+
+PAGE_KEY = 'records:page:{}:{}:{}'
+
+
+def fragment_ttl():
+    return getattr(settings, 'FRAGMENT_CACHE_TTL', 300)
+
+
+def _versions(names, found):
+    # Counters never bumped are at 0
+    return {name: found.get(name, 0) for name in names}
+
+
+def get_versions(*names):
+    """{name: current version} for the named counters"""
+    found = dict(CacheVersion.objects.filter(name__in=names).values_list('name', 'version'))
+    return _versions(names, found)
+
+
+async def aget_versions(*names):
+    """Async ``get_versions()``"""
+    found = {name: version async for name, version in
+             CacheVersion.objects.filter(name__in=names).values_list('name', 'version')}
+    return _versions(names, found)
+
+
+def request_versions(request, *names):
+    """``get_versions()``, read once per request"""
+    known = request.__dict__.setdefault('_cache_versions', {})
+    missing = [name for name in names if name not in known]
+    if missing:
+        known.update(get_versions(*missing))
+    return {name: known[name] for name in names}
+
+
+async def arequest_versions(request, *names):
+    """Async ``request_versions()``"""
+    known = request.__dict__.setdefault('_cache_versions', {})
+    missing = [name for name in names if name not in known]
+    if missing:
+        known.update(await aget_versions(*missing))
+    return {name: known[name] for name in names}
+
+
+def bump_versions(*names):
+    updated = CacheVersion.objects.filter(name__in=names).update(version=F('version') + 1)
+    if updated == len(set(names)):
+        return
+    existing = set(CacheVersion.objects.filter(name__in=names).values_list('name', flat=True))
+    for name in set(names) - existing:
+        try:
+            with transaction.atomic():
+                # Starts from the time, not 1, so no version ever repeats
+                # one that a shared cache may still hold pages for
+                CacheVersion.objects.create(name=name, version=time.time_ns())
+        except IntegrityError:
+            # Created by a concurrent bump, which did the job
+            pass
+
+
+def patient_version_name(pk):
+    return f'patient:{pk}'
+
+
+def _fragment_counters(names, objects):
+    return list(names) + [patient_version_name(patient.pk) for patient in objects.values()]
+
+
+def _fragment_context(names, objects, versions):
+    context = {'ttl': fragment_ttl()}
+    context.update((name, versions[name]) for name in names)
+    context.update((keyword, versions[patient_version_name(patient.pk)]) for keyword, patient in objects.items())
+    return context
+
+
+def fragment_context(*names, **objects):
+    """Template context for ``{% cache fragment_cache.ttl <name> fragment_cache.<version> %}``
+
+    ``names`` are version counters; each keyword names a patient whose
+    own version is exposed under that keyword.
+    """
+    versions = get_versions(*_fragment_counters(names, objects))
+    return _fragment_context(names, objects, versions)
+
+
+async def afragment_context(*names, **objects):
+    """Async ``fragment_context()``"""
+    versions = await aget_versions(*_fragment_counters(names, objects))
+    return _fragment_context(names, objects, versions)
+
+
+def _page_key(name, version, params):
+    query = hashlib.md5(params.urlencode().encode(), usedforsecurity=False).hexdigest()
+    return PAGE_KEY.format(name, version, query)
+
+
+def _cached(paginator, data):
+    rows, has_next, has_previous = data
+    return KeysetPage(rows, paginator, has_next, has_previous)
+
+
+def cached_page(paginator, name, request):
+    """``paginator.get_page(request.GET['cursor'])``, cached under list version ``name``"""
+    key = _page_key(name, request_versions(request, name)[name], request.GET)
+    data = cache.get(key)
+    if data is None:
+        page = paginator.get_page(request.GET.get('cursor'))
+        data = (page.object_list, page.has_next(), page.has_previous())
+        cache.set(key, data, fragment_ttl())
+    return _cached(paginator, data)
+
+
+async def acached_page(paginator, name, request):
+    """Async ``cached_page()``"""
+    key = _page_key(name, (await arequest_versions(request, name))[name], request.GET)
+    data = await cache.aget(key)
+    if data is None:
+        page = await paginator.aget_page(request.GET.get('cursor'))
+        data = (page.object_list, page.has_next(), page.has_previous())
+        await cache.aset(key, data, fragment_ttl())
+    return _cached(paginator, data)
@@ -0,0 +1,118 @@
+"""
+Conditional GET for patient, record and list pages
+
+Each decorated view gets an ``ETag`` (and, where the validator is a
+timestamp, ``Last-Modified``) computed without rendering, and answers
+``304 Not Modified`` when the browser's copy is current:
+
+- a patient's pages change when the patient row or its clinical summary
+  is saved; every change to the chart marks the summary stale, so its
+  ``updated_at`` covers visits, diagnoses, allergies and medications;
+- a visit page additionally depends on the visit's own row;
+- list pages and the patient search change when their cache version
+  counters are bumped (see ``records.caching``). The counters are read
+  from the database, so a bump by any process changes the ETag in all of
+  them; a 304 never outlives the data it vouches for.
+
+ETags also cover the user and the CSRF cookie, since pages show the user
+and embed a CSRF token. Pages with a pending flash message are always
+rendered so the message is shown. Responses are marked ``private,
+no-cache`` so browsers revalidate instead of reusing a stale copy.
+"""
+
+import hashlib
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .caching import request_versions
+from .models import MedicalHistory, Patient
+
+
+def patient_validator(request, pk):
+    row = Patient.objects.filter(pk=pk).values_list('updated_at', 'summary__updated_at').first()
+    return _latest(row)
+
+
+def medical_history_validator(request, pk):
+    row = (
+        MedicalHistory.objects.filter(pk=pk)
+        .values_list('date_recorded', 'patient__updated_at', 'patient__summary__updated_at')
+        .first()
+    )
+    return _latest(row)
+
+
+def _latest(row):
+    if row is None:
+        return None
+    timestamps = [timestamp for timestamp in row if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def _make_etag(request, validator):
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    raw = f'{request.user.pk}:{csrf_cookie}:{validator}'
+    return hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+
+
+def _has_pending_messages(request):
+    # len() reads the messages without marking them as shown
+    return len(messages.get_messages(request)) > 0
+
+
+def _conditional(validator_func, is_timestamp):
+    def validator(request, *args, **kwargs):
+        # Computed once per request for both the ETag and Last-Modified
+        if not hasattr(request, '_conditional_validator'):
+            value = None
+            if request.method in ('GET', 'HEAD') and not _has_pending_messages(request):
+                value = validator_func(request, *args, **kwargs)
+            request._conditional_validator = value
+        return request._conditional_validator
+
+    def etag(request, *args, **kwargs):
+        value = validator(request, *args, **kwargs)
+        return None if value is None else _make_etag(request, value)
+
+    def last_modified(request, *args, **kwargs):
+        return validator(request, *args, **kwargs) if is_timestamp else None
+
+    def decorator(view_func):
+        wrapped = cache_control(private=True, no_cache=True)(
+            condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+        )
+        if not iscoroutinefunction(view_func):
+            return wrapped
+
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            # condition() calls the validator from the event loop, where
+            # the ORM cannot run: compute it beforehand in a thread
+            await sync_to_async(validator)(request, *args, **kwargs)
+            return await wrapped(request, *args, **kwargs)
+        return async_wrapper
+    return decorator
+
+
+def conditional_on(validator_func):
+    """Conditional GET from a timestamp ``validator_func(request, *args, **kwargs)``"""
+    return _conditional(validator_func, is_timestamp=True)
+
+
+def conditional_on_versions(*names):
+    """Conditional GET from cache version counters (ETag only)
+
+    The date is part of the validator because list pages show counts for
+    the current month.
+    """
+    def validator(request, *args, **kwargs):
+        versions = request_versions(request, *names)
+        return ':'.join([str(timezone.localdate())] + [str(versions[name]) for name in names])
+    return _conditional(validator, is_timestamp=False)
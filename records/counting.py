@@ -0,0 +1,123 @@
+"""
+Approximate row counts for large tables
+
+Exact ``COUNT(*)`` / ``COUNT(DISTINCT ...)`` queries scan the whole table or
+index. Once a table holds more than ``ESTIMATED_COUNT_THRESHOLD`` rows (as
+reported by the database's own statistics), counts switch to cheap
+approximations:
+
+- an unfiltered queryset uses the table statistics directly
+  (``information_schema.TABLES`` on MySQL, ``pg_class`` on PostgreSQL,
+  ``sqlite_stat1`` on SQLite after ``ANALYZE``);
+- a filtered or distinct queryset is counted up to the threshold only and
+  reported as "at least" that many.
+
+Below the threshold, or when no statistics are available, counts are exact.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+DEFAULT_THRESHOLD = 100_000
+
+
+def get_threshold():
+    return getattr(settings, 'ESTIMATED_COUNT_THRESHOLD', DEFAULT_THRESHOLD)
+
+
+class ApproximateCount(int):
+    """An int that remembers whether it is an estimate or a lower bound"""
+
+    def __new__(cls, value, is_estimate=False, is_lower_bound=False):
+        count = super().__new__(cls, value)
+        count.is_estimate = is_estimate
+        count.is_lower_bound = is_lower_bound
+        return count
+
+    def __str__(self):
+        return self.display
+
+    @property
+    def display(self):
+        """Text for templates; ``{{ count }}`` alone is localized as a plain int"""
+        if self.is_lower_bound:
+            return f'{int(self):,}+'
+        if self.is_estimate:
+            return f'~{int(self):,}'
+        return str(int(self))
+
+
+def estimated_table_rows(model, using='default'):
+    """Row count from the database's table statistics, or None if unavailable"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = ('SELECT TABLE_ROWS FROM information_schema.TABLES '
+               'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s')
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+    elif connection.vendor == 'sqlite':
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # e.g. sqlite_stat1 does not exist until ANALYZE has run
+        return None
+    if not row or row[0] is None:
+        return None
+    # sqlite_stat1.stat is "<rows> <rows per key> ..."
+    rows = int(str(row[0]).split()[0])
+    return rows if rows >= 0 else None
+
+
+def _is_plain_table_query(queryset):
+    query = queryset.query
+    # The default manager's own filter (deleted patients awaiting their
+    # purge) leaves practically the whole table
+    manager_where = queryset.model._default_manager.all().query.where
+    return (
+        (not query.where or query.where == manager_where)
+        and not query.distinct
+        and not query.combinator
+        and query.low_mark == 0
+        and query.high_mark is None
+        and not query.group_by
+    )
+
+
+def approximate_count(queryset, threshold=None):
+    """Count ``queryset``, approximating once its table is large"""
+    if threshold is None:
+        threshold = get_threshold()
+    estimate = estimated_table_rows(queryset.model, queryset.db)
+    if estimate is None or estimate < threshold:
+        return ApproximateCount(queryset.count())
+    if _is_plain_table_query(queryset):
+        return ApproximateCount(estimate, is_estimate=True)
+
+    capped = queryset[:threshold].count()
+    return ApproximateCount(capped, is_lower_bound=capped >= threshold)
+
+
+async def aapproximate_count(queryset, threshold=None):
+    """Async ``approximate_count()``; table statistics are read with raw SQL"""
+    return await sync_to_async(approximate_count)(queryset, threshold)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for ModelAdmin changelists on large tables"""
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            return approximate_count(self.object_list)
+        return super().count
@@ -0,0 +1,124 @@
+"""
+Patient deletion
+
+``Patient.delete()`` makes Django's collector load every visit, diagnosis,
+allergy and medication of the patient into memory and delete them all in
+one transaction, locking the tables for seconds on long-term patients.
+The views delete in two steps instead:
+
+1. ``delete_patient()`` sets ``deleted_at``. ``Patient.objects`` excludes
+   the patient from then on, and the list filters skip rows of deleted
+   patients, so the patient disappears at once;
+2. a ``purge_patient`` job deletes the rows, child tables first, in
+   batches of ``PATIENT_PURGE_BATCH_SIZE`` ids with a raw
+   ``DELETE ... WHERE id IN (...)``, each batch in its own short
+   transaction. Progress is reported on the job row. A purge that stops
+   part way resumes with the remaining rows when it is retried.
+
+Hiding a patient takes it and all its rows out of the dashboard counters
+at once, with one count per child table, so the totals agree with the
+lists however long the purge takes. The purge's raw deletes send no
+signals and leave the counters alone. ``purge_deleted_patients`` purges
+without workers.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .autocomplete import patient_index
+from .caching import bump_versions, patient_version_name
+from .jobs import enqueue, job, report_progress
+from .models import (Allergy, Diagnosis, MedicalHistory, Medication, Patient, PatientSearchToken,
+                     PatientSummary)
+from .stats import adjust_counter
+
+
+# (model, lookup to the patient id, dashboard counter), deleted in order
+PURGE_PLAN = [
+    (Diagnosis, 'medical_history__patient_id', 'diagnoses'),
+    (Allergy, 'medical_history__patient_id', 'allergies'),
+    (Medication, 'medical_history__patient_id', 'medications'),
+    (MedicalHistory, 'patient_id', 'medical_histories'),
+    (PatientSearchToken, 'patient_id', None),
+    (PatientSummary, 'patient_id', None),
+]
+
+# Caches showing patients: every list and the patient's own fragments
+PATIENT_PAGES = ('patients', 'allergies', 'diagnoses', 'medications')
+
+
+def delete_patient(patient):
+    """Hide ``patient`` now and queue the purge of its rows"""
+    with transaction.atomic():
+        now = timezone.now()
+        # updated_at too: other processes' autocomplete indexes sync from it
+        if not Patient.objects.filter(pk=patient.pk).update(deleted_at=now, updated_at=now):
+            return
+        adjust_counter('patients', -1)
+        _uncount_rows(patient.pk)
+        enqueue('purge_patient', patient_id=patient.pk)
+
+        pk = patient.pk
+
+        def apply():
+            patient_index.remove(pk)
+            bump_versions(*PATIENT_PAGES, patient_version_name(pk))
+
+        transaction.on_commit(apply)
+
+
+def _uncount_rows(patient_id):
+    """Take a patient's rows out of the dashboard counters"""
+    for model, lookup, counter in PURGE_PLAN:
+        if not counter:
+            continue
+        rows = model._default_manager.filter(**{lookup: patient_id})
+        if model is Medication:
+            counts = rows.aggregate(total=Count('pk'), active=Count('pk', filter=Q(is_active=True)))
+            adjust_counter(counter, -counts['total'])
+            adjust_counter('active_medications', -counts['active'])
+        else:
+            adjust_counter(counter, -rows.count())
+
+
+def _delete_ids(model, ids):
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', ids)
+        return cursor.rowcount
+
+
+def purge_patient(patient_id, batch_size=None, progress=report_progress):
+    """Delete a soft-deleted patient and everything attached, in batches
+
+    ``progress(table=..., deleted=..., total=...)`` is called after every
+    batch. Returns the number of rows deleted, or None if the patient is
+    not awaiting a purge.
+    """
+    batch_size = batch_size or settings.PATIENT_PURGE_BATCH_SIZE
+    if not Patient.all_objects.filter(pk=patient_id, deleted_at__isnull=False).exists():
+        return None
+
+    rows = {model: model._default_manager.filter(**{lookup: patient_id}) for model, lookup, _ in PURGE_PLAN}
+    total = sum(queryset.count() for queryset in rows.values()) + 1
+    deleted = 0
+    for model, _, _ in PURGE_PLAN:
+        while True:
+            batch = list(rows[model].order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            deleted += _delete_ids(model, batch)
+            progress(table=model._meta.db_table, deleted=deleted, total=total)
+
+    deleted += _delete_ids(Patient, [patient_id])
+    progress(table=Patient._meta.db_table, deleted=deleted, total=total)
+    return deleted
+
+
+@job('purge_patient')
+def purge_patient_job(patient_id):
+    purge_patient(patient_id)
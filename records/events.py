@@ -0,0 +1,98 @@
+"""
+In-process event bus for live dashboard updates
+
+Signal handlers publish an event once the change is committed; every open
+dashboard stream in the same process receives it through its own bounded
+queue. The event is encoded as a server-sent event once at publish time, so
+fanning it out to hundreds of dashboards costs a queue put each instead of
+the dashboard's counting queries per browser.
+
+The last ``history`` events are kept so a reconnecting browser can resume
+from its ``Last-Event-ID``. A subscriber that falls more than
+``queue_size`` events behind is disconnected and resumes the same way.
+
+Events only reach streams served by the process that made the change; run
+the ASGI app in one process per dashboard audience, or accept that other
+workers' changes appear on the next page load.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def encode_event(event_id, event_type, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+class Subscription:
+    """One stream's queue of encoded events, filled from any thread"""
+
+    def __init__(self, loop, queue_size):
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The stream's event loop has closed
+            self.overflowed = True
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventBus:
+    def __init__(self, history=200, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history)
+        self._last_id = 0
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            self._last_id += 1
+            message = encode_event(self._last_id, event_type, data)
+            self._history.append((self._last_id, message))
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def subscribe(self, last_event_id=None):
+        """Return (subscription, events since ``last_event_id`` still in history)
+
+        Call from the event loop that will read the subscription's queue.
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            backlog = []
+            if last_event_id is not None:
+                backlog = [message for event_id, message in self._history if event_id > last_event_id]
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def reset(self):
+        with self._lock:
+            self._subscribers.clear()
+            self._history.clear()
+
+
+dashboard_events = EventBus()
@@ -0,0 +1,156 @@
+"""
+Streaming CSV / NDJSON exports of patients and clinical records
+
+Rows are read with ``values_list`` in primary-key chunks (``pk > last`` with
+a LIMIT) rather than one large query. ``QuerySet.iterator()`` does not
+stream on MySQL, whose driver buffers the whole result set, whereas keyset
+chunks keep memory constant on every backend. Each row is encoded and
+yielded as soon as it is read, so a response starts sending bytes
+immediately.
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .filters import (filter_allergies, filter_diagnoses, filter_medical_histories,
+                      filter_medications, filter_patients)
+from .models import Allergy, Diagnosis, MedicalHistory, Medication, Patient
+
+
+DEFAULT_CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+PATIENT_COLUMNS = [
+    ('patient_id', 'patient_id'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('date_of_birth', 'date_of_birth'),
+    ('gender', 'gender'),
+    ('blood_group', 'blood_group'),
+    ('phone', 'phone'),
+    ('email', 'email'),
+    ('address', 'address'),
+    ('emergency_contact_name', 'emergency_contact_name'),
+    ('emergency_contact_phone', 'emergency_contact_phone'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+
+def _record_patient_columns(prefix):
+    """Joined patient columns for rows that hang off a patient"""
+    return [
+        ('patient_id', f'{prefix}patient_id'),
+        ('patient_first_name', f'{prefix}first_name'),
+        ('patient_last_name', f'{prefix}last_name'),
+    ]
+
+
+# Dataset name -> (model, filter function, [(column header, field path)])
+DATASETS = {
+    'patients': (Patient, filter_patients, PATIENT_COLUMNS),
+    'medical-histories': (MedicalHistory, filter_medical_histories, [
+        ('id', 'pk'),
+        *_record_patient_columns('patient__'),
+        ('date_recorded', 'date_recorded'),
+        ('recorded_by', 'recorded_by__username'),
+        ('chief_complaint', 'chief_complaint'),
+        ('vital_signs', 'vital_signs'),
+        ('physical_examination', 'physical_examination'),
+        ('notes', 'notes'),
+    ]),
+    'diagnoses': (Diagnosis, filter_diagnoses, [
+        ('id', 'pk'),
+        ('medical_history_id', 'medical_history_id'),
+        *_record_patient_columns('medical_history__patient__'),
+        ('diagnosis_name', 'diagnosis_name'),
+        ('diagnosis_date', 'diagnosis_date'),
+        ('severity', 'severity'),
+        ('status', 'status'),
+        ('icd_code', 'icd_code'),
+        ('description', 'description'),
+    ]),
+    'allergies': (Allergy, filter_allergies, [
+        ('id', 'pk'),
+        ('medical_history_id', 'medical_history_id'),
+        *_record_patient_columns('medical_history__patient__'),
+        ('allergen', 'allergen'),
+        ('reaction', 'reaction'),
+        ('severity', 'severity'),
+        ('identified_date', 'identified_date'),
+        ('notes', 'notes'),
+    ]),
+    'medications': (Medication, filter_medications, [
+        ('id', 'pk'),
+        ('medical_history_id', 'medical_history_id'),
+        *_record_patient_columns('medical_history__patient__'),
+        ('medication_name', 'medication_name'),
+        ('dosage', 'dosage'),
+        ('frequency', 'frequency'),
+        ('route', 'route'),
+        ('start_date', 'start_date'),
+        ('end_date', 'end_date'),
+        ('is_active', 'is_active'),
+        ('purpose', 'purpose'),
+        ('side_effects', 'side_effects'),
+        ('prescribed_by', 'prescribed_by__username'),
+    ]),
+}
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(dataset, params):
+    """Filtered queryset for ``dataset`` using list view GET parameters"""
+    model, filter_function, _ = DATASETS[dataset]
+    return filter_function(model.objects.all(), params)
+
+
+def iter_rows(queryset, fields, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield value tuples for ``fields`` in primary-key order, one chunk at a time"""
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk.values_list('pk', *fields)[:chunk_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def stream_export(dataset, params, export_format='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield encoded lines (str) of ``dataset`` filtered by ``params``"""
+    if export_format not in FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'")
+    _, _, columns = DATASETS[dataset]
+    headers = [header for header, _ in columns]
+    fields = [field for _, field in columns]
+    rows = iter_rows(export_queryset(dataset, params), fields, chunk_size)
+
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow([_csv_value(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + '\n'
@@ -0,0 +1,108 @@
+"""
+Query filters shared by the custom admin list views and the exports
+
+Each function narrows a queryset by the GET parameters its list view
+accepts, so an export with the same query string returns the same rows.
+Rows of patients that are deleted but not purged yet are always left out.
+"""
+
+from django.db.models import Q
+
+from .search import search_patients
+
+
+def exclude_deleted_patients(queryset, patient='medical_history__patient'):
+    """Leave out rows of patients awaiting their purge (``records.deletion``)"""
+    return queryset.filter(**{f'{patient}__deleted_at__isnull': True})
+
+
+def filter_patients(patients, params):
+    """``q`` (ranked search), ``gender`` and ``blood_group``"""
+    query = params.get('q', '')
+    gender_filter = params.get('gender', '')
+    blood_filter = params.get('blood_group', '')
+    
+    if query:
+        patients = search_patients(query, patients)
+    
+    if gender_filter:
+        patients = patients.filter(gender=gender_filter)
+    
+    if blood_filter:
+        patients = patients.filter(blood_group=blood_filter)
+    
+    return patients
+
+
+def filter_medical_histories(histories, params):
+    """``patient`` (pk)"""
+    patient = params.get('patient', '')
+    histories = exclude_deleted_patients(histories, 'patient')
+    
+    if patient:
+        histories = histories.filter(patient=patient)
+    
+    return histories
+
+
+def filter_allergies(allergies, params):
+    """``q`` and ``severity``"""
+    query = params.get('q', '')
+    severity_filter = params.get('severity', '')
+    allergies = exclude_deleted_patients(allergies)
+    
+    if query:
+        allergies = allergies.filter(
+            Q(allergen__icontains=query) |
+            Q(reaction__icontains=query) |
+            Q(medical_history__patient__first_name__icontains=query) |
+            Q(medical_history__patient__last_name__icontains=query)
+        )
+    
+    if severity_filter:
+        allergies = allergies.filter(severity=severity_filter)
+    
+    return allergies
+
+
+def filter_diagnoses(diagnoses, params):
+    """``q`` and ``severity``"""
+    query = params.get('q', '')
+    severity_filter = params.get('severity', '')
+    diagnoses = exclude_deleted_patients(diagnoses)
+    
+    if query:
+        diagnoses = diagnoses.filter(
+            Q(diagnosis_name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(icd_code__icontains=query) |
+            Q(medical_history__patient__first_name__icontains=query) |
+            Q(medical_history__patient__last_name__icontains=query)
+        )
+    
+    if severity_filter:
+        diagnoses = diagnoses.filter(severity=severity_filter)
+    
+    return diagnoses
+
+
+def filter_medications(medications, params):
+    """``q`` and ``is_active`` ('true' / 'false')"""
+    query = params.get('q', '')
+    active_filter = params.get('is_active', '')
+    medications = exclude_deleted_patients(medications)
+    
+    if query:
+        medications = medications.filter(
+            Q(medication_name__icontains=query) |
+            Q(purpose__icontains=query) |
+            Q(medical_history__patient__first_name__icontains=query) |
+            Q(medical_history__patient__last_name__icontains=query) |
+            Q(prescribed_by__first_name__icontains=query) |
+            Q(prescribed_by__last_name__icontains=query)
+        )
+    
+    if active_filter:
+        medications = medications.filter(is_active=active_filter == 'true')
+    
+    return medications
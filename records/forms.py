@@ -1,7 +1,43 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from django.urls import reverse
 from .models import CustomUser, Patient, MedicalHistory, Diagnosis, Allergy, Medication
 
+
+class PatientTypeaheadWidget(forms.Widget):
+    """Text input that searches patients over AJAX instead of listing them all"""
+    template_name = 'records/widgets/patient_typeahead.html'
+    
+    class Media:
+        js = ('js/patient_typeahead.js',)
+    
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        label = ''
+        if value:
+            patient = Patient.objects.filter(pk=value).values('first_name', 'last_name', 'patient_id').first()
+            if patient:
+                label = f"{patient['first_name']} {patient['last_name']} ({patient['patient_id']})"
+        context['widget']['label'] = label
+        context['widget']['search_url'] = reverse('custom_admin:ajax_patient_search')
+        return context
+
+
+class PatientChoiceField(forms.ModelChoiceField):
+    """Patient picker that only looks up the submitted pk, never the full table"""
+    widget = PatientTypeaheadWidget
+    
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Patient.objects.all(), **kwargs)
+
+
+class PatientPickerForm(forms.Form):
+    patient = PatientChoiceField(required=True)
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['patient'].widget.attrs.update({'class': 'form-control'})
+
 class CustomUserCreationForm(UserCreationForm):
     class Meta:
         model = CustomUser
@@ -61,6 +97,23 @@ class PatientForm(forms.ModelForm):
                 self.fields[field].widget.attrs.update({'class': 'form-control-file'})
 
 
+class PatientImportForm(forms.Form):
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON (one JSON object per line)'),
+    ]
+    
+    file = forms.FileField(help_text="Columns: " + ", ".join(
+        name for name in PatientForm.Meta.fields if name != 'photo'
+    ))
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, initial='csv')
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['file'].widget.attrs.update({'class': 'form-control-file'})
+        self.fields['format'].widget.attrs.update({'class': 'form-control'})
+
+
 class MedicalHistoryForm(forms.ModelForm):
     class Meta:
         model = MedicalHistory
@@ -93,8 +146,7 @@ class DiagnosisForm(forms.ModelForm):
 
 
 class AllergyForm(forms.ModelForm):
-    patient = forms.ModelChoiceField(
-        queryset=Patient.objects.all(),
+    patient = PatientChoiceField(
         required=True,
         help_text="Select the patient for this allergy"
     )
@@ -0,0 +1,176 @@
+"""
+Patient photo and profile picture processing
+
+Uploads used to be served exactly as received, so a 40px list avatar could
+cost a multi-megabyte camera JPEG, EXIF (GPS position, device) included.
+Each upload is queued as a background job (``records.jobs``) and processed
+off the request path:
+
+- the original is rotated upright, stripped of EXIF and capped at
+  ``IMAGE_MAX_DIMENSION`` pixels on its long side, then stored again;
+- square variants are written for each display size in ``VARIANT_SIZES``
+  at 1x and 2x density, as WebP and as a JPEG fallback.
+
+Stored variant names are kept on the row (``photo_variants``,
+``profile_picture_variants``); the ``{% responsive_image %}`` tag renders
+them as a ``<picture>``, or the original until processing has finished.
+``process_images`` backfills uploads made before processing existed.
+"""
+
+import posixpath
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .caching import bump_versions, patient_version_name
+from .jobs import enqueue, job
+from .models import CustomUser, Patient
+
+# Model -> image field processed on upload; variants are stored in
+# ``<field>_variants``
+IMAGE_FIELDS = {
+    Patient: 'photo',
+    CustomUser: 'profile_picture',
+}
+
+# Display box (CSS pixels) -> templates using it
+VARIANT_SIZES = {
+    'small': 40,    # list page avatars
+    'medium': 80,   # delete confirmation
+    'large': 150,   # patient header, patient form, profile pages
+}
+DENSITIES = (1, 2)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+ORIGINAL_JPEG_QUALITY = 90
+
+# List pages showing patient photos, refreshed once variants exist
+PATIENT_PHOTO_PAGES = ('patients', 'diagnoses', 'medications')
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _flatten(image):
+    """RGB copy of ``image``, transparent areas on white"""
+    if not _has_alpha(image):
+        return image.convert('RGB')
+    rgba = image.convert('RGBA')
+    background = Image.new('RGB', rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
+
+
+def _encode(image, image_format, options):
+    buffer = BytesIO()
+    # No exif= argument: nothing from the upload's metadata is written back
+    image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def normalize_original(image):
+    """(image, format, extension) for the stored original: upright, capped, no EXIF"""
+    image = ImageOps.exif_transpose(image)
+    max_dimension = settings.IMAGE_MAX_DIMENSION
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    if _has_alpha(image):
+        return image.convert('RGBA'), 'PNG', 'png'
+    return image.convert('RGB'), 'JPEG', 'jpg'
+
+
+def variant_name(original_name, pixels, extension):
+    directory, filename = posixpath.split(original_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}-{pixels}.{extension}')
+
+
+def render_variants(image, original_name, storage):
+    """Write every variant of ``image``; returns {size: {extension: [name per density]}}"""
+    variants = {}
+    for size, box in VARIANT_SIZES.items():
+        variants[size] = {extension: [] for extension in VARIANT_FORMATS}
+        for density in DENSITIES:
+            pixels = box * density
+            resized = ImageOps.fit(image, (pixels, pixels), Image.Resampling.LANCZOS)
+            for extension, (image_format, options) in VARIANT_FORMATS.items():
+                # WebP keeps transparency; the JPEG fallback cannot
+                frame = resized if image_format == 'WEBP' else _flatten(resized)
+                name = storage.save(
+                    variant_name(original_name, pixels, extension), _encode(frame, image_format, options),
+                )
+                variants[size][extension].append(name)
+    return variants
+
+
+def variant_names(variants):
+    for formats in variants.values():
+        for names in formats.values():
+            yield from names
+
+
+def process_image(model, pk, field_name, stale_variants=None):
+    """Normalise one stored upload and write its variants
+
+    The variants stored for the row, and ``stale_variants`` (those of the
+    upload it replaced), are deleted once the new ones are saved.
+
+    Returns the variants, or None when the row is gone, has no upload, or
+    was given a different upload while this one was processed (the newer
+    upload has its own job).
+    """
+    manager = model._default_manager
+    name, previous_variants = manager.filter(pk=pk).values_list(field_name, variants_field(field_name)).first() or (None, None)
+    if not name:
+        return None
+    storage = model._meta.get_field(field_name).storage
+
+    with storage.open(name) as source:
+        image = Image.open(source)
+        # Lets JPEG decode straight to a reduced scale for large uploads
+        image.draft('RGB', (settings.IMAGE_MAX_DIMENSION, settings.IMAGE_MAX_DIMENSION))
+        image.load()
+    image, image_format, extension = normalize_original(image)
+    options = {'quality': ORIGINAL_JPEG_QUALITY, 'optimize': True} if image_format == 'JPEG' else {'optimize': True}
+    stem = posixpath.splitext(name)[0]
+    original_name = storage.save(f'{stem}.{extension}', _encode(image, image_format, options))
+    variants = render_variants(image, original_name, storage)
+
+    changes = {field_name: original_name, variants_field(field_name): variants}
+    if model is Patient:
+        changes['updated_at'] = timezone.now()
+    # Conditional on the upload still being current; no signals are sent
+    if not manager.filter(pk=pk, **{field_name: name}).update(**changes):
+        for written in [original_name, *variant_names(variants)]:
+            storage.delete(written)
+        return None
+    if original_name != name:
+        storage.delete(name)
+    for stale in (previous_variants or {}, stale_variants or {}):
+        for stale_name in variant_names(stale):
+            storage.delete(stale_name)
+
+    if model is Patient:
+        bump_versions(*PATIENT_PHOTO_PAGES, patient_version_name(pk))
+    return variants
+
+
+@job('process_image')
+def process_image_job(model, pk, field_name, stale_variants=None):
+    process_image(apps.get_model(model), pk, field_name, stale_variants)
+
+
+def schedule_processing(model, pk, field_name, stale_variants=None):
+    """Queue an upload for processing by the background workers"""
+    enqueue('process_image', model=model._meta.label, pk=pk, field_name=field_name, stale_variants=stale_variants)
@@ -0,0 +1,130 @@
+"""
+Bulk patient import
+
+Reads CSV or NDJSON as a stream, validates each row with the same rules as
+``PatientForm``, and inserts valid rows with ``bulk_create`` in chunks, each
+chunk in its own transaction. Rows that fail validation are collected in
+``ImportResult.rejected`` instead of aborting the import.
+
+``bulk_create`` bypasses model signals, so after each chunk the search
+index, dashboard counters and autocomplete index are brought up to date
+explicitly.
+"""
+
+import csv
+import json
+
+from django.db import transaction
+
+from .autocomplete import patient_index
+from .caching import bump_versions
+from .forms import PatientForm
+from .models import Patient
+from .patient_ids import allocate_patient_ids
+from .search import get_search_backend
+from .stats import adjust_counter
+
+
+DEFAULT_CHUNK_SIZE = 1000
+
+FORMATS = ('csv', 'ndjson')
+
+# Columns accepted from the input; anything else is ignored
+IMPORT_FIELDS = [name for name in PatientForm.Meta.fields if name != 'photo']
+
+
+class ImportResult:
+    """Outcome of an import: number of rows created and the rejected rows"""
+
+    def __init__(self):
+        self.created = 0
+        self.rejected = []
+
+    def reject(self, line_number, row, errors):
+        self.rejected.append({'line': line_number, 'row': row, 'errors': errors})
+
+    def write_rejects_csv(self, output):
+        """Write the rejected rows report as CSV to a text stream"""
+        writer = csv.writer(output)
+        writer.writerow(['line', 'errors'] + IMPORT_FIELDS)
+        for reject in self.rejected:
+            errors = '; '.join(
+                f"{field}: {' '.join(messages)}" for field, messages in reject['errors'].items()
+            )
+            writer.writerow(
+                [reject['line'], errors] + [reject['row'].get(name, '') for name in IMPORT_FIELDS]
+            )
+
+
+def parse_rows(stream, import_format):
+    """Yield (line number, row dict) from a CSV or NDJSON text stream"""
+    if import_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif import_format == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                row = {'__error__': f'Invalid JSON: {exc}'}
+            if not isinstance(row, dict):
+                row = {'__error__': 'Expected a JSON object'}
+            yield line_number, row
+    else:
+        raise ValueError(f"Unknown import format '{import_format}'")
+
+
+def validate_row(row):
+    """Return (unsaved Patient, None) or (None, {field: [messages]})"""
+    if '__error__' in row:
+        return None, {'__all__': [row['__error__']]}
+    data = {name: '' if row.get(name) is None else str(row.get(name)).strip() for name in IMPORT_FIELDS}
+    form = PatientForm(data=data)
+    if form.is_valid():
+        return form.instance, None
+    return None, {field: list(messages) for field, messages in form.errors.items()}
+
+
+def _insert_chunk(patients, registered_by):
+    patient_ids = allocate_patient_ids(len(patients))
+    for patient, patient_id in zip(patients, patient_ids):
+        patient.patient_id = patient_id
+        patient.registered_by = registered_by
+
+    with transaction.atomic():
+        Patient.objects.bulk_create(patients)
+        # Some backends (MySQL) do not return primary keys from bulk inserts,
+        # so re-read the new rows for the indexes
+        created = list(Patient.objects.filter(patient_id__in=patient_ids))
+        get_search_backend().index_patients(created)
+        adjust_counter('patients', len(patients))
+        # Other processes' autocomplete indexes sync the rows from updated_at
+        transaction.on_commit(lambda: patient_index.update_many(
+            (patient.pk, patient.first_name, patient.last_name, patient.patient_id) for patient in created
+        ))
+
+
+def import_patients(stream, import_format='csv', chunk_size=DEFAULT_CHUNK_SIZE, registered_by=None):
+    """Import patients from a text stream and return an ImportResult"""
+    result = ImportResult()
+    chunk = []
+    for line_number, row in parse_rows(stream, import_format):
+        patient, errors = validate_row(row)
+        if errors:
+            result.reject(line_number, row, errors)
+            continue
+        chunk.append(patient)
+        if len(chunk) >= chunk_size:
+            _insert_chunk(chunk, registered_by)
+            result.created += len(chunk)
+            chunk = []
+    if chunk:
+        _insert_chunk(chunk, registered_by)
+        result.created += len(chunk)
+    if result.created:
+        transaction.on_commit(lambda: bump_versions('patients'))
+    return result
@@ -0,0 +1,199 @@
+"""
+Per-request query and template instrumentation
+
+``QueryInstrumentationMiddleware`` records, for every request, the number of
+SQL queries, total SQL time, repeated queries and template render time. The
+figures are sent back in a ``Server-Timing`` header (visible in the browser's
+network panel) and kept per URL name in a rolling in-memory summary shown at
+``/management/performance/``. The summary is per process.
+
+Views can declare the most queries they should need with ``@query_budget``.
+Going over budget is logged, or raises ``QueryBudgetExceeded`` when
+``QUERY_BUDGET_STRICT`` is set so that tests fail.
+
+The middleware is disabled unless ``QUERY_INSTRUMENTATION_ENABLED`` is set.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('query_instrumentation', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the most SQL queries a view should run per request"""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+class RequestMetrics:
+    """Queries and render time collected while handling one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper; see ``connection.execute_wrapper``"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        """Queries that repeated an earlier query with the same parameters"""
+        return sum(count - 1 for count in self.statements.values())
+
+    def repeated_sql(self):
+        """SQL text run more than once, with parameters ignored (N+1 suspects)"""
+        by_sql = Counter()
+        for (sql, _), count in self.statements.items():
+            by_sql[sql] += count
+        return [(sql, count) for sql, count in by_sql.most_common() if count > 1]
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries, {self.duplicates} duplicates"',
+            f'tpl;dur={self.template_time * 1000:.1f};desc="Templates"',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+_original_render = Template._render
+
+
+def _timed_render(self, context):
+    metrics = _current.get()
+    if metrics is None or metrics.template_depth:
+        # Nested renders ({% include %}, widgets) count towards the outer one
+        return _original_render(self, context)
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        metrics.template_time += time.perf_counter() - started
+        metrics.template_depth -= 1
+
+
+class QueryStats:
+    """Rolling per-URL-name samples of recent requests"""
+
+    def __init__(self, samples=200):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=samples))
+        self._repeated = defaultdict(Counter)
+        self._budgets = {}
+
+    def record(self, view_name, metrics, total, budget):
+        with self._lock:
+            self._samples[view_name].append(
+                (metrics.queries, metrics.sql_time, metrics.template_time, total, metrics.duplicates)
+            )
+            for sql, count in metrics.repeated_sql()[:5]:
+                self._repeated[view_name][sql] += count
+            if budget is not None:
+                self._budgets[view_name] = budget
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._repeated.clear()
+            self._budgets.clear()
+
+    def summary(self):
+        """One row per URL name, slowest average SQL time first"""
+        with self._lock:
+            items = [(name, list(samples)) for name, samples in self._samples.items()]
+            repeated = {name: counter.most_common(3) for name, counter in self._repeated.items()}
+            budgets = dict(self._budgets)
+
+        rows = []
+        for name, samples in items:
+            queries = sorted(sample[0] for sample in samples)
+            count = len(samples)
+            budget = budgets.get(name)
+            rows.append({
+                'view_name': name,
+                'requests': count,
+                'avg_queries': sum(queries) / count,
+                'p95_queries': queries[min(count - 1, int(count * 0.95))],
+                'max_queries': queries[-1],
+                'avg_sql_ms': sum(sample[1] for sample in samples) / count * 1000,
+                'avg_template_ms': sum(sample[2] for sample in samples) / count * 1000,
+                'avg_total_ms': sum(sample[3] for sample in samples) / count * 1000,
+                'duplicates': sum(sample[4] for sample in samples),
+                'budget': budget,
+                'over_budget': 0 if budget is None else sum(1 for q in queries if q > budget),
+                'repeated_sql': repeated.get(name, []),
+            })
+        rows.sort(key=lambda row: row['avg_sql_ms'], reverse=True)
+        return rows
+
+
+query_stats = QueryStats(getattr(settings, 'QUERY_STATS_SAMPLES', 200))
+
+
+class QueryInstrumentationMiddleware:
+    """Measure SQL and template time per request; see the module docstring"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if Template._render is not _timed_render:
+            Template._render = _timed_render
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total = time.perf_counter() - metrics.started
+        match = request.resolver_match
+        view_name = match.view_name if match else '<unresolved>'
+        budget = getattr(request, '_query_budget', None)
+        query_stats.record(view_name, metrics, total, budget)
+        response['Server-Timing'] = metrics.server_timing(total)
+
+        if budget is not None and metrics.queries > budget:
+            message = f'{view_name} ran {metrics.queries} queries (budget {budget})'
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(view_func, 'query_budget', None)
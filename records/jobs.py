@@ -0,0 +1,242 @@
+"""
+Database-backed background jobs
+
+Slow side work (image processing, rebuilding patient summaries, purging
+deleted patients) is queued as a ``Job`` row instead of being done inside
+the request. The row is inserted in the same transaction as the change
+that needs it, so a job never runs for a change that rolled back and is
+never lost for one that committed.
+
+``manage.py run_workers`` runs a pool of worker processes, each claiming
+due jobs in a loop:
+
+- on databases with ``SELECT ... FOR UPDATE SKIP LOCKED`` (MySQL 8, the
+  production database) workers lock the rows they claim and skip rows
+  locked by others, so they never wait on each other;
+- elsewhere (SQLite) each candidate is claimed with a conditional
+  ``UPDATE ... WHERE status = 'queued'``, which only one worker can win.
+
+A failed attempt is retried after an exponential backoff with jitter, up
+to ``max_attempts``; then the job is marked failed with its traceback.
+Jobs still running after ``JOB_LOCK_TIMEOUT`` seconds are assumed to
+belong to a dead worker and are queued again. ``job_metrics()`` and
+``running_jobs()`` (with progress from ``report_progress()``) feed the
+performance page.
+
+Job functions are registered with ``@job(name)`` in modules imported at
+startup and receive the queued keyword arguments. They manage their own
+transactions, so long jobs can commit in small steps.
+"""
+
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Avg, Count, F, Max, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_current_job = ContextVar('current_job', default=None)
+
+
+def job(name):
+    """Register ``func(**kwargs)`` as the job ``name``"""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, delay=0, max_attempts=None, **kwargs):
+    """Queue job ``name`` with JSON-serialisable ``kwargs``; returns the Job
+
+    With ``JOBS_RUN_INLINE`` the job runs in this process as soon as the
+    current transaction commits.
+    """
+    if name not in _registry:
+        raise ValueError(f"Unknown job '{name}'")
+    queued = Job.objects.create(
+        name=name,
+        kwargs=kwargs,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+    if settings.JOBS_RUN_INLINE:
+        transaction.on_commit(lambda: run_inline(queued.pk))
+    return queued
+
+
+def report_progress(**progress):
+    """Record the running job's progress on its row (a no-op outside a job)
+
+    Also renews the job's lock, so a long job that reports progress is not
+    taken for abandoned after ``JOB_LOCK_TIMEOUT``.
+    """
+    pk = _current_job.get()
+    if pk is not None:
+        Job.objects.filter(pk=pk).update(progress=progress, locked_at=timezone.now())
+
+
+def run_inline(pk):
+    for claimed in claim('inline', pks=[pk]):
+        execute(claimed)
+
+
+def worker_name(number=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{number}'
+
+
+def claim(worker, limit=1, pks=None):
+    """Mark up to ``limit`` due jobs as running by ``worker`` and return them"""
+    now = timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at')
+    if pks is not None:
+        due = due.filter(pk__in=pks)
+    claimed = {
+        'status': 'running', 'locked_by': worker, 'locked_at': now, 'attempts': F('attempts') + 1,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=pks).update(**claimed)
+    else:
+        # No row locks: a job another worker claimed first updates nothing
+        pks = [
+            pk for pk in due.values_list('pk', flat=True)[:limit]
+            if Job.objects.filter(pk=pk, status='queued').update(**claimed)
+        ]
+    return list(Job.objects.filter(pk__in=pks).order_by('run_at'))
+
+
+def retry_delay(attempts):
+    """Seconds to wait after ``attempts`` failed attempts"""
+    delay = min(settings.JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY)
+    # Jitter keeps jobs that failed together from retrying together
+    return random.uniform(delay / 2, delay)
+
+
+def execute(claimed):
+    """Run a claimed job and record the outcome; True if it succeeded
+
+    A job that waited in a worker's batch past ``JOB_LOCK_TIMEOUT`` may
+    have been queued again and claimed by another worker meanwhile. The
+    claim is confirmed, and its lock renewed, with a conditional UPDATE
+    first; a job that is no longer this claim's is not run.
+    """
+    confirmed = Job.objects.filter(
+        pk=claimed.pk, status='running', locked_by=claimed.locked_by, attempts=claimed.attempts,
+    ).update(locked_at=timezone.now())
+    if not confirmed:
+        logger.info('Job %s was taken over by another worker; skipping', claimed)
+        return False
+    started = time.monotonic()
+    token = _current_job.set(claimed.pk)
+    try:
+        func = _registry.get(claimed.name)
+        if func is None:
+            raise LookupError(f"No job registered as '{claimed.name}'")
+        func(**claimed.kwargs)
+    except Exception:
+        now = timezone.now()
+        outcome = {'last_error': traceback.format_exc(), 'duration': time.monotonic() - started,
+                   'locked_by': '', 'locked_at': None}
+        if claimed.attempts < claimed.max_attempts:
+            outcome.update(status='queued', run_at=now + timedelta(seconds=retry_delay(claimed.attempts)))
+            logger.warning('Job %s failed (attempt %s of %s); retrying',
+                           claimed, claimed.attempts, claimed.max_attempts, exc_info=True)
+        else:
+            outcome.update(status='failed', finished_at=now)
+            logger.error('Job %s failed after %s attempts', claimed, claimed.attempts, exc_info=True)
+        Job.objects.filter(pk=claimed.pk).update(**outcome)
+        return False
+    finally:
+        _current_job.reset(token)
+    Job.objects.filter(pk=claimed.pk).update(
+        status='done', finished_at=timezone.now(), duration=time.monotonic() - started,
+        last_error='', locked_by='', locked_at=None,
+    )
+    return True
+
+
+def requeue_stale():
+    """Queue again jobs whose worker stopped without finishing them"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=timezone.now(), last_error='Worker stopped while running the job',
+    )
+    return stale.update(status='queued', locked_by='', locked_at=None, run_at=timezone.now())
+
+
+def delete_finished():
+    """Delete successful jobs older than ``JOB_RETENTION_DAYS``; failed ones are kept"""
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    return Job.objects.filter(status='done', finished_at__lt=cutoff).delete()[0]
+
+
+def work(number=0, burst=False, batch_size=10):
+    """Claim and run jobs until stopped, or with ``burst`` until none are due
+
+    Returns the number of jobs run.
+    """
+    worker = worker_name(number)
+    processed = 0
+    last_maintenance = 0
+    while True:
+        # Jobs are this process's requests: drop broken or expired connections
+        close_old_connections()
+        if time.monotonic() - last_maintenance > 60:
+            requeue_stale()
+            delete_finished()
+            last_maintenance = time.monotonic()
+        claimed = claim(worker, batch_size)
+        for queued in claimed:
+            execute(queued)
+        processed += len(claimed)
+        if not claimed:
+            if burst:
+                return processed
+            time.sleep(settings.JOB_POLL_INTERVAL)
+
+
+def running_jobs():
+    """Jobs being run now, with the progress they reported"""
+    return list(
+        Job.objects.filter(status='running').order_by('locked_at')
+        .values('pk', 'name', 'kwargs', 'progress', 'locked_by', 'locked_at', 'attempts')
+    )
+
+
+def job_metrics():
+    """Per job name: jobs by status, retried jobs, run times and queue wait"""
+    now = timezone.now()
+    rows = list(
+        Job.objects.values('name').annotate(
+            queued=Count('pk', filter=Q(status='queued')),
+            running=Count('pk', filter=Q(status='running')),
+            done=Count('pk', filter=Q(status='done')),
+            failed=Count('pk', filter=Q(status='failed')),
+            retried=Count('pk', filter=Q(attempts__gt=1)),
+            avg_duration=Avg('duration', filter=Q(status='done')),
+            max_duration=Max('duration', filter=Q(status='done')),
+            oldest_due=Min('run_at', filter=Q(status='queued', run_at__lte=now)),
+        ).order_by('name')
+    )
+    for row in rows:
+        oldest_due = row.pop('oldest_due')
+        row['wait'] = (now - oldest_due).total_seconds() if oldest_due else 0
+        row['avg_ms'] = (row.pop('avg_duration') or 0) * 1000
+        row['max_ms'] = (row.pop('max_duration') or 0) * 1000
+    return rows
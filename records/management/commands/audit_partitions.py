@@ -0,0 +1,24 @@
+"""
+Keep the audit log's monthly partitions ahead of time and drop expired ones
+"""
+
+from django.core.management.base import BaseCommand
+
+from records.audit import maintain_partitions
+
+
+class Command(BaseCommand):
+    help = 'Add audit log partitions for the coming months and drop those past the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, help='Months to have partitions for after this one')
+        parser.add_argument('--retention-months', type=int, help='Months of audit events to keep')
+
+    def handle(self, *args, **options):
+        added, dropped = maintain_partitions(options['months_ahead'], options['retention_months'])
+        if isinstance(dropped, int):
+            self.stdout.write(self.style.SUCCESS(f'Not partitioned; deleted {dropped} expired audit events.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Added partitions: {", ".join(added) or "none"}. Dropped partitions: {", ".join(dropped) or "none"}.'
+        ))
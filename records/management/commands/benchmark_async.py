@@ -0,0 +1,70 @@
+"""
+Compare sync views under WSGI with async views under ASGI at high concurrency
+
+Each configuration runs in a child process, because the async views are
+wired into the URLs at startup by ``ASYNC_VIEWS_ENABLED``. Requests go
+through Django's WSGI and ASGI handlers in that process (no web server), so
+the comparison covers the handlers, middleware and views.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from records.benchmarks import load_test
+from records.management.commands.run_benchmarks import BENCHMARK_USERNAME
+from records.models import CustomUser
+
+
+CONFIGURATIONS = [
+    ('sync views, WSGI', 'wsgi', ''),
+    ('async views, ASGI', 'asgi', '1'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Load-test the dashboard, list and search pages: sync under WSGI vs async under ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 500],
+                            help='Concurrent requests (WSGI threads / in-flight ASGI requests)')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per run')
+        parser.add_argument('--handler', choices=['wsgi', 'asgi'], help='Run one configuration and print JSON')
+
+    def handle(self, *args, **options):
+        if options['handler']:
+            user, _ = CustomUser.objects.get_or_create(
+                username=BENCHMARK_USERNAME, defaults={'role': 'admin', 'is_staff': True},
+            )
+            results = {}
+            with override_settings(ALLOWED_HOSTS=['localhost', 'testserver']):
+                for concurrency in options['concurrency']:
+                    results[concurrency] = load_test(user, options['handler'], concurrency, options['requests'])
+            self.stdout.write(json.dumps(results))
+            return
+
+        self.stdout.write(
+            f"{'configuration':<20} {'concurrency':>11} {'requests/s':>11} {'median ms':>10} {'p95 ms':>10} {'errors':>7}"
+        )
+        for label, handler, async_views in CONFIGURATIONS:
+            command = [
+                sys.executable, sys.argv[0], 'benchmark_async', '--handler', handler,
+                '--requests', str(options['requests']),
+                '--concurrency', *[str(concurrency) for concurrency in options['concurrency']],
+            ]
+            child = subprocess.run(
+                command, capture_output=True, text=True,
+                env={**os.environ, 'ASYNC_VIEWS_ENABLED': async_views},
+            )
+            if child.returncode:
+                raise CommandError(f'{label} run failed:\n{child.stderr}')
+            results = json.loads(child.stdout.strip().splitlines()[-1])
+            for concurrency, result in results.items():
+                self.stdout.write(
+                    f"{label:<20} {concurrency:>11} {result['requests_per_second']:>11.1f} "
+                    f"{result['median_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['errors']:>7}"
+                )
@@ -0,0 +1,87 @@
+"""
+Compare per-request database latency with and without the connection pool
+
+Each simulated request does what Django does with CONN_MAX_AGE = 0: connect,
+run a query, close. With the stock MySQL backend that is a new TCP and
+authentication handshake every time; with the pooled backend the connection
+comes from and goes back to the pool.
+"""
+
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+
+from records.backends.pool import pool_stats
+
+
+BACKENDS = [
+    ('direct', 'django.db.backends.mysql'),
+    ('pooled', 'records.backends.mysql_pool'),
+]
+
+
+def simulate_requests(backend, settings_dict, requests, threads, sql):
+    """Run ``requests`` connect/query/close cycles per thread; return latencies in ms"""
+    wrapper_class = load_backend(backend).DatabaseWrapper
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        wrapper = wrapper_class(dict(settings_dict), alias='pool_benchmark')
+        timings = []
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                with wrapper.cursor() as cursor:
+                    cursor.execute(sql)
+                    cursor.fetchall()
+                wrapper.close()
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            wrapper.close()
+        with lock:
+            latencies.extend(timings)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sorted(latencies)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark request database latency with and without connection pooling (MySQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per thread')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent request threads')
+        parser.add_argument('--sql', default='SELECT 1', help='Query run by each request')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'mysql':
+            raise CommandError('The connection pool is only available for MySQL.')
+        settings_dict = dict(connections['default'].settings_dict, CONN_MAX_AGE=0)
+
+        self.stdout.write(f"{'backend':<8} {'median ms':>10} {'p95 ms':>10} {'requests/s':>11}")
+        for name, backend in BACKENDS:
+            started = time.perf_counter()
+            latencies = simulate_requests(
+                backend, settings_dict, options['requests'], options['threads'], options['sql'],
+            )
+            elapsed = time.perf_counter() - started
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(
+                f'{name:<8} {statistics.median(latencies):>10.2f} {p95:>10.2f} {len(latencies) / elapsed:>11.0f}'
+            )
+
+        stats = pool_stats().get('pool_benchmark')
+        if stats:
+            self.stdout.write(
+                f"Pool: {stats['connects']} connections opened for {stats['checkouts']} checkouts, "
+                f"{stats['waits']} waits (avg {stats['avg_wait_ms']:.2f} ms, max {stats['max_wait_ms']:.2f} ms)"
+            )
@@ -0,0 +1,70 @@
+"""
+Compare patient insert throughput with each patient ID allocator
+
+Run against a scratch database: the benchmark inserts real rows, deletes
+them again afterwards and rebuilds the dashboard statistics.
+"""
+
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from records.autocomplete import patient_index
+from records.models import Patient
+from records.patient_ids import ALLOCATORS, get_allocator
+from records.stats import rebuild_statistics
+
+
+def _patient(number):
+    return Patient(
+        first_name='Benchmark', last_name=f'Patient {number}', date_of_birth=date(1980, 1, 1),
+        gender='O', phone='0000000000', address='Benchmark',
+        emergency_contact_name='Benchmark', emergency_contact_phone='0000000000',
+    )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark patient insert throughput for each patient ID allocator'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help='Patients inserted per run')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk_create call')
+        parser.add_argument('--allocator', action='append', choices=sorted(ALLOCATORS),
+                            help='Allocator to benchmark (repeatable; default: all)')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        batch_size = options['batch_size']
+        self.stdout.write(f"{'allocator':<10} {'mode':<6} {'rows/s':>10}")
+        try:
+            for name in options['allocator'] or sorted(ALLOCATORS):
+                allocator = get_allocator(name)
+                self.report(name, 'save', rows, self.run_saves(allocator, rows))
+                self.report(name, 'bulk', rows, self.run_bulk(allocator, rows, batch_size))
+        finally:
+            Patient.objects.filter(first_name='Benchmark', address='Benchmark').delete()
+            rebuild_statistics()
+            patient_index.reset()
+
+    def report(self, name, mode, rows, elapsed):
+        self.stdout.write(f'{name:<10} {mode:<6} {rows / elapsed:>10.0f}')
+
+    def run_saves(self, allocator, rows):
+        """One Patient.save() per row, as the create view does"""
+        started = time.perf_counter()
+        for number in range(rows):
+            patient = _patient(number)
+            patient.patient_id = allocator.allocate(1)[0]
+            patient.save()
+        return time.perf_counter() - started
+
+    def run_bulk(self, allocator, rows, batch_size):
+        """bulk_create in batches with one allocation per batch, as imports do"""
+        started = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            patients = [_patient(number) for number in range(offset, min(offset + batch_size, rows))]
+            for patient, patient_id in zip(patients, allocator.allocate(len(patients))):
+                patient.patient_id = patient_id
+            Patient.objects.bulk_create(patients)
+        return time.perf_counter() - started
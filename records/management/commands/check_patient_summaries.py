@@ -0,0 +1,51 @@
+"""
+Compare stored patient clinical summaries with freshly built ones
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from records.models import Patient, PatientSummary
+from records.summaries import build_summary, refresh_summary
+
+
+class Command(BaseCommand):
+    help = 'Check patient clinical summaries against the records they are built from'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rebuild stale and missing summaries')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Patients checked per query')
+
+    def handle(self, *args, **options):
+        stale = []
+        missing = 0
+        checked = 0
+        last_pk = 0
+        while True:
+            patient_ids = list(
+                Patient.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not patient_ids:
+                break
+            stored = dict(
+                PatientSummary.objects.filter(patient_id__in=patient_ids, stale=False).values_list('patient_id', 'data')
+            )
+            for patient_id in patient_ids:
+                checked += 1
+                if patient_id not in stored:
+                    # Not built yet, or marked stale with its rebuild queued
+                    missing += 1
+                elif stored[patient_id] != build_summary(patient_id):
+                    stale.append(patient_id)
+                    self.stdout.write(self.style.WARNING(f'Stale summary for patient {patient_id}'))
+                else:
+                    continue
+                if options['fix']:
+                    refresh_summary(patient_id)
+            last_pk = patient_ids[-1]
+
+        self.stdout.write(f'Checked {checked} patients: {len(stale)} stale, {missing} waiting to be built.')
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(stale) + missing} summaries.'))
+        elif stale:
+            raise CommandError(f'{len(stale)} stale summaries; rerun with --fix to rebuild them.')
@@ -0,0 +1,74 @@
+"""
+Remove content-addressed media blobs that no file field references
+"""
+
+import os
+import time
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from records.backends.storage import ContentAddressedStorage
+from records.images import IMAGE_FIELDS, variant_names, variants_field
+
+
+def referenced_names():
+    """Every stored name in a file field or an image variants field
+
+    Rows are read through ``_base_manager``: a default manager may hide rows
+    that still exist, such as soft-deleted patients awaiting their purge.
+    """
+    names = set()
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                names.update(
+                    model._base_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                    .values_list(field.name, flat=True).iterator()
+                )
+    for model, field_name in IMAGE_FIELDS.items():
+        rows = model._base_manager.exclude(**{variants_field(field_name): {}})
+        for variants in rows.values_list(variants_field(field_name), flat=True).iterator():
+            names.update(variant_names(variants))
+    return names
+
+
+class Command(BaseCommand):
+    help = 'Delete media blobs no longer referenced by any upload or image variant'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Hours a blob must be unmodified before it is deleted; protects '
+                                 'uploads whose rows are not committed yet')
+        parser.add_argument('--dry-run', action='store_true', help='List blobs without deleting them')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            self.stdout.write('Media storage is not content-addressed; nothing to do.')
+            return
+
+        # Listed before references are read, so a blob stored meanwhile is
+        # either missing from the listing or too young to delete
+        blobs = list(default_storage.blob_names())
+        referenced = referenced_names()
+        cutoff = time.time() - options['min_age'] * 3600
+        deleted = freed = 0
+        for name in blobs:
+            if name in referenced:
+                continue
+            try:
+                stat = os.stat(default_storage.path(name))
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > cutoff:
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.purge(name)
+            deleted += 1
+            freed += stat.st_size
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} blobs ({freed / 1024 / 1024:.1f} MB).'))
@@ -0,0 +1,34 @@
+"""
+Export patients or clinical records as CSV or NDJSON
+"""
+
+from django.core.management.base import BaseCommand
+
+from records.exports import DATASETS, DEFAULT_CHUNK_SIZE, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream an export of patients or clinical records to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', dest='export_format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows read from the database per query')
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help='List view filter, e.g. --filter severity=severe --filter q=peanut')
+
+    def handle(self, *args, **options):
+        params = {}
+        for item in options['filter']:
+            name, _, value = item.partition('=')
+            params[name] = value
+
+        lines = stream_export(options['dataset'], params, options['export_format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
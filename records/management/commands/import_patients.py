@@ -0,0 +1,53 @@
+"""
+Bulk import patients from a CSV or NDJSON file
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from records.imports import DEFAULT_CHUNK_SIZE, FORMATS, import_patients
+from records.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Import patients from CSV or NDJSON, inserting valid rows in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file')
+        parser.add_argument('--format', dest='import_format', choices=FORMATS,
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows inserted per transaction')
+        parser.add_argument('--rejects', help='Write rejected rows with their errors to this CSV file')
+        parser.add_argument('--user', help='Username recorded as registered_by')
+
+    def handle(self, *args, **options):
+        import_format = options['import_format']
+        if not import_format:
+            extension = os.path.splitext(options['path'])[1].lower().lstrip('.')
+            import_format = 'ndjson' if extension in ('ndjson', 'jsonl') else 'csv'
+
+        registered_by = None
+        if options['user']:
+            try:
+                registered_by = CustomUser.objects.get(username=options['user'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        started = time.monotonic()
+        with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+            result = import_patients(stream, import_format, options['chunk_size'], registered_by)
+        elapsed = time.monotonic() - started
+
+        if options['rejects'] and result.rejected:
+            with open(options['rejects'], 'w', newline='', encoding='utf-8') as output:
+                result.write_rejects_csv(output)
+
+        rate = result.created / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} patients in {elapsed:.1f}s ({rate:.0f} rows/s).'
+        ))
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected {len(result.rejected)} rows.'))
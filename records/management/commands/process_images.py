@@ -0,0 +1,33 @@
+"""
+Process patient photos and profile pictures uploaded before variants existed
+"""
+
+from django.core.management.base import BaseCommand
+
+from records.images import IMAGE_FIELDS, process_image, variants_field
+
+
+class Command(BaseCommand):
+    help = 'Normalise uploaded photos and write their thumbnails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Reprocess uploads that already have variants')
+
+    def handle(self, *args, **options):
+        for model, field_name in IMAGE_FIELDS.items():
+            uploads = model._default_manager.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+            if not options['all']:
+                uploads = uploads.filter(**{variants_field(field_name): {}})
+            processed = failed = 0
+            for pk in uploads.order_by('pk').values_list('pk', flat=True).iterator():
+                try:
+                    process_image(model, pk, field_name)
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{model.__name__} {pk}: {exc}')
+                else:
+                    processed += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: processed {processed}, failed {failed}.'
+            ))
@@ -0,0 +1,29 @@
+"""
+Purge deleted patients here instead of in the background workers
+"""
+
+from django.core.management.base import BaseCommand
+
+from records.deletion import purge_patient
+from records.models import Patient
+
+
+class Command(BaseCommand):
+    help = 'Delete the rows of patients marked deleted, in batches, reporting progress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per transaction')
+
+    def handle(self, *args, **options):
+        patient_ids = list(
+            Patient.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at').values_list('pk', flat=True)
+        )
+        for number, patient_id in enumerate(patient_ids, start=1):
+            def progress(table, deleted, total):
+                self.stdout.write(f'\rPatient {patient_id} ({number}/{len(patient_ids)}): '
+                                  f'{deleted}/{total} rows, {table}', ending='')
+                self.stdout.flush()
+
+            purge_patient(patient_id, options['batch_size'], progress)
+            self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'Purged {len(patient_ids)} patients.'))
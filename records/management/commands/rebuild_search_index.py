@@ -0,0 +1,37 @@
+"""
+Rebuild the patient search index from scratch
+"""
+
+from django.core.management.base import BaseCommand
+
+from records.models import Patient, PatientSearchToken
+from records.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient search token index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of patients indexed per batch')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not backend.maintains_index:
+            self.stdout.write(f"The '{backend.name}' backend is maintained by the database; nothing to do.")
+            return
+
+        chunk_size = options['chunk_size']
+        PatientSearchToken.objects.all().delete()
+        indexed = 0
+        chunk = []
+        for patient in Patient.objects.order_by('pk').iterator(chunk_size=chunk_size):
+            chunk.append(patient)
+            if len(chunk) >= chunk_size:
+                backend.index_patients(chunk)
+                indexed += len(chunk)
+                chunk = []
+        if chunk:
+            backend.index_patients(chunk)
+            indexed += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} patients.'))
@@ -0,0 +1,16 @@
+"""
+Recount the dashboard statistics counters from scratch
+"""
+
+from django.core.management.base import BaseCommand
+
+from records.stats import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard statistics counters'
+
+    def handle(self, *args, **options):
+        for name, value in rebuild_statistics().items():
+            self.stdout.write(f'{name}: {value}')
+        self.stdout.write(self.style.SUCCESS('Statistics rebuilt.'))
@@ -0,0 +1,105 @@
+"""
+Seed synthetic data at increasing volumes and benchmark every records URL
+
+Run against a scratch database: synthetic rows are added up to each size and
+left in place, so later runs (or larger sizes) reuse them.
+"""
+
+import json
+import platform
+import subprocess
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from records.benchmarks import compare_reports, run_benchmarks
+from records.models import CustomUser, Patient
+from records.synthetic import SyntheticDataGenerator, synthetic_patient_count
+
+
+BENCHMARK_USERNAME = 'synthetic_benchmark'
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Time every URL in records/urls.py and records/admin_urls.py at several patient volumes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                            help='Synthetic patient volumes to benchmark at')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed requests per URL')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for synthetic data')
+        parser.add_argument('--output', help='JSON report path (default: benchmark-<commit>.json)')
+        parser.add_argument('--compare', help='Earlier JSON report to compare median timings against')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Do not ask before adding synthetic data to the database')
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        if options['interactive']:
+            answer = input(
+                f"This adds up to {sizes[-1]} synthetic patients to the '{connection.settings_dict['NAME']}' "
+                f"database. Type 'yes' to continue: "
+            )
+            if answer != 'yes':
+                raise CommandError('Benchmark cancelled.')
+
+        user, _ = CustomUser.objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={'role': 'admin', 'is_staff': True},
+        )
+        generator = SyntheticDataGenerator(seed=options['seed'])
+        generator.create_users(50)
+
+        commit = _git_commit()
+        report = {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'repeat': options['repeat'],
+            'runs': [],
+        }
+        for size in sizes:
+            existing = synthetic_patient_count()
+            if size > existing:
+                self.stdout.write(f'Seeding {size - existing} patients...')
+                for _ in generator.create_patients(size - existing, start=existing):
+                    pass
+                generator.finish()
+
+            self.stdout.write(f'Benchmarking at {size} patients...')
+            with override_settings(ALLOWED_HOSTS=['localhost']):
+                results = run_benchmarks(user, repeat=options['repeat'])
+            report['runs'].append({'target': size, 'patients': Patient.objects.count(), 'urls': results})
+            for url_name, result in results.items():
+                self.stdout.write(
+                    f"  {url_name:<40} {result['status']:>3} {result['median_ms']:>9.1f} ms "
+                    f"{result['queries']:>4} queries"
+                )
+
+        output = options['output'] or f"benchmark-{commit or 'report'}.json"
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Report written to {output}'))
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as handle:
+                baseline = json.load(handle)
+            self.stdout.write(f"Compared with {baseline.get('commit') or options['compare']}:")
+            for size, url_name, before, after, change in compare_reports(baseline, report):
+                style = self.style.WARNING if change > 10 else (lambda text: text)
+                self.stdout.write(style(
+                    f'  {size:>8} {url_name:<40} {before:>9.1f} -> {after:>9.1f} ms ({change:+.0f}%)'
+                ))
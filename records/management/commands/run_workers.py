@@ -0,0 +1,48 @@
+"""
+Run background jobs from the database job queue
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from records.jobs import work
+
+
+class Command(BaseCommand):
+    help = 'Claim and run queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKER_PROCESSES,
+                            help='Worker processes')
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Jobs claimed by a worker at a time')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no jobs are due instead of polling for more')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        try:
+            if processes <= 1:
+                processed = work(0, options['burst'], options['batch_size'])
+            else:
+                # Children open their own connections after setting Django up
+                connections.close_all()
+                with ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup,
+                ) as pool:
+                    futures = [
+                        pool.submit(work, number, options['burst'], options['batch_size'])
+                        for number in range(processes)
+                    ]
+                    processed = sum(future.result() for future in futures)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
+            return
+        self.stdout.write(self.style.SUCCESS(f'Ran {processed} jobs.'))
@@ -0,0 +1,45 @@
+"""
+Generate reproducible synthetic users, patients and clinical records
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from records.synthetic import SyntheticDataGenerator, synthetic_patient_count
+
+
+class Command(BaseCommand):
+    help = 'Seed the database with synthetic patients and clinical records for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000,
+                            help='Synthetic patients the database should hold when done')
+        parser.add_argument('--users', type=int, default=50, help='Synthetic doctors, nurses and admins')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--histories', type=int, default=3, help='Average visits per patient')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Patients inserted per transaction')
+
+    def handle(self, *args, **options):
+        generator = SyntheticDataGenerator(options['seed'], options['histories'], options['batch_size'])
+        generator.create_users(options['users'])
+
+        existing = synthetic_patient_count()
+        missing = max(options['patients'] - existing, 0)
+        if not missing:
+            self.stdout.write(f'Already {existing} synthetic patients; nothing to do.')
+            return
+
+        started = time.monotonic()
+        created = 0
+        for batch in generator.create_patients(missing, start=existing):
+            created += batch
+            self.stdout.write(f'{existing + created}/{options["patients"]} patients', ending='\r')
+            self.stdout.flush()
+        self.stdout.write('')
+        generator.finish()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} patients with their records in {elapsed:.1f}s.'
+        ))
@@ -0,0 +1,24 @@
+"""
+Serving uploaded media
+
+Content-addressed blobs (``records.backends.storage``) never change, so
+they are sent with a year-long ``immutable`` lifetime and browsers stop
+revalidating avatars on every page. Other files are served as before. In
+production, configure the web server the same way for ``MEDIA_URL`` +
+``blobs/``; the cache is ``private`` because photos identify patients.
+"""
+
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+
+from .backends.storage import is_blob_name
+
+
+BLOB_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if response.status_code == 200 and is_blob_name(path):
+        patch_cache_control(response, private=True, max_age=BLOB_MAX_AGE, immutable=True)
+    return response
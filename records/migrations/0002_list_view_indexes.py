@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='allergy',
+            index=models.Index(fields=['-identified_date'], name='allergy_identified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allergy',
+            index=models.Index(fields=['severity', '-identified_date'], name='allergy_severity_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['-diagnosis_date'], name='diagnosis_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['severity', '-diagnosis_date'], name='diagnosis_severity_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalhistory',
+            index=models.Index(fields=['patient', '-date_recorded'], name='history_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['-start_date'], name='medication_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['is_active', '-start_date'], name='medication_active_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-created_at'], name='patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['gender', 'blood_group', '-created_at'], name='patient_gender_blood_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['blood_group', '-created_at'], name='patient_blood_created_idx'),
+        ),
+    ]
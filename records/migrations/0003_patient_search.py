@@ -0,0 +1,69 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FULLTEXT_COLUMNS = 'first_name, last_name, patient_id, email, phone'
+
+
+def add_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(
+        f'ALTER TABLE records_patient ADD FULLTEXT INDEX patient_fulltext_idx ({FULLTEXT_COLUMNS})'
+    )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('ALTER TABLE records_patient DROP INDEX patient_fulltext_idx')
+
+
+def build_token_index(apps, schema_editor):
+    from records.search import get_search_backend, patient_tokens
+
+    if not get_search_backend().maintains_index:
+        return
+    Patient = apps.get_model('records', 'Patient')
+    PatientSearchToken = apps.get_model('records', 'PatientSearchToken')
+    db_alias = schema_editor.connection.alias
+    rows = []
+    for patient in Patient.objects.using(db_alias).iterator(chunk_size=1000):
+        rows.extend(
+            PatientSearchToken(patient_id=patient.pk, token=token, weight=weight)
+            for token, weight in patient_tokens(patient).items()
+        )
+        if len(rows) >= 5000:
+            PatientSearchToken.objects.using(db_alias).bulk_create(rows)
+            rows = []
+    PatientSearchToken.objects.using(db_alias).bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0002_list_view_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=20)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='records.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'patient'], name='search_token_patient_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='patientsearchtoken',
+            constraint=models.UniqueConstraint(fields=('patient', 'token'), name='unique_patient_search_token'),
+        ),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(build_token_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.1 on 2026-10-17 22:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def partition_audit_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    from records.audit import partition_table
+
+    partition_table(schema_editor, settings.AUDIT_PARTITIONS_AHEAD)
+
+
+def remove_partitioning(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('ALTER TABLE records_auditevent REMOVE PARTITIONING')
+    schema_editor.execute('ALTER TABLE records_auditevent DROP PRIMARY KEY, ADD PRIMARY KEY (id)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0010_patient_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('username', models.CharField(max_length=150)),
+                ('action', models.CharField(choices=[('view', 'View'), ('list', 'List'), ('search', 'Search'), ('export', 'Export'), ('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('import', 'Import')], max_length=10)),
+                ('resource', models.CharField(blank=True, help_text='Kind of record acted on', max_length=30)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('patient_id', models.BigIntegerField(blank=True, null=True)),
+                ('path', models.CharField(max_length=255)),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient_id', '-timestamp'], name='audit_patient_time_idx'), models.Index(fields=['user', '-timestamp'], name='audit_user_time_idx'), models.Index(fields=['-timestamp'], name='audit_time_idx')],
+            },
+        ),
+        migrations.RunPython(partition_audit_table, remove_partitioning),
+    ]
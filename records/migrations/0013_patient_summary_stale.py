@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0012_patient_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientsummary',
+            name='stale',
+            field=models.BooleanField(default=False, help_text='Chart changed since ``data`` was built'),
+        ),
+    ]
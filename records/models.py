@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
-import uuid
+from django.utils import timezone
 
 class CustomUser(AbstractUser):
     ROLE_CHOICES = [
@@ -15,11 +15,19 @@ class CustomUser(AbstractUser):
     specialization = models.CharField(max_length=100, blank=True, help_text="Medical specialization (for doctors)")
     license_number = models.CharField(max_length=50, blank=True, unique=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Resized copies written by records.images once the upload is processed
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"{self.get_full_name()} ({self.get_role_display()})"
 
 
+class PatientManager(models.Manager):
+    """Patients that have not been deleted"""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Patient(models.Model):
     GENDER_CHOICES = [
         ('M', 'Male'),
@@ -46,13 +54,22 @@ class Patient(models.Model):
     emergency_contact_name = models.CharField(max_length=100)
     emergency_contact_phone = models.CharField(max_length=15)
     photo = models.ImageField(upload_to='patient_photos/', blank=True, null=True)
+    # Resized copies written by records.images once the upload is processed
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     registered_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='registered_patients')
+    # Set by records.deletion.delete_patient; the rows are purged in the background
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    objects = PatientManager()
+    all_objects = models.Manager()
     
     def save(self, *args, **kwargs):
         if not self.patient_id:
-            self.patient_id = f"PAT{uuid.uuid4().hex[:8].upper()}"
+            # Imported here because the allocator module imports IdSequence
+            from .patient_ids import allocate_patient_id
+            self.patient_id = allocate_patient_id()
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -60,6 +77,14 @@ class Patient(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Patient list: default ordering, and gender / blood group filters
+            models.Index(fields=['-created_at'], name='patient_created_idx'),
+            models.Index(fields=['gender', 'blood_group', '-created_at'], name='patient_gender_blood_idx'),
+            models.Index(fields=['blood_group', '-created_at'], name='patient_blood_created_idx'),
+            # Autocomplete: patients changed since a process last synced
+            models.Index(fields=['updated_at'], name='patient_updated_idx'),
+        ]
 
 
 class MedicalHistory(models.Model):
@@ -77,6 +102,9 @@ class MedicalHistory(models.Model):
     class Meta:
         ordering = ['-date_recorded']
         verbose_name_plural = "Medical Histories"
+        indexes = [
+            models.Index(fields=['patient', '-date_recorded'], name='history_patient_date_idx'),
+        ]
 
 
 class Diagnosis(models.Model):
@@ -101,6 +129,11 @@ class Diagnosis(models.Model):
     class Meta:
         verbose_name_plural = "Diagnoses"
         ordering = ['-diagnosis_date']
+        indexes = [
+            # Diagnosis list: default ordering, severity filter, this-month range
+            models.Index(fields=['-diagnosis_date'], name='diagnosis_date_idx'),
+            models.Index(fields=['severity', '-diagnosis_date'], name='diagnosis_severity_date_idx'),
+        ]
 
 
 class Allergy(models.Model):
@@ -124,6 +157,11 @@ class Allergy(models.Model):
     class Meta:
         verbose_name_plural = "Allergies"
         ordering = ['-identified_date']
+        indexes = [
+            # Allergy list / dashboard: default ordering and severity filter
+            models.Index(fields=['-identified_date'], name='allergy_identified_idx'),
+            models.Index(fields=['severity', '-identified_date'], name='allergy_severity_date_idx'),
+        ]
 
 
 class Medication(models.Model):
@@ -144,3 +182,134 @@ class Medication(models.Model):
     
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # Medication list: default ordering and is_active filter
+            models.Index(fields=['-start_date'], name='medication_start_idx'),
+            models.Index(fields=['is_active', '-start_date'], name='medication_active_start_idx'),
+        ]
+
+
+class PatientSearchToken(models.Model):
+    """Inverted index row used by the token patient search backend"""
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=20)
+    weight = models.PositiveSmallIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.token} -> {self.patient_id}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'token'], name='unique_patient_search_token'),
+        ]
+        indexes = [
+            models.Index(fields=['token', 'patient'], name='search_token_patient_idx'),
+        ]
+
+
+class CacheVersion(models.Model):
+    """Shared version counter used to invalidate per-process caches"""
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class StatCounter(models.Model):
+    """Running row count maintained by signals for the dashboards"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class IdSequence(models.Model):
+    """Counter row from which workers lease blocks of sequential IDs"""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+class PatientSummary(models.Model):
+    """Denormalized clinical summary read when a patient's chart is opened"""
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    data = models.JSONField(default=dict)
+    stale = models.BooleanField(default=False, help_text="Chart changed since ``data`` was built")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Summary for {self.patient_id}"
+
+
+class Job(models.Model):
+    """Deferred work claimed and run by ``manage.py run_workers``"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    duration = models.FloatField(null=True, blank=True, help_text="Seconds taken by the last attempt")
+    progress = models.JSONField(default=dict, blank=True, help_text="Reported by the job while it runs")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+    
+    class Meta:
+        indexes = [
+            # Claiming: queued jobs that are due, oldest first
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+
+class AuditEvent(models.Model):
+    """Who read or changed patient data; written in batches by records.audit"""
+    ACTION_CHOICES = [
+        ('view', 'View'),
+        ('list', 'List'),
+        ('search', 'Search'),
+        ('export', 'Export'),
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+        ('import', 'Import'),
+    ]
+    
+    timestamp = models.DateTimeField(default=timezone.now)
+    # No foreign keys: the log outlives purged patients and deleted users,
+    # and MySQL does not allow them on the partitioned table
+    user = models.ForeignKey(CustomUser, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                             null=True, related_name='+')
+    username = models.CharField(max_length=150)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    resource = models.CharField(max_length=30, blank=True, help_text="Kind of record acted on")
+    object_id = models.BigIntegerField(null=True, blank=True)
+    patient_id = models.BigIntegerField(null=True, blank=True)
+    path = models.CharField(max_length=255)
+    
+    def __str__(self):
+        return f"{self.timestamp:%Y-%m-%d %H:%M:%S} {self.username} {self.action} {self.resource} {self.object_id}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient_id', '-timestamp'], name='audit_patient_time_idx'),
+            models.Index(fields=['user', '-timestamp'], name='audit_user_time_idx'),
+            models.Index(fields=['-timestamp'], name='audit_time_idx'),
+        ]
@@ -0,0 +1,209 @@
+"""
+Keyset (cursor) pagination for the custom admin list views
+
+``django.core.paginator.Paginator`` counts the whole filtered set and pages
+with ``OFFSET``, so deep pages get linearly slower. ``KeysetPaginator``
+instead filters on the ordering values of the last row seen, which the list
+view indexes can serve directly: every page costs the same as the first and
+no ``COUNT(*)`` is issued.
+
+Cursors are opaque URL-safe strings. The ordering must end with a unique
+field (normally ``-pk``) and its fields must not be NULL.
+"""
+
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldError, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import FloatField, Q
+
+
+FIRST = 'first'
+LAST = 'last'
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keep full microsecond precision, which DjangoJSONEncoder truncates"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, values), or (None, None) for a missing or bad cursor"""
+    if not cursor:
+        return None, None
+    if cursor in (FIRST, LAST):
+        return cursor, None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None, None
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        return None, None
+    return direction, values
+
+
+class KeysetPage:
+    """One page of results; iterates like ``django.core.paginator.Page``"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return encode_cursor('next', self.paginator.cursor_values(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return encode_cursor('prev', self.paginator.cursor_values(self.object_list[0]))
+
+    @property
+    def first_cursor(self):
+        return FIRST
+
+    @property
+    def last_cursor(self):
+        return LAST
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` by ``ordering`` without OFFSET or COUNT"""
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+
+    def _fields(self, reverse=False):
+        """[(field name, descending)] for the requested direction"""
+        fields = []
+        for field in self.ordering:
+            descending = field.startswith('-')
+            fields.append((field.lstrip('-'), descending != reverse))
+        return fields
+
+    def cursor_values(self, obj):
+        values = []
+        for name, _ in self._fields():
+            value = obj
+            for part in name.split('__'):
+                value = getattr(value, part)
+            values.append(value)
+        return values
+
+    def _field(self, name):
+        """Model field or annotation output field behind an ordering name"""
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            try:
+                return annotation.output_field
+            except FieldError:
+                # e.g. a RawSQL relevance score without a declared type
+                return FloatField()
+        model = self.queryset.model
+        *path, last = name.split('__')
+        for part in path:
+            model = model._meta.get_field(part).related_model
+        return model._meta.pk if last == 'pk' else model._meta.get_field(last)
+
+    def clean_values(self, values):
+        """Cursor values converted to the ordering fields' types, or None if any is invalid
+
+        Cursors come from the URL, so they may have been edited by hand.
+        """
+        if len(values) != len(self.ordering):
+            return None
+        cleaned = []
+        for (name, _), value in zip(self._fields(), values):
+            if value is None or isinstance(value, (dict, list)):
+                return None
+            try:
+                cleaned.append(self._field(name).to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                return None
+        return cleaned
+
+    def _after(self, values, reverse):
+        """Q matching rows strictly after ``values`` in the scan order"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self._fields(reverse), values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _order_by(self, reverse):
+        return [f"{'-' if descending else ''}{name}" for name, descending in self._fields(reverse)]
+
+    def _page_query(self, cursor):
+        """(queryset of up to per_page + 1 rows, direction, reverse) for ``cursor``"""
+        direction, values = decode_cursor(cursor)
+        if values is not None:
+            values = self.clean_values(values)
+            if values is None:
+                direction = None
+
+        reverse = direction in ('prev', LAST)
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+        return queryset[:self.per_page + 1], direction, reverse
+
+    def _page(self, rows, direction, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            has_next = direction == 'prev'
+            has_previous = has_more
+        else:
+            has_next = has_more
+            has_previous = direction == 'next'
+        return KeysetPage(rows, self, has_next, has_previous)
+
+    def get_page(self, cursor=None):
+        queryset, direction, reverse = self._page_query(cursor)
+        return self._page(list(queryset), direction, reverse)
+
+    async def aget_page(self, cursor=None):
+        queryset, direction, reverse = self._page_query(cursor)
+        return self._page([row async for row in queryset], direction, reverse)
@@ -0,0 +1,127 @@
+"""
+Patient ID allocation
+
+The original scheme, ``PAT`` plus 8 random hex digits, has only 32 bits of
+randomness on a unique column: collisions surface as IntegrityError in the
+middle of a request, and random keys scatter inserts across the unique
+index. The ``sequence`` allocator instead hands out zero-padded sequential
+IDs (``PAT000000001``) that always land at the right edge of the index.
+
+Each process leases a block of ``PATIENT_ID_BLOCK_SIZE`` numbers from the
+``IdSequence`` counter row with a single UPDATE and serves IDs from that
+block in memory, so the counter row is touched once per block rather than
+once per patient. IDs are unique across processes and increase within each
+block; unused numbers in a block are skipped when a process exits.
+
+New IDs are one digit longer than the legacy 8-hex-digit IDs, so the two
+schemes can never produce the same value.
+"""
+
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import IdSequence
+
+
+SEQUENCE_NAME = 'patient_id'
+PREFIX = 'PAT'
+DIGITS = 9
+DEFAULT_BLOCK_SIZE = 100
+
+
+def format_patient_id(number):
+    return f"{PREFIX}{number:0{DIGITS}d}"
+
+
+def lease(name, size):
+    """Reserve ``size`` consecutive numbers from a sequence; return the first"""
+    with transaction.atomic():
+        updated = IdSequence.objects.filter(name=name).update(next_value=F('next_value') + size)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    IdSequence.objects.create(name=name)
+            except IntegrityError:
+                # Created by another process in the meantime
+                pass
+            IdSequence.objects.filter(name=name).update(next_value=F('next_value') + size)
+        end = IdSequence.objects.filter(name=name).values_list('next_value', flat=True).get()
+    return end - size
+
+
+class UUIDAllocator:
+    """Random IDs, the original scheme; kept for comparison"""
+
+    def allocate(self, count=1):
+        return [f"{PREFIX}{uuid.uuid4().hex[:8].upper()}" for _ in range(count)]
+
+
+class BlockSequenceAllocator:
+    """Sequential IDs served from blocks leased from an ``IdSequence`` row"""
+
+    def __init__(self, block_size=None, name=SEQUENCE_NAME):
+        self.name = name
+        self.block_size = block_size or getattr(settings, 'PATIENT_ID_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = os.getpid()
+
+    def allocate(self, count=1):
+        """Return ``count`` new patient IDs"""
+        if connection.in_atomic_block:
+            # A lease taken inside the caller's transaction is undone if that
+            # transaction rolls back, so it must not outlive it: reserve
+            # exactly what is needed instead of a block
+            start = lease(self.name, count)
+            return [format_patient_id(number) for number in range(start, start + count)]
+
+        numbers = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # A block leased before fork() would be shared with the parent
+                self._next = self._end = 0
+                self._pid = os.getpid()
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(numbers))
+                    self._next = lease(self.name, size)
+                    self._end = self._next + size
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+        return [format_patient_id(number) for number in numbers]
+
+
+ALLOCATORS = {
+    'sequence': BlockSequenceAllocator,
+    'uuid': UUIDAllocator,
+}
+
+_allocators = {}
+
+
+def get_allocator(name=None):
+    """Return the configured allocator; one instance is kept per process"""
+    if name is None:
+        name = getattr(settings, 'PATIENT_ID_ALLOCATOR', 'sequence')
+    if name not in _allocators:
+        try:
+            _allocators[name] = ALLOCATORS[name]()
+        except KeyError:
+            raise ValueError(f"Unknown PATIENT_ID_ALLOCATOR '{name}'") from None
+    return _allocators[name]
+
+
+def allocate_patient_id():
+    return get_allocator().allocate(1)[0]
+
+
+def allocate_patient_ids(count):
+    """Allocate ``count`` patient IDs at once for bulk inserts"""
+    return get_allocator().allocate(count)
@@ -0,0 +1,194 @@
+"""
+Read-replica routing
+
+Views decorated with ``@use_replica`` read from one of the databases listed
+in ``REPLICA_DATABASES``; everything else, and every write, uses
+``default``. A request sticks to ``default`` for its remaining reads once it
+has written, and ``ReplicaPinMiddleware`` then sets a short-lived cookie so
+the same browser keeps reading from ``default`` for ``pin_seconds()``
+(read-your-writes while replication catches up). A replica counted as
+healthy may be up to ``REPLICA_MAX_LAG`` seconds behind when checked and
+is not checked again for ``REPLICA_LAG_CHECK_INTERVAL`` seconds, so the pin
+lasts at least as long as both together, whatever ``REPLICA_PIN_SECONDS``
+says.
+
+Replicas whose replication lag exceeds ``REPLICA_MAX_LAG`` seconds, or
+whose status cannot be read, are skipped; with no healthy replica reads go
+to ``default``. Lag is checked at most every ``REPLICA_LAG_CHECK_INTERVAL``
+seconds per process.
+
+Under test, replicas mirror ``default`` (``TEST['MIRROR']``), so the test
+database stands in for every replica.
+"""
+
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+PIN_COOKIE = 'db_primary_pin'
+
+_state = ContextVar('replica_routing', default=None)
+_health = {}
+_health_lock = threading.Lock()
+
+
+class RoutingState:
+    """Routing decisions for one request"""
+
+    def __init__(self):
+        self.use_replica = False
+        self.replica = None
+        self.wrote = False
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def pin_seconds():
+    """Seconds a browser that wrote keeps reading from the primary"""
+    stale_for = getattr(settings, 'REPLICA_MAX_LAG', 10.0) + getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5.0)
+    return max(getattr(settings, 'REPLICA_PIN_SECONDS', 0), math.ceil(stale_for))
+
+
+def replica_lag(alias):
+    """Replication lag of a replica in seconds, or None if unknown"""
+    connection = connections[alias]
+    if connection.vendor != 'mysql':
+        # Test stand-ins mirror the primary
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW REPLICA STATUS')
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description or []]
+    except DatabaseError:
+        return None
+    if not row:
+        return None
+    status = dict(zip(columns, row))
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return None if lag is None else float(lag)
+
+
+def is_healthy(alias):
+    interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5.0)
+    now = time.monotonic()
+    with _health_lock:
+        checked = _health.get(alias)
+    if checked and now - checked[0] < interval:
+        return checked[1]
+
+    lag = replica_lag(alias)
+    healthy = lag is not None and lag <= getattr(settings, 'REPLICA_MAX_LAG', 10.0)
+    with _health_lock:
+        _health[alias] = (now, healthy)
+    return healthy
+
+
+def choose_replica():
+    """A healthy replica alias, or None to read from the primary"""
+    healthy = [alias for alias in replica_aliases() if is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+def reset_health():
+    with _health_lock:
+        _health.clear()
+
+
+class ReplicaRouter:
+    """Send reads from ``@use_replica`` views to a replica; see the module docstring"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.wrote:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a write transaction must see its changes
+            return None
+        if state.replica is None:
+            state.replica = choose_replica() or DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Explicit, so objects read from a replica are saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
+
+
+def use_replica(view_func):
+    """Serve a read-only view's queries from a replica when possible"""
+    @contextmanager
+    def routing(request):
+        state = _state.get()
+        token = None
+        if state is None:
+            state = RoutingState()
+            token = _state.set(state)
+        state.use_replica = request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES
+        try:
+            yield
+        finally:
+            state.use_replica = False
+            if token is not None:
+                _state.reset(token)
+
+    if iscoroutinefunction(view_func):
+        # The async ORM runs queries in a worker thread that inherits
+        # this context, so the router sees the same state
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            with routing(request):
+                return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with routing(request):
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaPinMiddleware:
+    """Keep a browser on the primary for a short while after it writes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and replica_aliases():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=pin_seconds(),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,195 @@
+"""
+Patient search backends
+
+Replaces chained ``icontains`` OR queries (leading-wildcard LIKE scans) with
+an index-backed search. Two backends are provided:
+
+- ``FullTextSearchBackend`` uses MySQL's FULLTEXT index on the patient table.
+- ``TokenSearchBackend`` keeps its own inverted index of word prefixes in
+  ``PatientSearchToken`` and works on SQLite and every other database.
+
+The backend is chosen with ``PATIENT_SEARCH_BACKEND`` ('auto', 'fulltext'
+or 'token'); 'auto' picks FULLTEXT on MySQL and the token index elsewhere.
+"""
+
+import operator
+import re
+from functools import reduce
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Patient, PatientSearchToken
+
+
+MIN_TOKEN_LENGTH = 2
+
+# Patient fields that are searchable, with the weight a match on each adds
+# to a patient's rank
+SEARCH_FIELD_WEIGHTS = {
+    'first_name': 3,
+    'last_name': 3,
+    'patient_id': 3,
+    'email': 1,
+    'phone': 1,
+}
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase words"""
+    return _WORD_RE.findall((text or '').lower())
+
+
+def query_terms(query):
+    """Normalise a search string into the terms looked up in the index"""
+    max_length = PatientSearchToken._meta.get_field('token').max_length
+    terms = {word[:max_length] for word in tokenize(query) if len(word) >= MIN_TOKEN_LENGTH}
+    return sorted(terms)
+
+
+def patient_tokens(patient):
+    """Build the {token: weight} map for a patient.
+
+    Every word is indexed by each of its prefixes (edge n-grams) so a prefix
+    search is a plain equality lookup on the token column.
+    """
+    max_length = PatientSearchToken._meta.get_field('token').max_length
+    tokens = {}
+    for field, weight in SEARCH_FIELD_WEIGHTS.items():
+        for word in tokenize(getattr(patient, field)):
+            for end in range(MIN_TOKEN_LENGTH, min(len(word), max_length) + 1):
+                token = word[:end]
+                tokens[token] = tokens.get(token, 0) + weight
+            # Whole-word matches count double
+            if MIN_TOKEN_LENGTH <= len(word) <= max_length:
+                tokens[word] += weight
+    return tokens
+
+
+class TokenSearchBackend:
+    """Inverted token index maintained by the application"""
+
+    name = 'token'
+    maintains_index = True
+
+    def index_patients(self, patients):
+        """(Re)build the index rows for the given patients"""
+        patients = list(patients)
+        rows = [
+            PatientSearchToken(patient_id=patient.pk, token=token, weight=weight)
+            for patient in patients
+            for token, weight in patient_tokens(patient).items()
+        ]
+        with transaction.atomic():
+            PatientSearchToken.objects.filter(patient__in=[p.pk for p in patients]).delete()
+            PatientSearchToken.objects.bulk_create(rows, batch_size=1000)
+
+    def index_patient(self, patient):
+        self.index_patients([patient])
+
+    def search(self, query, queryset=None):
+        """Return patients matching every term of the query, best match first"""
+        if queryset is None:
+            queryset = Patient.objects.all()
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+
+        matches = (
+            PatientSearchToken.objects
+            .filter(token__in=terms)
+            .values('patient_id')
+            .annotate(matched_terms=Count('token'), score=Sum('weight'))
+            .filter(matched_terms=len(terms))
+        )
+        rank = matches.filter(patient_id=OuterRef('pk')).values('score')
+        return (
+            queryset
+            .filter(pk__in=matches.values('patient_id'))
+            .annotate(search_rank=Subquery(rank))
+            .order_by('-search_rank', '-created_at')
+        )
+
+
+class FullTextSearchBackend:
+    """MySQL FULLTEXT index in boolean mode with prefix matching
+
+    InnoDB does not index words shorter than ``innodb_ft_min_token_size``
+    (``FULLTEXT_MIN_TOKEN_SIZE`` here, 3 by default), so a shorter term
+    would never match. Such terms are matched with ``istartswith`` on the
+    searchable columns instead, ranked by the same field weights as the token
+    index, and the FULLTEXT match is only used for the longer terms.
+    """
+
+    name = 'fulltext'
+    maintains_index = False
+
+    # Must match the columns of the FULLTEXT index created by migration 0003
+    columns = ('first_name', 'last_name', 'patient_id', 'email', 'phone')
+
+    def index_patients(self, patients):
+        """MySQL maintains the FULLTEXT index itself"""
+
+    def index_patient(self, patient):
+        """MySQL maintains the FULLTEXT index itself"""
+
+    def search(self, query, queryset=None):
+        if queryset is None:
+            queryset = Patient.objects.all()
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+
+        min_size = getattr(settings, 'FULLTEXT_MIN_TOKEN_SIZE', 3)
+        fulltext_terms = [term for term in terms if len(term) >= min_size]
+        short_terms = [term for term in terms if len(term) < min_size]
+
+        rank = Value(0)
+        if fulltext_terms:
+            boolean_query = ' '.join(f'+{term}*' for term in fulltext_terms)
+            table = Patient._meta.db_table
+            match = 'MATCH ({}) AGAINST (%s IN BOOLEAN MODE)'.format(
+                ', '.join(f'`{table}`.`{column}`' for column in self.columns)
+            )
+            rank = RawSQL(match, (boolean_query,), output_field=FloatField())
+            queryset = queryset.annotate(fulltext_rank=rank).filter(fulltext_rank__gt=0)
+            rank = F('fulltext_rank')
+        for term in short_terms:
+            matches = [Q(**{f'{column}__istartswith': term}) for column in self.columns]
+            queryset = queryset.filter(reduce(operator.or_, matches))
+            for column in self.columns:
+                rank = rank + Case(
+                    When(**{f'{column}__istartswith': term, 'then': Value(SEARCH_FIELD_WEIGHTS[column])}),
+                    default=Value(0),
+                )
+        return (
+            queryset
+            .annotate(search_rank=ExpressionWrapper(rank, output_field=FloatField()))
+            .order_by('-search_rank', '-created_at')
+        )
+
+
+BACKENDS = {
+    TokenSearchBackend.name: TokenSearchBackend,
+    FullTextSearchBackend.name: FullTextSearchBackend,
+}
+
+
+def get_search_backend():
+    """Return the configured patient search backend"""
+    name = getattr(settings, 'PATIENT_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = 'fulltext' if connection.vendor == 'mysql' else 'token'
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown PATIENT_SEARCH_BACKEND '{name}'") from None
+
+
+def search_patients(query, queryset=None):
+    """Search patients by name, patient ID, email or phone"""
+    return get_search_backend().search(query, queryset)
@@ -0,0 +1,276 @@
+"""
+Model signal handlers for the records app
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .autocomplete import patient_index
+from .caching import bump_versions, patient_version_name
+from .events import dashboard_events
+from .images import IMAGE_FIELDS, schedule_processing, variants_field
+from .models import Allergy, CustomUser, Diagnosis, MedicalHistory, Medication, Patient
+from .search import SEARCH_FIELD_WEIGHTS, get_search_backend
+from .stats import adjust_counter
+from .summaries import mark_summary_stale
+
+
+@receiver(post_save, sender=Patient)
+def update_patient_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the patient search index in step with saved patients.
+
+    Index rows are removed with the patient through the cascade on delete.
+    """
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELD_WEIGHTS):
+        return
+    get_search_backend().index_patient(instance)
+
+
+@receiver(post_save, sender=Patient)
+def update_patient_autocomplete(sender, instance, raw=False, **kwargs):
+    """Apply the saved patient to the autocomplete index once committed"""
+    if raw:
+        return
+
+    # Other processes pick the change up by its updated_at (autocomplete.sync)
+    transaction.on_commit(lambda: patient_index.update(instance))
+
+
+@receiver(post_delete, sender=Patient)
+def remove_patient_autocomplete(sender, instance, **kwargs):
+    """Drop the deleted patient from the autocomplete index once committed"""
+    pk = instance.pk
+
+    def apply():
+        patient_index.remove(pk)
+        # A removed row leaves nothing for other processes to sync from
+        patient_index.publish()
+
+    transaction.on_commit(apply)
+
+
+# Dashboard statistics counters
+
+ROW_COUNTERS = {
+    Patient: 'patients',
+    MedicalHistory: 'medical_histories',
+    Allergy: 'allergies',
+    Diagnosis: 'diagnoses',
+    Medication: 'medications',
+}
+
+ROLE_COUNTERS = {
+    'doctor': 'doctors',
+    'nurse': 'nurses',
+}
+
+
+def count_row_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_counter(ROW_COUNTERS[sender], 1)
+
+
+def count_row_deleted(sender, instance, **kwargs):
+    adjust_counter(ROW_COUNTERS[sender], -1)
+
+
+for model in ROW_COUNTERS:
+    post_save.connect(count_row_created, sender=model, dispatch_uid=f'count_created_{model.__name__}')
+    post_delete.connect(count_row_deleted, sender=model, dispatch_uid=f'count_deleted_{model.__name__}')
+
+
+def _remember_previous(instance, field):
+    """Stash the stored value of ``field`` before an update is written"""
+    previous = None
+    if instance.pk:
+        previous = type(instance)._default_manager.filter(pk=instance.pk).values_list(field, flat=True).first()
+    instance._stats_previous = previous
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_previous_role(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'role' not in update_fields):
+        instance._stats_previous = instance.role
+        return
+    _remember_previous(instance, 'role')
+
+
+@receiver(post_save, sender=CustomUser)
+def count_user_role(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    if previous == instance.role:
+        return
+    if previous in ROLE_COUNTERS:
+        adjust_counter(ROLE_COUNTERS[previous], -1)
+    if instance.role in ROLE_COUNTERS:
+        adjust_counter(ROLE_COUNTERS[instance.role], 1)
+
+
+@receiver(post_delete, sender=CustomUser)
+def count_user_role_deleted(sender, instance, **kwargs):
+    if instance.role in ROLE_COUNTERS:
+        adjust_counter(ROLE_COUNTERS[instance.role], -1)
+
+
+@receiver(pre_save, sender=Medication)
+def remember_previous_active(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'is_active' not in update_fields):
+        instance._stats_previous = instance.is_active
+        return
+    _remember_previous(instance, 'is_active')
+
+
+@receiver(post_save, sender=Medication)
+def count_active_medication(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    was_active = bool(getattr(instance, '_stats_previous', None))
+    adjust_counter('active_medications', int(instance.is_active) - int(was_active))
+
+
+@receiver(post_delete, sender=Medication)
+def count_active_medication_deleted(sender, instance, **kwargs):
+    if instance.is_active:
+        adjust_counter('active_medications', -1)
+
+
+# Patient clinical summaries
+
+def _patient_id_for(instance):
+    if isinstance(instance, MedicalHistory):
+        return instance.patient_id
+    if type(instance).medical_history.is_cached(instance):
+        return instance.medical_history.patient_id
+    return MedicalHistory.objects.filter(pk=instance.medical_history_id).values_list('patient_id', flat=True).first()
+
+
+def mark_patient_summary_stale(sender, instance, raw=False, **kwargs):
+    """Queue a rebuild of the owning patient's clinical summary after a chart change"""
+    if raw:
+        return
+    patient_id = _patient_id_for(instance)
+    if patient_id is not None:
+        mark_summary_stale(patient_id)
+
+
+for model in (MedicalHistory, Diagnosis, Allergy, Medication):
+    post_save.connect(mark_patient_summary_stale, sender=model, dispatch_uid=f'summary_saved_{model.__name__}')
+    post_delete.connect(mark_patient_summary_stale, sender=model, dispatch_uid=f'summary_deleted_{model.__name__}')
+
+
+# Live dashboard events: nothing is looked up or published while no
+# dashboard is connected to this process
+
+CRITICAL_ALLERGY_SEVERITIES = ('severe', 'life_threatening')
+
+
+def _publish_on_commit(event_type, data):
+    transaction.on_commit(lambda: dashboard_events.publish(event_type, data))
+
+
+def _patient_name(medical_history_id):
+    names = Patient.objects.filter(medical_histories=medical_history_id).values_list('first_name', 'last_name').first()
+    return ' '.join(names) if names else ''
+
+
+@receiver(post_save, sender=Patient)
+def publish_new_patient(sender, instance, created, raw=False, **kwargs):
+    if not created or raw or not dashboard_events.has_subscribers:
+        return
+    _publish_on_commit('patient', {
+        'patient_id': instance.patient_id,
+        'name': f'{instance.first_name} {instance.last_name}',
+        'gender': instance.get_gender_display(),
+        'blood_group': instance.blood_group,
+        'created_at': instance.created_at,
+    })
+
+
+@receiver(post_save, sender=Allergy)
+def publish_new_allergy(sender, instance, created, raw=False, **kwargs):
+    """Every new allergy moves the counter; severe ones are listed too"""
+    if not created or raw or not dashboard_events.has_subscribers:
+        return
+    data = {'critical': instance.severity in CRITICAL_ALLERGY_SEVERITIES}
+    if data['critical']:
+        data.update(
+            patient=_patient_name(instance.medical_history_id),
+            allergen=instance.allergen,
+            severity=instance.get_severity_display(),
+            identified_date=instance.identified_date,
+        )
+    _publish_on_commit('allergy', data)
+
+
+@receiver(post_save, sender=Diagnosis)
+def publish_new_diagnosis(sender, instance, created, raw=False, **kwargs):
+    if not created or raw or not dashboard_events.has_subscribers:
+        return
+    _publish_on_commit('diagnosis', {
+        'patient': _patient_name(instance.medical_history_id),
+        'diagnosis_name': instance.diagnosis_name,
+        'severity': instance.get_severity_display(),
+        'diagnosis_date': instance.diagnosis_date,
+    })
+
+
+# Fragment and list page caches
+
+# Model -> cache version counters its changes invalidate. Patient names
+# appear on every list page.
+INVALIDATES = {
+    Patient: ('patients', 'allergies', 'diagnoses', 'medications'),
+    Allergy: ('allergies',),
+    Diagnosis: ('diagnoses',),
+    Medication: ('medications',),
+}
+
+
+def invalidate_cached_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    names = list(INVALIDATES[sender])
+    if sender is Patient:
+        names.append(patient_version_name(instance.pk))
+    transaction.on_commit(lambda: bump_versions(*names))
+
+
+for model in INVALIDATES:
+    post_save.connect(invalidate_cached_pages, sender=model, dispatch_uid=f'cache_saved_{model.__name__}')
+    post_delete.connect(invalidate_cached_pages, sender=model, dispatch_uid=f'cache_deleted_{model.__name__}')
+
+
+# Photo and profile picture processing
+
+def reset_image_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Drop the variants of a replaced or cleared upload before it is saved"""
+    field_name = IMAGE_FIELDS[sender]
+    if raw or (update_fields is not None and field_name not in update_fields):
+        return
+    image = getattr(instance, field_name)
+    # A form upload is still uncommitted here (the field stores it after
+    # pre_save); FieldFile.save() stores it first, so compare names then
+    instance._image_uploaded = bool(image) and (
+        not image._committed
+        or image.name != sender._default_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+    )
+    if instance._image_uploaded or not image:
+        instance._stale_variants = getattr(instance, variants_field(field_name))
+        setattr(instance, variants_field(field_name), {})
+
+
+def process_uploaded_image(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, '_image_uploaded', False):
+        return
+    instance._image_uploaded = False
+    schedule_processing(sender, instance.pk, IMAGE_FIELDS[sender], stale_variants=instance._stale_variants)
+
+
+for model in IMAGE_FIELDS:
+    pre_save.connect(reset_image_variants, sender=model, dispatch_uid=f'image_reset_{model.__name__}')
+    post_save.connect(process_uploaded_image, sender=model, dispatch_uid=f'image_process_{model.__name__}')
@@ -0,0 +1,78 @@
+"""
+Dashboard statistics
+
+Row counts shown on the dashboards are kept in ``StatCounter`` rows that
+signal handlers adjust in the same transaction as the change they count.
+Reads go through the cache, so a dashboard load is a single cache hit, or
+one query for all counters when the cache has expired
+(``DASHBOARD_STATS_CACHE_TTL`` seconds).
+
+Soft-deleted patients and their rows are not counted (see
+``records.deletion``). Bulk operations bypass signals; run
+``manage.py rebuild_statistics`` after them to recount from scratch.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .filters import exclude_deleted_patients
+from .models import Allergy, CustomUser, Diagnosis, MedicalHistory, Medication, Patient, StatCounter
+
+
+CACHE_KEY = 'records:dashboard_stats'
+
+# Counter name -> function computing its exact value from scratch
+COUNTERS = {
+    'patients': lambda: Patient.objects.count(),
+    'doctors': lambda: CustomUser.objects.filter(role='doctor').count(),
+    'nurses': lambda: CustomUser.objects.filter(role='nurse').count(),
+    'medical_histories': lambda: exclude_deleted_patients(MedicalHistory.objects, 'patient').count(),
+    'allergies': lambda: exclude_deleted_patients(Allergy.objects).count(),
+    'diagnoses': lambda: exclude_deleted_patients(Diagnosis.objects).count(),
+    'medications': lambda: exclude_deleted_patients(Medication.objects).count(),
+    'active_medications': lambda: exclude_deleted_patients(Medication.objects).filter(is_active=True).count(),
+}
+
+
+def invalidate_statistics():
+    cache.delete(CACHE_KEY)
+
+
+def adjust_counter(name, delta):
+    """Add ``delta`` to a counter within the current transaction"""
+    if not delta:
+        return
+    StatCounter.objects.filter(name=name).update(value=F('value') + delta)
+    transaction.on_commit(invalidate_statistics)
+
+
+@transaction.atomic
+def rebuild_statistics():
+    """Recount every counter from the source tables"""
+    values = {name: count() for name, count in COUNTERS.items()}
+    for name, value in values.items():
+        StatCounter.objects.update_or_create(name=name, defaults={'value': value})
+    transaction.on_commit(invalidate_statistics)
+    return values
+
+
+def get_statistics():
+    """Return {counter name: value} for every dashboard counter"""
+    stats = cache.get(CACHE_KEY)
+    if stats is None:
+        stats = dict(StatCounter.objects.values_list('name', 'value'))
+        if set(stats) != set(COUNTERS):
+            stats = rebuild_statistics()
+        cache.set(CACHE_KEY, stats, getattr(settings, 'DASHBOARD_STATS_CACHE_TTL', 60))
+    return stats
+
+
+async def aget_statistics():
+    """Async ``get_statistics()`` for async views"""
+    stats = await cache.aget(CACHE_KEY)
+    if stats is None:
+        stats = await sync_to_async(get_statistics)()
+    return stats
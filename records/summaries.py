@@ -0,0 +1,171 @@
+"""
+Per-patient clinical summary read model
+
+Opening a chart used to query histories, diagnoses, allergies and active
+medications separately, each joining through ``medical_history__patient``.
+``PatientSummary`` keeps all of that for one patient in a single JSON row:
+counts, the last visit and recent visits, active diagnoses, allergies and
+current medications. A chart is then one primary-key lookup of the patient
+joined to its summary.
+
+A change to the chart marks the patient's summary stale with one UPDATE,
+which also moves its ``updated_at`` so conditional GETs see the change, and
+queues a ``refresh_summary`` job (see ``records.jobs``) that rebuilds it
+outside the request. A burst of saves queues several jobs, but only the
+first finds the summary stale; the rest do nothing. Rebuilding the whole
+patient avoids hand-patched JSON that could drift.
+
+Reads normally find the summary already rebuilt. A summary still stale
+(no worker has run the job yet) or not built yet (new or bulk-imported
+patients) is built by the read as a fallback. ``check_patient_summaries``
+compares stored rows against fresh builds.
+"""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .jobs import enqueue, job
+from .models import Allergy, Diagnosis, MedicalHistory, Medication, Patient, PatientSummary
+
+
+RECENT_VISITS = 10
+
+DIAGNOSIS_FIELDS = ['id', 'medical_history_id', 'diagnosis_name', 'diagnosis_date', 'severity', 'status', 'icd_code']
+ALLERGY_FIELDS = ['id', 'medical_history_id', 'allergen', 'reaction', 'severity', 'identified_date']
+MEDICATION_FIELDS = ['id', 'medical_history_id', 'medication_name', 'dosage', 'frequency', 'route', 'start_date']
+
+# Keys converted back from ISO strings when a summary is loaded
+DATE_KEYS = {'diagnosis_date', 'identified_date', 'start_date'}
+DATETIME_KEYS = {'date_recorded'}
+
+
+def _recorded_by(first_name, last_name, username):
+    full_name = f"{first_name or ''} {last_name or ''}".strip()
+    return full_name or username or ''
+
+
+def build_summary(patient_id):
+    """Compute the JSON-ready summary for one patient"""
+    histories = MedicalHistory.objects.filter(patient_id=patient_id)
+    visits = [
+        {
+            'id': pk,
+            'date_recorded': date_recorded,
+            'chief_complaint': chief_complaint,
+            'recorded_by': _recorded_by(first_name, last_name, username),
+        }
+        for pk, date_recorded, chief_complaint, first_name, last_name, username in histories.values_list(
+            'pk', 'date_recorded', 'chief_complaint',
+            'recorded_by__first_name', 'recorded_by__last_name', 'recorded_by__username',
+        )[:RECENT_VISITS]
+    ]
+
+    diagnoses = Diagnosis.objects.filter(medical_history__patient_id=patient_id)
+    allergies = Allergy.objects.filter(medical_history__patient_id=patient_id)
+    medications = Medication.objects.filter(medical_history__patient_id=patient_id)
+
+    summary = {
+        'counts': {
+            'medical_histories': histories.count(),
+            'diagnoses': diagnoses.count(),
+            'allergies': allergies.count(),
+            'medications': medications.count(),
+        },
+        'last_visit': visits[0] if visits else None,
+        'recent_visits': visits,
+        'active_diagnoses': list(diagnoses.filter(status__iexact='active').values(*DIAGNOSIS_FIELDS)),
+        'allergies': list(allergies.values(*ALLERGY_FIELDS)),
+        'current_medications': list(medications.filter(is_active=True).values(*MEDICATION_FIELDS)),
+    }
+    summary['counts']['active_medications'] = len(summary['current_medications'])
+    # Round-trip through JSON so a fresh build compares equal to a stored row
+    return json.loads(json.dumps(summary, cls=DjangoJSONEncoder))
+
+
+def refresh_summary(patient_id):
+    """Rebuild and store one patient's summary; None if the patient is gone"""
+    if not Patient.objects.filter(pk=patient_id).exists():
+        return None
+    summary, _ = PatientSummary.objects.update_or_create(
+        patient_id=patient_id, defaults={'data': build_summary(patient_id), 'stale': False},
+    )
+    return summary
+
+
+def _mark_stale(patient_id):
+    return PatientSummary.objects.filter(patient_id=patient_id).update(stale=True, updated_at=timezone.now())
+
+
+def _create_stale_summary(patient_id):
+    # _base_manager: soft-deleted patients keep their summary
+    if not Patient._base_manager.filter(pk=patient_id).exists():
+        return
+    _, created = PatientSummary.objects.get_or_create(patient_id=patient_id, defaults={'stale': True})
+    if not created:
+        _mark_stale(patient_id)
+
+
+def mark_summary_stale(patient_id):
+    """Have a patient's summary rebuilt by a background job"""
+    if not _mark_stale(patient_id):
+        # The patient's pages are validated against the summary's updated_at,
+        # so one not built yet is created, stale, once the change commits
+        transaction.on_commit(lambda: _create_stale_summary(patient_id))
+    enqueue('refresh_summary', patient_id=patient_id)
+
+
+def rebuild_stale_summary(summary):
+    """Fresh data for a summary marked stale, stored for later reads
+
+    Stored only if no change marked the summary again while it was built
+    (that change queued its own rebuild); ``updated_at`` is left alone, so
+    it stays the time of the last change.
+    """
+    data = build_summary(summary.patient_id)
+    PatientSummary.objects.filter(
+        pk=summary.pk, stale=True, updated_at=summary.updated_at,
+    ).update(data=data, stale=False)
+    return data
+
+
+@job('refresh_summary')
+def refresh_summary_job(patient_id):
+    summary = PatientSummary.objects.filter(patient_id=patient_id).first()
+    if summary is None:
+        refresh_summary(patient_id)
+    elif summary.stale:
+        rebuild_stale_summary(summary)
+
+
+def _parse_dates(value):
+    if isinstance(value, list):
+        return [_parse_dates(item) for item in value]
+    if isinstance(value, dict):
+        parsed = {}
+        for key, item in value.items():
+            if key in DATE_KEYS and item:
+                item = parse_date(item)
+            elif key in DATETIME_KEYS and item:
+                item = parse_datetime(item)
+            else:
+                item = _parse_dates(item)
+            parsed[key] = item
+        return parsed
+    return value
+
+
+def load_summary(patient):
+    """Summary for a patient fetched with ``select_related('summary')``.
+
+    Dates come back as date/datetime objects so templates can format them.
+    """
+    try:
+        summary = patient.summary
+    except PatientSummary.DoesNotExist:
+        summary = refresh_summary(patient.pk)
+    data = rebuild_stale_summary(summary) if summary.stale else summary.data
+    return _parse_dates(data)
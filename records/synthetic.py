@@ -0,0 +1,274 @@
+"""
+Reproducible synthetic clinical data for benchmarks
+
+Every synthetic patient and their visits, diagnoses, allergies and
+medications are drawn from a random generator seeded with ``(seed, patient
+number)``, so patient N always gets the same records no matter how the
+volume was built up (1k at once, or 1k and then 99k more). Dates are
+relative to the day the data is generated.
+
+Rows are written with ``bulk_create`` in batches. As with the bulk import,
+that bypasses model signals: each batch indexes its patients for search,
+and statistics and the autocomplete index are rebuilt once at the end.
+``bulk_create`` also stamps ``auto_now`` fields with the current time, so
+the generated timestamps are written back with ``bulk_update``.
+Clinical summaries are built lazily on first read.
+"""
+
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .autocomplete import patient_index
+from .caching import bump_versions
+from .models import Allergy, CustomUser, Diagnosis, MedicalHistory, Medication, Patient
+from .patient_ids import allocate_patient_ids
+from .search import get_search_backend
+from .stats import rebuild_statistics
+
+
+USERNAME_PREFIX = 'synthetic_'
+# Marks synthetic patients so existing ones can be counted and skipped
+ADDRESS_SUFFIX = '(synthetic)'
+
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William', 'Elizabeth',
+    'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+    'Maria', 'Jose', 'Ana', 'Juan', 'Rosa', 'Carlos', 'Wei', 'Mei', 'Hiroshi', 'Yuki',
+    'Aisha', 'Omar', 'Fatima', 'Ali', 'Priya', 'Raj', 'Olga', 'Ivan', 'Amara', 'Kwame',
+]
+
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Santos', 'Reyes', 'Cruz', 'Bautista', 'Dela Cruz', 'Chen', 'Wang', 'Tanaka', 'Sato', 'Kim',
+    'Khan', 'Patel', 'Singh', 'Ivanov', 'Okafor', 'Mensah', 'Nguyen', 'Tran', 'Muller', 'Rossi',
+]
+
+STREETS = ['Main St', 'Oak Ave', 'Pine Rd', 'Maple Dr', 'Cedar Ln', 'Rizal Ave', 'Mabini St', 'Lake View Rd']
+
+COMPLAINTS = [
+    'Persistent cough', 'Fever and chills', 'Headache', 'Lower back pain', 'Chest pain on exertion',
+    'Shortness of breath', 'Abdominal pain', 'Skin rash', 'Fatigue', 'Dizziness',
+    'Routine check-up', 'Follow-up visit', 'Joint pain', 'Sore throat', 'Blurred vision',
+]
+
+DIAGNOSES = [
+    ('Essential hypertension', 'I10'), ('Type 2 diabetes mellitus', 'E11.9'), ('Asthma', 'J45.909'),
+    ('Acute bronchitis', 'J20.9'), ('Migraine', 'G43.909'), ('Gastroesophageal reflux disease', 'K21.9'),
+    ('Urinary tract infection', 'N39.0'), ('Hyperlipidemia', 'E78.5'), ('Osteoarthritis of knee', 'M17.9'),
+    ('Community-acquired pneumonia', 'J18.9'), ('Iron deficiency anemia', 'D50.9'), ('Allergic rhinitis', 'J30.9'),
+]
+
+DIAGNOSIS_STATUSES = ['active', 'active', 'active', 'resolved', 'chronic']
+
+ALLERGENS = [
+    ('Penicillin', 'Hives and itching'), ('Peanuts', 'Swelling of lips and throat'), ('Shellfish', 'Vomiting'),
+    ('Latex', 'Contact dermatitis'), ('Sulfa drugs', 'Skin rash'), ('Dust mites', 'Sneezing and congestion'),
+    ('Pollen', 'Itchy eyes'), ('Aspirin', 'Wheezing'), ('Eggs', 'Abdominal cramps'),
+]
+
+MEDICATIONS = [
+    ('Amlodipine', '5 mg', 'once daily', 'oral', 'Blood pressure control'),
+    ('Metformin', '500 mg', 'twice daily', 'oral', 'Blood sugar control'),
+    ('Salbutamol', '100 mcg', 'as needed', 'inhalation', 'Relief of bronchospasm'),
+    ('Amoxicillin', '500 mg', 'every 8 hours', 'oral', 'Bacterial infection'),
+    ('Paracetamol', '500 mg', 'every 6 hours as needed', 'oral', 'Pain and fever'),
+    ('Omeprazole', '20 mg', 'once daily', 'oral', 'Acid reflux'),
+    ('Atorvastatin', '20 mg', 'once daily at night', 'oral', 'Cholesterol control'),
+    ('Ferrous sulfate', '325 mg', 'once daily', 'oral', 'Iron supplementation'),
+    ('Cetirizine', '10 mg', 'once daily', 'oral', 'Allergy symptoms'),
+    ('Ceftriaxone', '1 g', 'once daily', 'IV', 'Severe infection'),
+]
+
+
+def _phone(rng):
+    return f"09{rng.randint(100000000, 999999999)}"
+
+
+def _restore_timestamps(objects, fields, values):
+    """Write generated timestamps back over the ones bulk_create set
+
+    ``bulk_create`` runs ``pre_save``, which sets ``auto_now`` and
+    ``auto_now_add`` fields to the current time; ``bulk_update`` does not.
+    """
+    if not objects:
+        return
+    for obj, row in zip(objects, values):
+        for name, value in zip(fields, row):
+            setattr(obj, name, value)
+    type(objects[0])._default_manager.bulk_update(objects, fields, batch_size=1000)
+
+
+def synthetic_patient_count():
+    return Patient.objects.filter(address__endswith=ADDRESS_SUFFIX).count()
+
+
+class SyntheticDataGenerator:
+    """Generates synthetic users and patients with their clinical records"""
+
+    def __init__(self, seed=0, histories_per_patient=3, batch_size=2000):
+        self.seed = seed
+        self.histories_per_patient = histories_per_patient
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.doctors = []
+        self.staff = []
+
+    def create_users(self, count):
+        """Create up to ``count`` synthetic doctors, nurses and admins"""
+        existing = set(
+            CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).values_list('username', flat=True)
+        )
+        rng = random.Random(f'{self.seed}-users')
+        password = make_password(None)
+        users = []
+        for number in range(count):
+            role = 'admin' if number % 10 == 0 else ('doctor' if number % 2 else 'nurse')
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            username = f'{USERNAME_PREFIX}{role}_{number:04d}'
+            if username in existing:
+                continue
+            users.append(CustomUser(
+                username=username, password=password, role=role, is_staff=role == 'admin',
+                first_name=first_name, last_name=last_name, email=f'{username}@example.com',
+                specialization='Internal Medicine' if role == 'doctor' else '',
+            ))
+        CustomUser.objects.bulk_create(users)
+
+        roles = list(CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).values_list('pk', 'role'))
+        self.doctors = [pk for pk, role in roles if role == 'doctor']
+        self.staff = [pk for pk, role in roles if role in ('doctor', 'nurse')]
+
+    def create_patients(self, count, start=None):
+        """Create ``count`` patients numbered from ``start``; yields progress"""
+        if start is None:
+            start = synthetic_patient_count()
+        for offset in range(0, count, self.batch_size):
+            numbers = range(start + offset, start + min(offset + self.batch_size, count))
+            self._create_batch(numbers)
+            yield len(numbers)
+
+    def finish(self):
+        """Rebuild what bulk inserts bypassed"""
+        rebuild_statistics()
+        transaction.on_commit(patient_index.reset)
+        transaction.on_commit(lambda: bump_versions('patients', 'allergies', 'diagnoses', 'medications'))
+
+    def _create_batch(self, numbers):
+        rngs = [random.Random(f'{self.seed}-{number}') for number in numbers]
+        patients = [self._patient(rng) for rng in rngs]
+        for patient, patient_id in zip(patients, allocate_patient_ids(len(patients))):
+            patient.patient_id = patient_id
+
+        with transaction.atomic():
+            patient_times = [(patient.created_at, patient.updated_at) for patient in patients]
+            Patient.objects.bulk_create(patients)
+            pk_by_patient_id = dict(
+                Patient.objects.filter(patient_id__in=[p.patient_id for p in patients]).values_list('patient_id', 'pk')
+            )
+            for patient in patients:
+                patient.pk = pk_by_patient_id[patient.patient_id]
+            _restore_timestamps(patients, ['created_at', 'updated_at'], patient_times)
+
+            histories = []
+            for patient, rng in zip(patients, rngs):
+                histories.extend(self._histories(patient, rng))
+            history_times = [(history.date_recorded,) for history in histories]
+            MedicalHistory.objects.bulk_create(histories)
+            if histories and histories[0].pk is None:
+                # Backends that don't return bulk-inserted keys (MySQL)
+                # assign auto-increment values in insertion order
+                pks = MedicalHistory.objects.filter(
+                    patient_id__in=pk_by_patient_id.values()
+                ).order_by('pk').values_list('pk', flat=True)
+                for history, pk in zip(histories, pks):
+                    history.pk = pk
+            _restore_timestamps(histories, ['date_recorded'], history_times)
+
+            diagnoses, allergies, medications = [], [], []
+            for history in histories:
+                for child in history.synthetic_children:
+                    child.medical_history_id = history.pk
+                    if isinstance(child, Diagnosis):
+                        diagnoses.append(child)
+                    elif isinstance(child, Allergy):
+                        allergies.append(child)
+                    else:
+                        medications.append(child)
+            Diagnosis.objects.bulk_create(diagnoses)
+            Allergy.objects.bulk_create(allergies)
+            Medication.objects.bulk_create(medications)
+
+            get_search_backend().index_patients(patients)
+
+    def _patient(self, rng):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        created_at = self.now - timedelta(days=rng.randint(0, 5 * 365), seconds=rng.randint(0, 86399))
+        return Patient(
+            first_name=first_name,
+            last_name=last_name,
+            date_of_birth=(self.now - timedelta(days=rng.randint(365, 95 * 365))).date(),
+            gender='O' if rng.random() < 0.02 else rng.choice('MF'),
+            blood_group=rng.choice([choice for choice, _ in Patient.BLOOD_GROUP_CHOICES] + ['']),
+            phone=_phone(rng),
+            email=f'{first_name}.{last_name}{rng.randint(1, 9999)}@example.com'.lower().replace(' ', '')
+            if rng.random() < 0.7 else '',
+            address=f'{rng.randint(1, 999)} {rng.choice(STREETS)} {ADDRESS_SUFFIX}',
+            emergency_contact_name=f'{rng.choice(FIRST_NAMES)} {last_name}',
+            emergency_contact_phone=_phone(rng),
+            created_at=created_at,
+            updated_at=created_at,
+        )
+
+    def _histories(self, patient, rng):
+        histories = []
+        for _ in range(rng.randint(0, 2 * self.histories_per_patient)):
+            age = (self.now - patient.created_at).days
+            recorded = self.now - timedelta(days=rng.randint(0, max(age, 0)), seconds=rng.randint(0, 86399))
+            history = MedicalHistory(
+                patient_id=patient.pk,
+                date_recorded=recorded,
+                recorded_by_id=rng.choice(self.staff) if self.staff else None,
+                chief_complaint=rng.choice(COMPLAINTS),
+                vital_signs={
+                    'blood_pressure': f'{rng.randint(100, 160)}/{rng.randint(60, 100)}',
+                    'temperature': round(rng.uniform(36.1, 39.2), 1),
+                    'pulse': rng.randint(55, 110),
+                },
+                physical_examination='Unremarkable' if rng.random() < 0.6 else 'See notes',
+                notes='',
+            )
+            history.synthetic_children = self._children(recorded.date(), rng)
+            histories.append(history)
+        return histories
+
+    def _children(self, visit_date, rng):
+        children = []
+        for _ in range(rng.choice([0, 1, 1, 2])):
+            name, icd_code = rng.choice(DIAGNOSES)
+            children.append(Diagnosis(
+                diagnosis_name=name, icd_code=icd_code, diagnosis_date=visit_date,
+                severity=rng.choice(['mild', 'mild', 'moderate', 'severe', 'critical']),
+                description=f'{name} diagnosed at visit', status=rng.choice(DIAGNOSIS_STATUSES),
+            ))
+        if rng.random() < 0.3:
+            allergen, reaction = rng.choice(ALLERGENS)
+            children.append(Allergy(
+                allergen=allergen, reaction=reaction, identified_date=visit_date,
+                severity=rng.choice(['mild', 'moderate', 'severe', 'life_threatening']),
+            ))
+        for _ in range(rng.choice([0, 1, 1, 2, 3])):
+            name, dosage, frequency, route, purpose = rng.choice(MEDICATIONS)
+            days = rng.randint(5, 90)
+            end_date = visit_date + timedelta(days=days)
+            children.append(Medication(
+                medication_name=name, dosage=dosage, frequency=frequency, route=route, purpose=purpose,
+                start_date=visit_date, end_date=end_date if rng.random() < 0.8 else None,
+                is_active=end_date >= self.now.date(),
+                prescribed_by_id=rng.choice(self.doctors) if self.doctors else None,
+            ))
+        return children
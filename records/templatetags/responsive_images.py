@@ -0,0 +1,47 @@
+"""
+``{% responsive_image %}``: serve a processed photo variant sized for its box
+"""
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from records.images import DENSITIES, VARIANT_SIZES, variants_field
+
+
+register = template.Library()
+
+
+def _srcset(storage, names):
+    return format_html_join(
+        ', ', '{} {}x', ((storage.url(name), density) for name, density in zip(names, DENSITIES)),
+    )
+
+
+@register.simple_tag
+def responsive_image(image, size, alt='', style=''):
+    """``<picture>`` for ``image`` (a patient photo or profile picture) at ``size``
+
+    ``size`` is a key of ``records.images.VARIANT_SIZES``. Until the upload
+    has been processed, the original is served instead.
+    """
+    if not image:
+        return ''
+    pixels = VARIANT_SIZES[size]
+    variants = getattr(image.instance, variants_field(image.field.name), None) or {}
+    formats = variants.get(size)
+    if not formats:
+        return format_html(
+            '<img src="{}" alt="{}" width="{}" height="{}" style="{}" loading="lazy">',
+            image.url, alt, pixels, pixels, style,
+        )
+    storage = image.storage
+    # display: contents keeps the <img> laid out as if it had no wrapper
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" alt="{}" width="{}" height="{}" style="{}" loading="lazy">'
+        '</picture>',
+        _srcset(storage, formats['webp']),
+        storage.url(formats['jpeg'][0]), _srcset(storage, formats['jpeg']),
+        alt, pixels, pixels, style,
+    )
@@ -1 +1,1612 @@
 # Test file for records app
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import tempfile
+import threading
+from datetime import date, timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.signals import request_started
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from django.urls import reverse
+from django.utils import timezone
+
+from . import admin_views, async_views, views
+from .models import CustomUser, Patient, MedicalHistory, Diagnosis, Allergy, Medication, PatientSearchToken, IdSequence, PatientSummary, Job, AuditEvent, CacheVersion
+from .backends.cache import cache_stats, reset_cache_stats
+from .backends.pool import ConnectionPool, PoolTimeout
+from .audit import audit_log, maintain_partitions
+from .autocomplete import PatientPrefixIndex, VERSION_NAME as AUTOCOMPLETE_VERSION, warm_patient_index_on_first_request
+from .caching import bump_versions, get_versions
+from .counting import EstimatedCountPaginator, approximate_count
+from .deletion import delete_patient
+from .events import dashboard_events
+from .exports import stream_export
+from .forms import PatientPickerForm
+from .images import VARIANT_SIZES
+from .imports import import_patients
+from .instrumentation import QueryBudgetExceeded, query_stats
+from .jobs import claim, enqueue, execute, job, job_metrics, requeue_stale, work
+from .media import serve_media
+from .pagination import KeysetPaginator, encode_cursor
+from .patient_ids import BlockSequenceAllocator, allocate_patient_ids
+from .replicas import PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter, pin_seconds, reset_health, use_replica
+from .search import TokenSearchBackend, search_patients
+from .stats import get_statistics, rebuild_statistics
+from .benchmarks import run_benchmarks
+from .synthetic import SyntheticDataGenerator
+from .summaries import load_summary
+
+
+def patient_fields(first_name='Ada', last_name='Lovelace', **fields):
+    """Every required Patient field, with placeholder values unless given"""
+    return {
+        'first_name': first_name, 'last_name': last_name, 'date_of_birth': date(1990, 1, 1),
+        'gender': 'F', 'phone': '555', 'address': '1 Street',
+        'emergency_contact_name': 'Bob', 'emergency_contact_phone': '556', **fields,
+    }
+
+
+def create_patient(first_name='Ada', last_name='Lovelace', **fields):
+    return Patient.objects.create(**patient_fields(first_name, last_name, **fields))
+
+
+class ListViewIndexTests(TestCase):
+    """Each custom admin list view's page query should be served by an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username='admin', password='pass', role='admin', is_staff=True
+        )
+        patient = create_patient(blood_group='O+')
+        history = MedicalHistory.objects.create(patient=patient, chief_complaint='Checkup')
+        Diagnosis.objects.create(
+            medical_history=history, diagnosis_name='Flu', diagnosis_date=date.today(),
+            severity='mild', description='Seasonal flu',
+        )
+        Allergy.objects.create(
+            medical_history=history, allergen='Peanuts', reaction='Hives',
+            severity='severe', identified_date=date.today(),
+        )
+        Medication.objects.create(
+            medical_history=history, medication_name='Paracetamol', dosage='500mg',
+            frequency='twice daily', start_date=date.today(), purpose='Fever',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+            return ' '.join(str(col) for row in cursor.fetchall() for col in row)
+
+    def assertPageQueryUsesIndex(self, url_name, params, model):
+        table = model._meta.db_table
+        index_names = [index.name for index in model._meta.indexes]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, 200)
+        page_queries = [
+            q['sql'] for q in ctx.captured_queries
+            if f'FROM "{table}"' in q['sql'].replace('`', '"') and 'LIMIT' in q['sql']
+        ]
+        self.assertTrue(page_queries, f'No page query against {table} for {url_name}')
+        for sql in page_queries:
+            plan = self.explain(sql)
+            self.assertTrue(
+                any(name in plan for name in index_names),
+                f'{url_name} {params} does not use an index:\n{sql}\n{plan}',
+            )
+
+    def test_patient_list_uses_indexes(self):
+        for params in [{}, {'gender': 'F'}, {'blood_group': 'O+'}, {'gender': 'F', 'blood_group': 'O+'}]:
+            self.assertPageQueryUsesIndex('custom_admin:patient_list', params, Patient)
+
+    def test_allergy_list_uses_indexes(self):
+        for params in [{}, {'severity': 'severe'}]:
+            self.assertPageQueryUsesIndex('custom_admin:allergy_list', params, Allergy)
+
+    def test_diagnosis_list_uses_indexes(self):
+        for params in [{}, {'severity': 'mild'}]:
+            self.assertPageQueryUsesIndex('custom_admin:diagnosis_list', params, Diagnosis)
+
+    def test_diagnosis_this_month_count_uses_index(self):
+        month_start = date.today().replace(day=1)
+        queryset = Diagnosis.objects.filter(diagnosis_date__gte=month_start)
+        self.assertIn('diagnosis_date_idx', queryset.explain())
+
+    def test_medication_list_uses_indexes(self):
+        for params in [{}, {'is_active': 'true'}]:
+            self.assertPageQueryUsesIndex('custom_admin:medication_list', params, Medication)
+
+
+class PatientSearchTests(TestCase):
+    """Token index search backend"""
+
+    @override_settings(PATIENT_SEARCH_BACKEND='token')
+    def test_prefix_search_ranks_and_tracks_changes(self):
+        ada = create_patient('Ada', 'Lovelace')
+        create_patient('Adam', 'Smith', email='ada@example.com')
+        create_patient('Grace', 'Hopper')
+
+        self.assertEqual(
+            [p.first_name for p in search_patients('ada')], ['Ada', 'Adam']
+        )
+        self.assertEqual([p.pk for p in search_patients('ada love')], [ada.pk])
+        self.assertEqual(list(search_patients(ada.patient_id)), [ada])
+
+        ada.last_name = 'King'
+        ada.save()
+        self.assertFalse(search_patients('lovelace').exists())
+        self.assertEqual(list(search_patients('king')), [ada])
+
+        ada.delete()
+        self.assertFalse(PatientSearchToken.objects.filter(patient_id=ada.pk).exists())
+
+    def test_short_query_matches_nothing(self):
+        create_patient('Ada', 'Lovelace')
+        self.assertFalse(search_patients('a').exists())
+
+    @override_settings(PATIENT_SEARCH_BACKEND='fulltext', FULLTEXT_MIN_TOKEN_SIZE=3)
+    def test_fulltext_matches_terms_below_server_minimum_by_prefix(self):
+        ada = create_patient('Ada', 'Lovelace')
+        create_patient('Grace', 'Hopper', email='lo@example.com')
+        create_patient('Alan', 'Turing')
+
+        # Two-character terms never reach MATCH, so this runs on any database
+        self.assertNotIn('MATCH', str(search_patients('lo').query))
+        self.assertEqual([p.first_name for p in search_patients('lo')], ['Ada', 'Grace'])
+        self.assertEqual(list(search_patients('ad lo')), [ada])
+        self.assertIn('MATCH', str(search_patients('lov ad').query))
+
+
+class PatientPrefixIndexTests(TestCase):
+    """In-process autocomplete index"""
+
+    def test_lookup_and_incremental_updates(self):
+        ada = create_patient('Ada', 'Lovelace')
+        create_patient('Grace', 'Hopper')
+        index = PatientPrefixIndex()
+        index.build()
+
+        self.assertEqual([r['pk'] for r in index.lookup('ada l')], [ada.pk])
+        self.assertEqual([r['pk'] for r in index.lookup(ada.patient_id)], [ada.pk])
+        self.assertEqual(index.lookup('zz'), [])
+
+        ada.first_name = 'Augusta'
+        index.update(ada)
+        self.assertEqual(index.lookup('ada'), [])
+        self.assertEqual(index.lookup('aug')[0]['last_name'], 'Lovelace')
+
+        index.remove(ada.pk)
+        self.assertEqual(index.lookup('aug'), [])
+
+    def test_other_processes_sync_changes_without_rebuilding(self):
+        ada = create_patient('Ada', 'Lovelace')
+        grace = create_patient('Grace', 'Hopper')
+        # Another worker's copy of the index
+        other = PatientPrefixIndex()
+        other.build()
+        version = get_versions(AUTOCOMPLETE_VERSION)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ada.first_name = 'Augusta'
+            ada.save()
+            delete_patient(grace)
+        with mock.patch.object(other, 'build') as build:
+            other.sync()
+        build.assert_not_called()
+        self.assertEqual(get_versions(AUTOCOMPLETE_VERSION), version)
+        self.assertEqual([r['pk'] for r in other.lookup('aug')], [ada.pk])
+        self.assertEqual(other.lookup('ada'), [])
+        self.assertEqual(other.lookup('grace'), [])
+
+    def test_lookup_is_cold_until_built(self):
+        with self.settings(AUTOCOMPLETE_INDEX_ENABLED=False):
+            self.assertIsNone(PatientPrefixIndex().lookup('ada'))
+
+    def test_stale_version_invalidates(self):
+        index = PatientPrefixIndex()
+        index.build()
+        bump_versions(AUTOCOMPLETE_VERSION)
+        with self.settings(AUTOCOMPLETE_VERSION_CHECK_INTERVAL=0, AUTOCOMPLETE_INDEX_ENABLED=True), \
+                mock.patch.object(index, 'warm_async') as warm_async:
+            self.assertIsNone(index.lookup('ada'))
+        warm_async.assert_called_once()
+
+    def test_application_warms_on_first_request_not_at_import(self):
+        with mock.patch('records.autocomplete.patient_index.warm_async') as warm_async:
+            warm_patient_index_on_first_request()
+            warm_async.assert_not_called()
+            request_started.send(sender=None)
+            request_started.send(sender=None)
+        warm_async.assert_called_once()
+
+
+class DashboardStatisticsTests(TestCase):
+    """Signal-maintained dashboard counters"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_track_changes_and_match_rebuild(self):
+        get_statistics()
+        doctor = CustomUser.objects.create_user(username='doc', password='pass', role='doctor')
+        patient = create_patient()
+        history = MedicalHistory.objects.create(patient=patient, chief_complaint='Checkup')
+        medication = Medication.objects.create(
+            medical_history=history, medication_name='Paracetamol', dosage='500mg',
+            frequency='twice daily', start_date=date.today(), purpose='Fever',
+        )
+        medication.is_active = False
+        medication.save()
+        doctor.role = 'nurse'
+        doctor.save()
+
+        cache.clear()
+        stats = get_statistics()
+        self.assertEqual(stats['patients'], 1)
+        self.assertEqual(stats['medications'], 1)
+        self.assertEqual(stats['active_medications'], 0)
+        self.assertEqual((stats['doctors'], stats['nurses']), (0, 1))
+
+        patient.delete()
+        cache.clear()
+        stats = get_statistics()
+        self.assertEqual(stats, rebuild_statistics())
+        self.assertEqual((stats['patients'], stats['medical_histories'], stats['medications']), (0, 0, 0))
+
+    def test_dashboard_reads_counters_from_cache(self):
+        user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        self.client.force_login(user)
+        get_statistics()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('custom_admin:dashboard'))
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+
+class PatientDetailQueryTests(TestCase):
+    """The custom admin patient detail page runs a constant number of queries"""
+
+    def test_query_count_independent_of_history_count(self):
+        user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        patient = create_patient()
+        histories = MedicalHistory.objects.bulk_create([
+            MedicalHistory(patient=patient, recorded_by=user, chief_complaint=f'Visit {i}')
+            for i in range(100)
+        ])
+        Allergy.objects.bulk_create([
+            Allergy(medical_history=history, allergen='Dust', reaction='Sneezing',
+                    severity='mild', identified_date=date.today())
+            for history in histories
+        ])
+        self.client.force_login(user)
+
+        # session, user, conditional GET validator, patient, fragment version,
+        # histories, and one prefetch per child table
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('custom_admin:patient_detail', args=[patient.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['medical_histories'][0].allergy_count, 1)
+        self.assertEqual(response.context['medical_histories'][0].diagnosis_count, 0)
+        self.assertContains(response, 'Dust', count=100)
+
+    def test_child_rows_are_prefetched(self):
+        user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        patient = create_patient()
+        history = MedicalHistory.objects.create(patient=patient, recorded_by=user, chief_complaint='Visit')
+        Medication.objects.create(
+            medication_name='Older', dosage='1', frequency='daily', start_date=date(2020, 1, 1),
+            purpose='x', medical_history=history,
+        )
+        Medication.objects.create(
+            medication_name='Newer', dosage='1', frequency='daily', start_date=date(2021, 1, 1),
+            purpose='x', medical_history=history,
+        )
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('custom_admin:patient_detail', args=[patient.pk]))
+        history = response.context['medical_histories'][0]
+        with self.assertNumQueries(0):
+            names = [medication.medication_name for medication in history.medications.all()]
+            self.assertEqual(len(history.allergies.all()), 0)
+            self.assertEqual(len(history.diagnoses.all()), 0)
+        self.assertEqual(names, ['Newer', 'Older'])
+
+
+class KeysetPaginatorTests(TestCase):
+    """Cursor pagination over the custom admin list orderings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.bulk_create([
+            Patient(**patient_fields(
+                'Test', f'Patient {i}', patient_id=f'PATTEST{i:03d}', gender='M' if i % 2 else 'F',
+            ))
+            for i in range(45)
+        ])
+        # Several patients share a created_at value; pk breaks the tie
+        Patient.objects.filter(pk__in=Patient.objects.order_by('pk').values('pk')[:10]).update(
+            created_at=Patient.objects.order_by('pk').first().created_at
+        )
+        # bulk_create bypasses the signal that maintains the search index
+        TokenSearchBackend().index_patients(Patient.objects.all())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_walks_forward_and_back_without_gaps(self):
+        queryset = Patient.objects.all()
+        expected = list(queryset.order_by('-created_at', '-pk'))
+        paginator = KeysetPaginator(queryset, 20, ['-created_at', '-pk'])
+
+        first = paginator.get_page(None)
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third), expected)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(second.has_previous() and second.has_next())
+        self.assertFalse(third.has_next())
+
+        self.assertEqual(list(paginator.get_page(third.previous_cursor)), list(second))
+        self.assertEqual(list(paginator.get_page(second.previous_cursor)), list(first))
+        self.assertEqual(list(paginator.get_page(first.last_cursor)), expected[-20:])
+
+    def test_invalid_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(Patient.objects.all(), 20, ['-created_at', '-pk'])
+        self.assertEqual(list(paginator.get_page('not-a-cursor')), list(paginator.get_page(None)))
+
+    def test_tampered_cursor_values_return_first_page(self):
+        user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        self.client.force_login(user)
+        url = reverse('custom_admin:diagnosis_list')
+        for values in (['not-a-date', 1], [{'a': 1}, 1], ['2024-01-01', 'x'], [None, 1], ['2024-01-01']):
+            response = self.client.get(url, {'cursor': encode_cursor('next', values)})
+            self.assertEqual(response.status_code, 200, values)
+            self.assertFalse(response.context['page_obj'].has_previous(), values)
+
+        paginator = KeysetPaginator(search_patients('test'), 20, ['-search_rank', '-created_at', '-pk'])
+        self.assertIsNone(paginator.clean_values([{'a': 1}, '2024-01-01T00:00:00', 1]))
+        self.assertIsNotNone(paginator.clean_values([2, '2024-01-01T00:00:00', 1]))
+
+    def test_list_view_follows_cursor(self):
+        user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        self.client.force_login(user)
+        url = reverse('custom_admin:patient_list')
+        first = self.client.get(url, {'gender': 'M'}).context['page_obj']
+        second = self.client.get(url, {'gender': 'M', 'cursor': first.next_cursor}).context['page_obj']
+        males = list(Patient.objects.filter(gender='M').order_by('-created_at', '-pk'))
+        self.assertEqual(list(first) + list(second), males)
+
+    def test_search_results_follow_cursor(self):
+        user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        self.client.force_login(user)
+        url = reverse('custom_admin:patient_list')
+        seen = []
+        cursor = None
+        for _ in range(3):
+            page = self.client.get(url, {'q': 'test', 'cursor': cursor or ''}).context['page_obj']
+            seen.extend(page)
+            cursor = page.next_cursor
+        self.assertIsNone(cursor)
+        self.assertEqual(sorted(p.pk for p in seen), sorted(Patient.objects.values_list('pk', flat=True)))
+
+
+class ApproximateCountTests(TestCase):
+    """Table-statistics based counts for large tables"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            create_patient('Test', f'Patient {i}', gender='M' if i % 2 else 'F')
+
+    def test_exact_below_threshold(self):
+        with mock.patch('records.counting.estimated_table_rows', return_value=5):
+            count = approximate_count(Patient.objects.all(), threshold=10)
+        self.assertEqual(count, 5)
+        self.assertEqual(count.display, '5')
+
+    def test_table_statistics_above_threshold(self):
+        with mock.patch('records.counting.estimated_table_rows', return_value=2_000_000):
+            count = approximate_count(Patient.objects.all(), threshold=3)
+            filtered = approximate_count(Patient.objects.filter(gender='F'), threshold=3)
+        self.assertEqual(count.display, '~2,000,000')
+        self.assertEqual(filtered, 3)
+        self.assertEqual(filtered.display, '3+')
+
+    def test_admin_changelist_paginator(self):
+        paginator = EstimatedCountPaginator(Patient.objects.all(), 2)
+        with mock.patch('records.counting.estimated_table_rows', return_value=None):
+            self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.num_pages, 3)
+
+
+class PatientPickerTests(TestCase):
+    """Typeahead patient picker and its JSON search endpoint"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        cls.patients = [
+            create_patient('Test', f'Patient {i}')
+            for i in range(15)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    @override_settings(AUTOCOMPLETE_INDEX_ENABLED=False)
+    def test_search_endpoint_pages_results(self):
+        url = reverse('custom_admin:ajax_patient_search')
+        first = self.client.get(url, {'q': 'test'}).json()
+        second = self.client.get(url, {'q': 'test', 'page': 2}).json()
+        self.assertEqual(len(first['results']), 10)
+        self.assertTrue(first['pagination']['more'])
+        self.assertEqual(len(second['results']), 5)
+        self.assertFalse(second['pagination']['more'])
+
+    def test_list_page_does_not_render_every_patient(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('custom_admin:allergy_list'))
+        self.assertNotContains(response, 'Patient 14')
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "records_patient"' in q['sql']])
+        self.assertContains(response, 'js/patient_typeahead.js')
+
+    def test_form_validates_submitted_pk_only(self):
+        form = PatientPickerForm({'patient': self.patients[3].pk})
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['patient'], self.patients[3])
+        self.assertFalse(PatientPickerForm({'patient': 0}).is_valid())
+
+
+class ExportTests(TestCase):
+    """Streaming CSV / NDJSON exports"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        for i in range(5):
+            patient = create_patient('Test', f'Patient {i}', gender='M' if i % 2 else 'F')
+            history = MedicalHistory.objects.create(patient=patient, chief_complaint='Checkup')
+            Allergy.objects.create(
+                medical_history=history, allergen='Peanuts', reaction='Hives',
+                severity='severe' if i < 2 else 'mild', identified_date=date.today(),
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_csv_export_streams_filtered_rows(self):
+        response = self.client.get(reverse('custom_admin:export', args=['patients']), {'gender': 'F'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ['patient_id', 'first_name', 'last_name'])
+        self.assertEqual(len(rows) - 1, Patient.objects.filter(gender='F').count())
+
+    def test_ndjson_export_includes_patient_columns(self):
+        response = self.client.get(
+            reverse('custom_admin:export', args=['allergies']), {'format': 'ndjson', 'severity': 'severe'}
+        )
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['patient_first_name'], 'Test')
+
+    def test_chunks_cover_every_row(self):
+        lines = list(stream_export('patients', {}, 'ndjson', chunk_size=2))
+        self.assertEqual(len(lines), 5)
+
+    def test_unknown_dataset_is_404(self):
+        response = self.client.get(reverse('custom_admin:export', args=['nothing']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('export_records', 'allergies', '--filter', 'severity=mild', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+class PatientImportTests(TestCase):
+    """Bulk patient import from CSV / NDJSON"""
+
+    HEADER = 'first_name,last_name,date_of_birth,gender,blood_group,phone,email,address,emergency_contact_name,emergency_contact_phone\n'
+
+    def csv_stream(self, rows):
+        return io.StringIO(self.HEADER + ''.join(rows))
+
+    def test_valid_rows_created_in_chunks_and_invalid_rows_rejected(self):
+        rows = [
+            f'Ann,Import{i},1990-01-01,F,A+,555,,1 Street,Bob,556\n' for i in range(5)
+        ] + [
+            'Bad,Gender,1990-01-01,X,A+,555,,1 Street,Bob,556\n',
+            'No,Birthday,,M,,555,,1 Street,Bob,556\n',
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            result = import_patients(self.csv_stream(rows), chunk_size=2)
+
+        self.assertEqual(result.created, 5)
+        self.assertEqual([reject['line'] for reject in result.rejected], [7, 8])
+        self.assertIn('gender', result.rejected[0]['errors'])
+        self.assertIn('date_of_birth', result.rejected[1]['errors'])
+        inserts = [q for q in queries.captured_queries
+                   if q['sql'].startswith('INSERT INTO "records_patient"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(len(set(Patient.objects.values_list('patient_id', flat=True))), 5)
+
+    def test_import_maintains_search_index_and_counters(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            import_patients(self.csv_stream(['Zelda,Importson,1980-05-05,F,O-,555,z@example.com,1 Street,Bob,556\n']))
+        self.assertEqual([p.last_name for p in search_patients('zelda')], ['Importson'])
+        self.assertEqual(get_statistics()['patients'], 1)
+
+    def test_import_adds_rows_to_a_warm_autocomplete_index(self):
+        index = PatientPrefixIndex()
+        index.build()
+        rows = [f'Ann,Import{i},1990-01-01,F,A+,555,,1 Street,Bob,556\n' for i in range(3)]
+        with mock.patch('records.imports.patient_index', index), \
+                mock.patch.object(index, 'build') as build, \
+                self.captureOnCommitCallbacks(execute=True):
+            import_patients(self.csv_stream(rows), chunk_size=2)
+        build.assert_not_called()
+        self.assertTrue(index.is_warm)
+        self.assertEqual(len(index.lookup('ann')), 3)
+        self.assertEqual(len(index.lookup('import1')), 1)
+
+    def test_ndjson_rejects_malformed_lines(self):
+        stream = io.StringIO(
+            '{"first_name": "Jo", "last_name": "Json", "date_of_birth": "1975-03-03", "gender": "M", '
+            '"phone": "555", "address": "1 Street", "emergency_contact_name": "Bob", '
+            '"emergency_contact_phone": "556"}\n'
+            'not json\n'
+        )
+        result = import_patients(stream, 'ndjson')
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.rejected[0]['line'], 2)
+
+        output = io.StringIO()
+        result.write_rejects_csv(output)
+        self.assertIn('Invalid JSON', output.getvalue())
+
+    def test_upload_view(self):
+        user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        self.client.force_login(user)
+        upload = io.BytesIO(self.csv_stream(['Ann,Upload,1990-01-01,F,,555,,1 Street,Bob,556\n']).getvalue().encode())
+        upload.name = 'patients.csv'
+        response = self.client.post(reverse('custom_admin:patient_import'), {'file': upload, 'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertEqual(Patient.objects.get().registered_by, user)
+
+
+class PatientIdAllocatorTests(TransactionTestCase):
+    """Sequential patient IDs leased in blocks from IdSequence"""
+
+    def test_patients_get_increasing_sequential_ids(self):
+        first, second = create_patient(), create_patient()
+        self.assertRegex(first.patient_id, r'^PAT\d{9}$')
+        self.assertLess(first.patient_id, second.patient_id)
+
+    def test_processes_lease_disjoint_blocks(self):
+        worker_a = BlockSequenceAllocator(block_size=10)
+        worker_b = BlockSequenceAllocator(block_size=10)
+        ids_a = worker_a.allocate(3)
+        with CaptureQueriesContext(connection) as queries:
+            ids_a += worker_a.allocate(5)
+        ids_b = worker_b.allocate(2)
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(ids_a[0], 'PAT000000001')
+        self.assertEqual(ids_b, ['PAT000000011', 'PAT000000012'])
+        self.assertEqual(IdSequence.objects.get().next_value, 21)
+
+    def test_bulk_allocation_larger_than_a_block(self):
+        worker = BlockSequenceAllocator(block_size=10)
+        worker.allocate(8)
+        ids = worker.allocate(25)
+        self.assertEqual(len(set(ids)), 25)
+        self.assertEqual(ids[0], 'PAT000000009')
+        self.assertEqual(ids, sorted(ids))
+
+    def test_allocation_inside_a_transaction_is_not_kept_after_rollback(self):
+        class Rollback(Exception):
+            pass
+
+        worker = BlockSequenceAllocator(block_size=10)
+        try:
+            with transaction.atomic():
+                self.assertEqual(worker.allocate(2), ['PAT000000001', 'PAT000000002'])
+                raise Rollback
+        except Rollback:
+            pass
+        self.assertEqual(allocate_patient_ids(1), ['PAT000000001'])
+
+
+@override_settings(JOBS_RUN_INLINE=True)
+class PatientSummaryTests(TestCase):
+    """Clinical summary read model, rebuilt by jobs queued from signals"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = create_patient('Test', 'Patient')
+
+    def add_visit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            history = MedicalHistory.objects.create(patient=self.patient, chief_complaint='Cough')
+            diagnosis = Diagnosis.objects.create(
+                medical_history=history, diagnosis_name='Asthma', diagnosis_date=date(2024, 1, 2),
+                severity='mild', description='Wheezing',
+            )
+            medication = Medication.objects.create(
+                medical_history=history, medication_name='Salbutamol', dosage='100mcg', frequency='as needed',
+                start_date=date(2024, 1, 2), purpose='Relief',
+            )
+        return history, diagnosis, medication
+
+    def stored_summary(self):
+        return PatientSummary.objects.get(pk=self.patient.pk)
+
+    def read_summary(self):
+        return load_summary(Patient.objects.select_related('summary').get(pk=self.patient.pk))
+
+    def test_summary_follows_chart_changes(self):
+        history, _, medication = self.add_visit()
+        summary = self.stored_summary()
+        self.assertFalse(summary.stale)
+        self.assertEqual(summary.data['counts']['diagnoses'], 1)
+        self.assertEqual(summary.data['last_visit']['id'], history.pk)
+        self.assertEqual(summary.data['current_medications'][0]['medication_name'], 'Salbutamol')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            medication.is_active = False
+            medication.save()
+        data = self.stored_summary().data
+        self.assertEqual(data['current_medications'], [])
+        self.assertEqual(data['counts']['medications'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            history.delete()
+        self.assertEqual(self.stored_summary().data['counts']['diagnoses'], 0)
+
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_chart_change_queues_a_rebuild(self):
+        history, _, _ = self.add_visit()
+        before = self.stored_summary()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Allergy.objects.create(
+                medical_history=history, allergen='Dust', reaction='Sneezing',
+                severity='mild', identified_date=date(2024, 1, 3),
+            )
+        after = self.stored_summary()
+        self.assertTrue(after.stale)
+        self.assertEqual(after.data, before.data)
+        self.assertGreater(after.updated_at, before.updated_at)
+        self.assertTrue(Job.objects.filter(name='refresh_summary', status='queued').exists())
+
+        work(burst=True)
+        rebuilt = self.stored_summary()
+        self.assertFalse(rebuilt.stale)
+        self.assertEqual(rebuilt.data['allergies'][0]['allergen'], 'Dust')
+        self.assertEqual(rebuilt.updated_at, after.updated_at)
+
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_stale_summary_is_rebuilt_on_read_until_the_job_runs(self):
+        _, _, medication = self.add_visit()
+        medication.is_active = False
+        medication.save()
+        self.assertEqual(self.read_summary()['current_medications'], [])
+        self.assertFalse(self.stored_summary().stale)
+
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_change_during_rebuild_keeps_summary_stale(self):
+        history, _, medication = self.add_visit()
+        medication.is_active = False
+        medication.save()
+        patient = Patient.objects.select_related('summary').get(pk=self.patient.pk)
+        self.assertTrue(patient.summary.stale)
+        # Another request changes the chart after this one read the summary
+        history.delete()
+        self.assertEqual(load_summary(patient)['counts']['medical_histories'], 0)
+        self.assertTrue(self.stored_summary().stale)
+
+    def test_chart_is_a_single_query(self):
+        self.add_visit()
+        with self.assertNumQueries(1):
+            summary = self.read_summary()
+        self.assertEqual(summary['active_diagnoses'][0]['diagnosis_date'], date(2024, 1, 2))
+
+    def test_chart_opened_after_an_edit_stays_within_budget(self):
+        _, diagnosis, _ = self.add_visit()
+        user = CustomUser.objects.create_user(username='doc', password='pass', role='doctor')
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            diagnosis.status = 'resolved'
+            diagnosis.save()
+
+        with mock.patch('records.views.render', return_value=HttpResponse()) as render:
+            # session, user, conditional GET validator, patient joined to its summary
+            with self.assertNumQueries(views.patient_detail.query_budget):
+                self.client.get(reverse('patient_detail', args=[self.patient.pk]))
+        self.assertEqual(render.call_args.args[2]['all_diagnoses'], [])
+
+    def test_chart_change_creates_missing_summary(self):
+        PatientSummary.objects.all().delete()
+        with override_settings(JOBS_RUN_INLINE=False):
+            self.add_visit()
+        self.assertTrue(self.stored_summary().stale)
+        self.assertEqual(self.read_summary()['counts']['diagnoses'], 1)
+
+    def test_missing_summary_is_built_on_read(self):
+        PatientSummary.objects.all().delete()
+        patient = Patient.objects.select_related('summary').get(pk=self.patient.pk)
+        self.assertEqual(load_summary(patient)['counts']['medical_histories'], 0)
+        self.assertTrue(PatientSummary.objects.filter(pk=self.patient.pk).exists())
+
+    def test_consistency_check_reports_and_fixes_stale_rows(self):
+        self.add_visit()
+        PatientSummary.objects.filter(pk=self.patient.pk).update(data={})
+        with self.assertRaises(CommandError):
+            call_command('check_patient_summaries', stdout=io.StringIO())
+        call_command('check_patient_summaries', '--fix', stdout=io.StringIO())
+        call_command('check_patient_summaries', stdout=io.StringIO())
+
+
+@override_settings(QUERY_INSTRUMENTATION_ENABLED=True, QUERY_BUDGET_STRICT=True)
+class QueryInstrumentationTests(TestCase):
+    """Per-request query counting, Server-Timing and query budgets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        for i in range(15):
+            patient = create_patient('Test', f'Patient {i}', registered_by=cls.user)
+            history = MedicalHistory.objects.create(patient=patient, chief_complaint='Checkup', recorded_by=cls.user)
+            Allergy.objects.create(
+                medical_history=history, allergen='Peanuts', reaction='Hives', severity='mild',
+                identified_date=date.today(),
+            )
+            Diagnosis.objects.create(
+                medical_history=history, diagnosis_name='Flu', diagnosis_date=date.today(),
+                severity='mild', description='Fever',
+            )
+            Medication.objects.create(
+                medical_history=history, medication_name='Rest', dosage='-', frequency='daily',
+                start_date=date.today(), purpose='Recovery', prescribed_by=cls.user,
+            )
+        cls.patient = patient
+        rebuild_statistics()
+
+    def setUp(self):
+        cache.clear()
+        query_stats.reset()
+        self.client.force_login(self.user)
+
+    def test_views_stay_within_budget_and_report_timing(self):
+        for name, args in [('patient_list', []), ('patient_detail', [self.patient.pk]), ('allergy_list', []),
+                           ('diagnosis_list', []), ('medication_list', [])]:
+            response = self.client.get(reverse(f'custom_admin:{name}', args=args))
+            self.assertEqual(response.status_code, 200)
+            self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries')
+
+        rows = {row['view_name']: row for row in query_stats.summary()}
+        self.assertEqual(rows['custom_admin:patient_list']['requests'], 1)
+        self.assertEqual(rows['custom_admin:patient_detail']['budget'], 9)
+
+    def test_exceeding_the_budget_fails(self):
+        with mock.patch.object(admin_views.patient_detail_view, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('custom_admin:patient_detail', args=[self.patient.pk]))
+
+    def test_performance_page(self):
+        self.client.get(reverse('custom_admin:patient_list'))
+        response = self.client.get(reverse('custom_admin:performance'))
+        self.assertContains(response, 'custom_admin:patient_list')
+
+
+class SyntheticDataTests(TestCase):
+    """Seeded synthetic data and the URL benchmark runner"""
+
+    def patient_rows(self):
+        return list(Patient.objects.order_by('patient_id').values_list('first_name', 'last_name', 'date_of_birth'))
+
+    def test_same_patients_however_the_volume_is_built(self):
+        generator = SyntheticDataGenerator(seed=7, batch_size=2)
+        generator.create_users(5)
+        list(generator.create_patients(5))
+        all_at_once = self.patient_rows()
+        self.assertTrue(MedicalHistory.objects.exists())
+        self.assertTrue(PatientSearchToken.objects.exists())
+
+        Patient.objects.all().delete()
+        list(generator.create_patients(2))
+        list(generator.create_patients(3))
+        self.assertEqual(self.patient_rows(), all_at_once)
+
+    def test_generated_timestamps_are_kept_without_touching_field_options(self):
+        generator = SyntheticDataGenerator(seed=3, histories_per_patient=5)
+        generator.create_users(5)
+        list(generator.create_patients(5))
+        # Stamped at insert, these would all be after generator.now
+        timestamps = list(Patient.objects.values_list('created_at', 'updated_at'))
+        self.assertTrue(all(created == updated <= generator.now for created, updated in timestamps))
+        recorded = MedicalHistory.objects.values_list('date_recorded', flat=True)
+        self.assertTrue(recorded)
+        self.assertTrue(all(value <= generator.now for value in recorded))
+        self.assertTrue(Patient._meta.get_field('updated_at').auto_now)
+        self.assertTrue(MedicalHistory._meta.get_field('date_recorded').auto_now_add)
+
+    def test_benchmark_runner_times_every_url(self):
+        generator = SyntheticDataGenerator(seed=1)
+        generator.create_users(5)
+        list(generator.create_patients(3))
+        user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        with self.settings(ALLOWED_HOSTS=['localhost']):
+            results = run_benchmarks(user, repeat=1, warmup=0)
+        self.assertNotIn('logout', results)
+        self.assertEqual(results['custom_admin:patient_detail']['status'], 200)
+        self.assertEqual(results['custom_admin:export']['status'], 200)
+        self.assertGreater(results['custom_admin:patient_list']['queries'], 0)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def ping(self):
+        if not self.alive:
+            raise OSError('gone away')
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Process-wide connection pool used by the pooled MySQL backend"""
+
+    def make_pool(self, **kwargs):
+        self.opened = []
+
+        def connect():
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+
+        return ConnectionPool(connect, **kwargs)
+
+    def test_connections_are_reused_and_rolled_back(self):
+        pool = self.make_pool(size=2)
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(first.rollbacks, 1)
+        self.assertEqual(pool.stats()['connects'], 1)
+
+    def test_dead_and_expired_connections_are_replaced(self):
+        pool = self.make_pool(size=1)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        connection.alive = False
+        replacement = pool.checkout()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+
+        pool.max_lifetime = 0
+        pool.checkin(replacement)
+        self.assertTrue(replacement.closed)
+        self.assertEqual(pool.stats()['failed_pings'], 1)
+        self.assertEqual(pool.stats()['open'], 0)
+
+    def test_overflow_is_closed_on_return_and_exhaustion_times_out(self):
+        pool = self.make_pool(size=1, max_overflow=1, timeout=0.05)
+        first, second = pool.checkout(), pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        pool.checkin(first)
+        pool.checkin(second)
+        self.assertTrue(second.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['open'], stats['idle'], stats['timeouts']), (1, 1, 1))
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        pool = self.make_pool(size=1, max_overflow=0, timeout=5)
+        connection = pool.checkout()
+        threading.Timer(0.05, pool.checkin, [connection]).start()
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(pool.stats()['waits'], 1)
+        self.assertGreater(pool.stats()['max_wait_ms'], 0)
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        reset_health()
+        self.addCleanup(reset_health)
+
+    def read_db(self, request, write=False):
+        @use_replica
+        def view(request):
+            if write:
+                self.router.db_for_write(Patient)
+            return HttpResponse(self.router.db_for_read(Patient) or 'default')
+
+        return ReplicaPinMiddleware(view)(request)
+
+    def test_reads_go_to_healthy_replica_outside_transactions(self):
+        with mock.patch('records.replicas.replica_lag', return_value=1.0), \
+                mock.patch('records.replicas.connections') as connections:
+            connections.__getitem__.return_value.in_atomic_block = False
+            response = self.read_db(self.factory.get('/'))
+            self.assertEqual(response.content, b'replica_1')
+            self.assertNotIn(PIN_COOKIE, response.cookies)
+            # Not a @use_replica view
+            self.assertIsNone(self.router.db_for_read(Patient))
+            self.assertEqual(self.router.db_for_write(Patient), 'default')
+
+    def test_lagging_or_unknown_replica_falls_back_to_primary(self):
+        for lag in (60.0, None):
+            reset_health()
+            with mock.patch('records.replicas.replica_lag', return_value=lag), \
+                    mock.patch('records.replicas.connections') as connections:
+                connections.__getitem__.return_value.in_atomic_block = False
+                self.assertEqual(self.read_db(self.factory.get('/')).content, b'default')
+
+    @override_settings(REPLICA_PIN_SECONDS=30, REPLICA_MAX_LAG=10, REPLICA_LAG_CHECK_INTERVAL=5)
+    def test_write_pins_browser_to_primary(self):
+        with mock.patch('records.replicas.replica_lag', return_value=0.0), \
+                mock.patch('records.replicas.connections') as connections:
+            connections.__getitem__.return_value.in_atomic_block = False
+            response = self.read_db(self.factory.get('/'), write=True)
+            self.assertEqual(response.content, b'default')
+            self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 30)
+
+            request = self.factory.get('/')
+            request.COOKIES[PIN_COOKIE] = '1'
+            self.assertEqual(self.read_db(request).content, b'default')
+
+    @override_settings(REPLICA_PIN_SECONDS=5, REPLICA_MAX_LAG=10, REPLICA_LAG_CHECK_INTERVAL=2.5)
+    def test_pin_outlasts_the_lag_of_a_healthy_replica(self):
+        # A replica up to 10s behind passes the check and is trusted for
+        # 2.5s more: a 5s pin would end while it may still miss the write
+        self.assertEqual(pin_seconds(), 13)
+
+
+@override_settings(AUTOCOMPLETE_INDEX_ENABLED=False)
+class AsyncViewTests(TestCase):
+    """The async views render the same pages as the sync views"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        patient = create_patient(blood_group='O+')
+        history = MedicalHistory.objects.create(patient=patient, recorded_by=cls.user, chief_complaint='Checkup')
+        Allergy.objects.create(
+            medical_history=history, allergen='Penicillin', reaction='Rash',
+            severity='severe', identified_date=date(2024, 1, 1),
+        )
+        Diagnosis.objects.create(
+            medical_history=history, diagnosis_name='Influenza', diagnosis_date=date(2024, 1, 2),
+            severity='mild', status='active',
+        )
+        Medication.objects.create(
+            medical_history=history, medication_name='Aspirin', dosage='1', frequency='daily',
+            start_date=date(2024, 1, 3), prescribed_by=cls.user,
+        )
+        rebuild_statistics()
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+
+    def request(self, path, user=None):
+        request = self.factory.get(path)
+        request.session = {}
+
+        async def auser():
+            return user or AnonymousUser()
+        request.auser = auser
+        return request
+
+    async def test_pages_render_with_data(self):
+        for view, text in (
+            (async_views.custom_admin_dashboard, 'Penicillin'),
+            (async_views.patient_list_view, 'Lovelace'),
+            (async_views.allergy_list_view, 'Penicillin'),
+            (async_views.diagnosis_list_view, 'Influenza'),
+            (async_views.medication_list_view, 'Aspirin'),
+        ):
+            with self.subTest(view=view.__name__):
+                response = await view(self.request('/', self.user))
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, text)
+
+    async def test_patient_search_matches_sync_view(self):
+        request = self.request('/?q=lov', self.user)
+        response = await async_views.ajax_patient_search(request)
+        sync_request = RequestFactory().get('/?q=lov')
+        sync_request.user = self.user
+        sync_response = await sync_to_async(admin_views.ajax_patient_search)(sync_request)
+        self.assertEqual(json.loads(response.content), json.loads(sync_response.content))
+        self.assertEqual(len(json.loads(response.content)['results']), 1)
+
+    async def test_anonymous_user_is_redirected_to_login(self):
+        response = await async_views.patient_list_view(self.request('/management/patients/'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('next=/management/patients/', response['Location'])
+
+
+class DashboardEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        cls.patient = create_patient(blood_group='O+')
+        cls.history = MedicalHistory.objects.create(patient=cls.patient, recorded_by=cls.user, chief_complaint='Checkup')
+
+    def setUp(self):
+        dashboard_events.reset()
+        self.addCleanup(dashboard_events.reset)
+
+    def create_allergy(self, severity):
+        with self.captureOnCommitCallbacks(execute=True):
+            Allergy.objects.create(
+                medical_history=self.history, allergen='Penicillin', reaction='Rash',
+                severity=severity, identified_date=date(2024, 1, 1),
+            )
+
+    async def test_published_events_reach_subscribers_and_resume(self):
+        subscription, backlog = dashboard_events.subscribe()
+        self.assertEqual(backlog, [])
+        await sync_to_async(self.create_allergy, thread_sensitive=True)('life_threatening')
+        await sync_to_async(self.create_allergy, thread_sensitive=True)('mild')
+
+        first = await asyncio.wait_for(subscription.queue.get(), 1)
+        second = await asyncio.wait_for(subscription.queue.get(), 1)
+        self.assertIn('event: allergy', first)
+        self.assertIn('"critical":true', first)
+        self.assertIn('"patient":"Ada Lovelace"', first)
+        self.assertIn('"severity":"Life Threatening"', first)
+        self.assertEqual(second.split('\n')[2], 'data: {"critical":false}')
+
+        # A reconnecting browser gets what it missed
+        event_id = int(first.split('\n')[0].split(': ')[1])
+        _, backlog = dashboard_events.subscribe(last_event_id=event_id)
+        self.assertEqual(backlog, [second])
+
+    def test_nothing_is_published_without_subscribers(self):
+        with mock.patch.object(dashboard_events, 'publish') as publish:
+            self.create_allergy('severe')
+        publish.assert_not_called()
+
+    async def test_slow_subscriber_is_cut_off(self):
+        subscription, _ = dashboard_events.subscribe()
+        for number in range(dashboard_events.queue_size + 1):
+            dashboard_events.publish('patient', {'number': number})
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.overflowed)
+
+    async def test_stream_under_asgi(self):
+        request = AsyncRequestFactory().get('/management/events/')
+        request.session = {}
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        response = await async_views.dashboard_events_view(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        await asyncio.sleep(0)
+        dashboard_events.publish('patient', {'name': 'Ada Lovelace'})
+        self.assertIn(b'"name":"Ada Lovelace"', await asyncio.wait_for(anext(stream), 1))
+        await stream.aclose()
+
+    def test_stream_is_not_served_under_wsgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('custom_admin:dashboard_events')).status_code, 204)
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        cls.patient = create_patient(blood_group='O+')
+        cls.history = MedicalHistory.objects.create(patient=cls.patient, recorded_by=cls.user, chief_complaint='Checkup')
+        rebuild_statistics()
+
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.client.force_login(self.user)
+
+    def test_list_page_is_cached_until_the_list_changes(self):
+        url = reverse('custom_admin:allergy_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "records_allergy"' in q['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Allergy.objects.create(
+                medical_history=self.history, allergen='Penicillin', reaction='Rash',
+                severity='mild', identified_date=date(2024, 1, 1),
+            )
+        self.assertContains(self.client.get(url), 'Penicillin')
+
+    def test_patient_change_invalidates_dashboard_and_header_fragments(self):
+        detail = reverse('custom_admin:patient_detail', args=[self.patient.pk])
+        self.client.get(reverse('custom_admin:dashboard'))
+        self.client.get(detail)
+        self.assertNotContains(self.client.get(reverse('custom_admin:dashboard')), 'Grace')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.first_name = 'Grace'
+            self.patient.save()
+        self.assertContains(self.client.get(reverse('custom_admin:dashboard')), 'Grace Lovelace')
+        self.assertContains(self.client.get(detail), 'Grace Lovelace')
+
+        groups = {row['group']: row for row in cache_stats()}
+        self.assertEqual(groups['fragment dashboard_recent_patients']['hits'], 1)
+        self.assertEqual(groups['fragment dashboard_recent_patients']['misses'], 2)
+        self.assertEqual(groups['fragment patient_header']['misses'], 2)
+
+
+@override_settings(AUTOCOMPLETE_INDEX_ENABLED=False)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        cls.patient = create_patient(blood_group='O+')
+        cls.history = MedicalHistory.objects.create(patient=cls.patient, recorded_by=cls.user, chief_complaint='Checkup')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_patient_detail_is_not_rendered_when_unchanged(self):
+        url = reverse('custom_admin:patient_detail', args=[self.patient.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        # session, user, validator
+        with self.assertNumQueries(3):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Allergy.objects.create(
+                medical_history=self.history, allergen='Penicillin', reaction='Rash',
+                severity='mild', identified_date=date(2024, 1, 1),
+            )
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_patient_search_revalidates_against_patient_changes(self):
+        url = reverse('custom_admin:ajax_patient_search')
+        response = self.client.get(url, {'q': 'lov'})
+        self.assertEqual(self.client.get(url, {'q': 'lov'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_patient('Grace', 'Lovell')
+        self.assertEqual(self.client.get(url, {'q': 'lov'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_list_etag_follows_versions_shared_between_processes(self):
+        url = reverse('custom_admin:medication_list')
+        etag = self.client.get(url)['ETag']
+        # A worker with an empty local cache computes the same ETag...
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # ...and sees a bump made elsewhere: only the database row changes
+        CacheVersion.objects.update_or_create(name='medications', defaults={'version': 42})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_differs_per_user(self):
+        url = reverse('custom_admin:allergy_list')
+        etag = self.client.get(url)['ETag']
+        other = CustomUser.objects.create_user(username='doctor', password='pass', role='doctor')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+def make_photo(size=(3000, 2000), orientation=None, color=(200, 80, 40)):
+    image = Image.new('RGB', size, color)
+    exif = Image.Exif()
+    exif[0x0110] = 'Camera'  # Model
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, JOBS_RUN_INLINE=True, IMAGE_MAX_DIMENSION=1000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+
+    def test_upload_is_normalised_and_variants_written(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = create_patient(photo=make_photo(orientation=6))
+        patient.refresh_from_db()
+
+        with default_storage.open(patient.photo.name) as stored:
+            original = Image.open(stored)
+            # Rotated upright from the EXIF orientation, then capped
+            self.assertEqual(original.size, (667, 1000))
+            self.assertEqual(len(original.getexif()), 0)
+
+        self.assertEqual(set(patient.photo_variants), set(VARIANT_SIZES))
+        small = patient.photo_variants['small']
+        with default_storage.open(small['webp'][1]) as stored:
+            variant = Image.open(stored)
+            self.assertEqual((variant.format, variant.size), ('WEBP', (80, 80)))
+        with default_storage.open(small['jpeg'][0]) as stored:
+            self.assertEqual(Image.open(stored).size, (40, 40))
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_new_upload_replaces_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = create_patient(photo=make_photo())
+        patient.refresh_from_db()
+        first = patient.photo_variants['small']['jpeg'][0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.photo = make_photo(size=(400, 400), color=(10, 120, 200))
+            patient.save()
+            self.assertEqual(patient.photo_variants, {})
+        patient.refresh_from_db()
+        self.assertNotEqual(patient.photo_variants['small']['jpeg'][0], first)
+        self.assertFalse(default_storage.exists(first))
+
+    def test_templates_serve_variants_and_fall_back_to_the_original(self):
+        self.client.force_login(self.user)
+        patient = create_patient(photo=make_photo(size=(300, 300)))
+        # Not processed yet: the original is served
+        response = self.client.get(reverse('custom_admin:patient_detail', args=[patient.pk]))
+        self.assertContains(response, f'src="{patient.photo.url}"')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.photo = make_photo(size=(300, 300))
+            patient.save()
+        patient.refresh_from_db()
+        response = self.client.get(reverse('custom_admin:patient_list'))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, default_storage.url(patient.photo_variants['small']['webp'][1]) + ' 2x')
+        self.assertNotContains(response, f'src="{patient.photo.url}"')
+
+
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_identical_uploads_share_one_sharded_blob(self):
+        first = default_storage.save('patient_photos/scan.JPG', ContentFile(b'same bytes'))
+        second = default_storage.save('profile_pics/other.jpg', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(first, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(len(list(default_storage.blob_names())), 1)
+
+        default_storage.delete(first)
+        self.assertTrue(default_storage.exists(first))
+
+    def test_files_stored_before_blobs_are_still_deleted(self):
+        legacy = FileSystemStorage(location=self.media_root.name).save('patient_photos/old.jpg', ContentFile(b'old'))
+        self.assertTrue(default_storage.exists(legacy))
+        default_storage.delete(legacy)
+        self.assertFalse(default_storage.exists(legacy))
+
+    def test_garbage_collection_keeps_referenced_and_recent_blobs(self):
+        kept = default_storage.save('patient_photos/kept.jpg', ContentFile(b'kept'))
+        deleted = default_storage.save('patient_photos/deleted.jpg', ContentFile(b'deleted'))
+        orphan = default_storage.save('patient_photos/orphan.jpg', ContentFile(b'orphan'))
+        create_patient(photo=kept)
+        # Soft-deleted, not purged yet: its photo is still referenced
+        delete_patient(create_patient('Bob', 'Smith', gender='M', photo=deleted))
+
+        call_command('collect_media_garbage', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(orphan))
+
+        call_command('collect_media_garbage', '--min-age', '0', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(kept))
+        self.assertTrue(default_storage.exists(deleted))
+        self.assertFalse(default_storage.exists(orphan))
+
+    def test_blobs_are_served_with_far_future_caching(self):
+        blob = default_storage.save('patient_photos/photo.jpg', ContentFile(b'photo'))
+        request = RequestFactory().get('/media/' + blob)
+        response = serve_media(request, blob, document_root=self.media_root.name)
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+job_calls = []
+
+
+@job('tests.record_call')
+def record_call(value, failures=0):
+    job_calls.append(value)
+    if len(job_calls) <= failures:
+        raise RuntimeError('flaky')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        job_calls.clear()
+
+    def test_job_is_queued_with_the_transaction(self):
+        try:
+            with transaction.atomic():
+                enqueue('tests.record_call', value=1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.exists())
+        with self.assertRaises(ValueError):
+            enqueue('tests.missing')
+
+    def test_workers_run_due_jobs_and_record_the_outcome(self):
+        enqueue('tests.record_call', value=1)
+        enqueue('tests.record_call', value=2)
+        later = enqueue('tests.record_call', value=3, delay=60)
+
+        self.assertEqual(work(burst=True), 2)
+        self.assertEqual(job_calls, [1, 2])
+        self.assertEqual(Job.objects.filter(status='done', duration__isnull=False).count(), 2)
+        later.refresh_from_db()
+        self.assertEqual(later.status, 'queued')
+
+        metrics = job_metrics()
+        self.assertEqual(metrics[0]['name'], 'tests.record_call')
+        self.assertEqual((metrics[0]['queued'], metrics[0]['done']), (1, 2))
+
+    def test_claimed_job_is_not_claimed_again(self):
+        enqueue('tests.record_call', value=1)
+        self.assertEqual(len(claim('worker-1')), 1)
+        self.assertEqual(claim('worker-2'), [])
+
+    @override_settings(JOB_RETRY_BASE_DELAY=10, JOB_RETRY_MAX_DELAY=3600)
+    def test_failed_job_is_retried_with_backoff_then_failed(self):
+        queued = enqueue('tests.record_call', value=1, failures=5, max_attempts=2)
+        with self.assertLogs('records.jobs', 'WARNING'):
+            self.assertFalse(execute(claim('worker')[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('flaky', queued.last_error)
+        self.assertGreater(queued.run_at, queued.created_at + timedelta(seconds=4))
+
+        Job.objects.filter(pk=queued.pk).update(run_at=queued.created_at)
+        with self.assertLogs('records.jobs', 'ERROR'):
+            self.assertFalse(execute(claim('worker')[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_abandoned_jobs_are_queued_again(self):
+        queued = enqueue('tests.record_call', value=1)
+        claim('dead-worker')
+        Job.objects.filter(pk=queued.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(requeue_stale(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_by), ('queued', ''))
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_job_requeued_while_waiting_in_a_batch_runs_once(self):
+        enqueue('tests.record_call', value=1)
+        waiting = enqueue('tests.record_call', value=2)
+        first, second = claim('worker-1', limit=2)
+        # The first job runs long; the second is taken for abandoned
+        Job.objects.filter(pk=waiting.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+        requeue_stale()
+        [taken_over] = claim('worker-2')
+
+        self.assertTrue(execute(first))
+        self.assertFalse(execute(second))
+        self.assertTrue(execute(taken_over))
+        self.assertEqual(job_calls, [1, 2])
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_inline_mode_runs_jobs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record_call', value=1)
+            self.assertEqual(job_calls, [])
+        self.assertEqual(job_calls, [1])
+        self.assertEqual(Job.objects.get().status, 'done')
+
+
+class PatientDeletionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        cls.patient = create_patient()
+        history = MedicalHistory.objects.create(patient=cls.patient, recorded_by=cls.user, chief_complaint='Checkup')
+        for i in range(3):
+            Diagnosis.objects.create(
+                medical_history=history, diagnosis_name=f'Condition {i}', diagnosis_date=date(2024, 1, 1),
+                severity='mild', status='active',
+            )
+            Medication.objects.create(
+                medical_history=history, medication_name=f'Drug {i}', dosage='1', frequency='daily',
+                start_date=date(2024, 1, 1), is_active=i > 0, prescribed_by=cls.user,
+            )
+        Allergy.objects.create(
+            medical_history=history, allergen='Penicillin', reaction='Rash',
+            severity='severe', identified_date=date(2024, 1, 1),
+        )
+        rebuild_statistics()
+        # Summary rebuilds queued by the rows above
+        Job.objects.all().delete()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_delete_view_hides_patient_and_queues_purge(self):
+        response = self.client.post(reverse('custom_admin:patient_delete', args=[self.patient.pk]))
+        self.assertRedirects(response, reverse('custom_admin:patient_list'))
+
+        self.assertEqual(self.client.get(reverse('custom_admin:patient_detail', args=[self.patient.pk])).status_code, 404)
+        self.assertEqual(list(self.client.get(reverse('custom_admin:allergy_list')).context['page_obj']), [])
+        self.assertEqual(self.client.get(reverse('custom_admin:diagnosis_list')).context['unique_patients'], 0)
+        self.assertEqual(self.client.get(reverse('custom_admin:medication_list')).context['unique_patients'], 0)
+        self.assertEqual(get_statistics()['patients'], 0)
+        # Nothing is deleted in the request
+        self.assertEqual(Diagnosis.objects.count(), 3)
+        self.assertEqual(Job.objects.get().name, 'purge_patient')
+
+    def test_soft_delete_takes_rows_out_of_counters(self):
+        delete_patient(self.patient)
+        counters = get_statistics()
+        self.assertEqual(counters['diagnoses'], 0)
+        self.assertEqual(counters['medications'], 0)
+        self.assertEqual(counters['active_medications'], 0)
+        self.assertEqual(counters['allergies'], 0)
+        self.assertEqual(counters['medical_histories'], 0)
+        self.assertEqual(counters, {**counters, **rebuild_statistics()})
+
+        response = self.client.get(reverse('custom_admin:medication_list'))
+        self.assertEqual(response.context['total_count'], 0)
+        self.assertEqual(response.context['active_count'], 0)
+
+    @override_settings(PATIENT_PURGE_BATCH_SIZE=2)
+    def test_purge_deletes_rows_in_batches_and_keeps_counters(self):
+        delete_patient(self.patient)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(work(burst=True), 1)
+        batches = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('DELETE FROM "records_diagnosis"')]
+        self.assertEqual(len(batches), 2)
+
+        self.assertFalse(Patient.all_objects.filter(pk=self.patient.pk).exists())
+        for model in (MedicalHistory, Diagnosis, Allergy, Medication, PatientSummary):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        purge = Job.objects.get()
+        self.assertEqual(purge.progress['deleted'], purge.progress['total'])
+
+        counters = get_statistics()
+        self.assertEqual(counters, {**counters, **rebuild_statistics()})
+
+    def test_purge_command_reports_progress(self):
+        delete_patient(self.patient)
+        output = io.StringIO()
+        call_command('purge_deleted_patients', '--batch-size', '2', stdout=output)
+        self.assertIn('Purged 1 patients.', output.getvalue())
+        self.assertIn('rows, records_patient', output.getvalue())
+        self.assertFalse(Patient.all_objects.exists())
+
+
+class AuditLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin', password='pass', role='admin', is_staff=True)
+        cls.other = CustomUser.objects.create_user(username='nurse', password='pass', role='nurse', is_staff=True)
+        cls.patient = create_patient()
+        cls.history = MedicalHistory.objects.create(patient=cls.patient, recorded_by=cls.user, chief_complaint='Checkup')
+
+    def setUp(self):
+        cache.clear()
+        audit_log.discard()
+        self.client.force_login(self.user)
+
+    def test_reads_are_buffered_not_written_in_the_request(self):
+        with self.assertNumQueries(0):
+            # No database work beyond the view's own
+            audit_log.record(AuditEvent(user_id=self.user.pk, username='admin', action='view',
+                                        resource='medical_history', object_id=self.history.pk, path='/'))
+        self.client.get(reverse('custom_admin:patient_detail', args=[self.patient.pk]))
+        self.client.get(reverse('custom_admin:patient_list'))
+        self.assertFalse(AuditEvent.objects.exists())
+
+        self.assertEqual(audit_log.flush(), 3)
+        events = list(AuditEvent.objects.order_by('pk').values_list('action', 'resource', 'object_id', 'patient_id'))
+        self.assertEqual(events, [
+            ('view', 'medical_history', self.history.pk, self.patient.pk),
+            ('view', 'patient', self.patient.pk, self.patient.pk),
+            ('list', 'patient', None, None),
+        ])
+
+    def test_writes_are_logged_with_the_created_record(self):
+        response = self.client.post(reverse('custom_admin:allergy_create'), {
+            'patient': self.patient.pk, 'allergen': 'Penicillin', 'reaction': 'Rash',
+            'severity': 'severe', 'identified_date': '2024-01-01',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.client.post(reverse('custom_admin:patient_delete', args=[self.patient.pk]))
+        # Invalid forms are not writes
+        self.client.post(reverse('custom_admin:allergy_create'), {})
+        audit_log.flush()
+
+        allergy = Allergy.objects.get()
+        events = list(AuditEvent.objects.order_by('pk').values_list('action', 'resource', 'object_id', 'patient_id'))
+        self.assertEqual(events, [
+            ('create', 'allergy', allergy.pk, self.patient.pk),
+            ('delete', 'patient', self.patient.pk, self.patient.pk),
+        ])
+
+    def test_failed_flush_keeps_events(self):
+        self.client.get(reverse('custom_admin:patient_detail', args=[self.patient.pk]))
+        with mock.patch.object(AuditEvent.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                audit_log.flush()
+        self.assertEqual(audit_log.flush(), 1)
+
+    def test_audit_log_view_filters_by_patient_and_user(self):
+        self.client.get(reverse('custom_admin:patient_detail', args=[self.patient.pk]))
+        self.client.force_login(self.other)
+        self.client.get(reverse('custom_admin:patient_detail', args=[self.patient.pk]))
+        self.client.get(reverse('custom_admin:patient_list'))
+        audit_log.flush()
+
+        url = reverse('custom_admin:audit_log')
+        by_patient = self.client.get(url, {'patient': self.patient.pk})
+        self.assertEqual([event.username for event in by_patient.context['page_obj']], ['nurse', 'admin'])
+        self.assertContains(by_patient, 'Access history of Ada Lovelace')
+
+        by_user = self.client.get(url, {'user': 'nurse', 'action': 'list'})
+        self.assertEqual([event.action for event in by_user.context['page_obj']], ['list'])
+
+    def test_expired_events_are_deleted_without_partitions(self):
+        AuditEvent.objects.create(username='admin', action='view', path='/',
+                                  timestamp=timezone.now() - timedelta(days=400))
+        AuditEvent.objects.create(username='admin', action='view', path='/')
+        self.assertEqual(maintain_partitions(retention_months=12), ([], 1))
+        self.assertEqual(AuditEvent.objects.count(), 1)
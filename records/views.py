@@ -2,10 +2,18 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count
-from .models import CustomUser, Patient, MedicalHistory, Diagnosis, Allergy, Medication
+from django.db.models import Count
+from .models import Patient, MedicalHistory
 from .forms import (CustomUserCreationForm, LoginForm, PatientForm, 
                     MedicalHistoryForm, DiagnosisForm, AllergyForm, MedicationForm)
+from .audit import audited
+from .conditional import conditional_on, medical_history_validator, patient_validator
+from .deletion import delete_patient
+from .instrumentation import query_budget
+from .replicas import use_replica
+from .search import search_patients
+from .stats import get_statistics
+from .summaries import load_summary
 
 
 def user_login(request):
@@ -48,54 +56,53 @@ def user_logout(request):
 
 
 @login_required
+@use_replica
 def dashboard(request):
+    stats = get_statistics()
     context = {
-        'total_patients': Patient.objects.count(),
-        'total_doctors': CustomUser.objects.filter(role='doctor').count(),
-        'total_nurses': CustomUser.objects.filter(role='nurse').count(),
+        'total_patients': stats['patients'],
+        'total_doctors': stats['doctors'],
+        'total_nurses': stats['nurses'],
         'recent_patients': Patient.objects.all()[:5],
-        'total_records': MedicalHistory.objects.count(),
+        'total_records': stats['medical_histories'],
     }
     return render(request, 'records/dashboard.html', context)
 
 
 @login_required
+@audited('list', 'patient')
+@use_replica
 def patient_list(request):
     query = request.GET.get('q', '')
     if query:
-        patients = Patient.objects.filter(
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query) | 
-            Q(patient_id__icontains=query) |
-            Q(phone__icontains=query)
-        )
+        patients = search_patients(query)
     else:
         patients = Patient.objects.all()
     
     return render(request, 'records/patient_list.html', {'patients': patients, 'query': query})
 
 
+@query_budget(4)
 @login_required
+@audited('view', 'patient')
+@conditional_on(patient_validator)
 def patient_detail(request, pk):
-    patient = get_object_or_404(Patient, pk=pk)
-    medical_histories = patient.medical_histories.all()
-    
-    # Get all diagnoses, allergies, and medications
-    all_diagnoses = Diagnosis.objects.filter(medical_history__patient=patient)
-    all_allergies = Allergy.objects.filter(medical_history__patient=patient)
-    all_medications = Medication.objects.filter(medical_history__patient=patient, is_active=True)
+    patient = get_object_or_404(Patient.objects.select_related('summary'), pk=pk)
+    summary = load_summary(patient)
     
     context = {
         'patient': patient,
-        'medical_histories': medical_histories,
-        'all_diagnoses': all_diagnoses,
-        'all_allergies': all_allergies,
-        'all_medications': all_medications,
+        'summary': summary,
+        'medical_histories': summary['recent_visits'],
+        'all_diagnoses': summary['active_diagnoses'],
+        'all_allergies': summary['allergies'],
+        'all_medications': summary['current_medications'],
     }
     return render(request, 'records/patient_detail.html', context)
 
 
 @login_required
+@audited('create', 'patient')
 def patient_create(request):
     if request.method == 'POST':
         form = PatientForm(request.POST, request.FILES)
@@ -103,6 +110,7 @@ def patient_create(request):
             patient = form.save(commit=False)
             patient.registered_by = request.user
             patient.save()
+            request.audit_object = patient
             messages.success(request, f'Patient {patient.patient_id} registered successfully!')
             return redirect('patient_detail', pk=patient.pk)
     else:
@@ -112,6 +120,7 @@ def patient_create(request):
 
 
 @login_required
+@audited('update', 'patient')
 def patient_update(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
     if request.method == 'POST':
@@ -127,10 +136,11 @@ def patient_update(request, pk):
 
 
 @login_required
+@audited('delete', 'patient')
 def patient_delete(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
     if request.method == 'POST':
-        patient.delete()
+        delete_patient(patient)
         messages.success(request, 'Patient record deleted successfully!')
         return redirect('patient_list')
     
@@ -138,6 +148,7 @@ def patient_delete(request, pk):
 
 
 @login_required
+@audited('create', 'patient', kwarg='patient_pk')
 def medical_history_create(request, patient_pk):
     patient = get_object_or_404(Patient, pk=patient_pk)
     if request.method == 'POST':
@@ -147,6 +158,7 @@ def medical_history_create(request, patient_pk):
             medical_history.patient = patient
             medical_history.recorded_by = request.user
             medical_history.save()
+            request.audit_object = medical_history
             messages.success(request, 'Medical history recorded successfully!')
             return redirect('medical_history_detail', pk=medical_history.pk)
     else:
@@ -160,6 +172,8 @@ def medical_history_create(request, patient_pk):
 
 
 @login_required
+@audited('view', 'medical_history')
+@conditional_on(medical_history_validator)
 def medical_history_detail(request, pk):
     medical_history = get_object_or_404(MedicalHistory, pk=pk)
     diagnoses = medical_history.diagnoses.all()
@@ -176,6 +190,7 @@ def medical_history_detail(request, pk):
 
 
 @login_required
+@audited('create', 'medical_history', kwarg='history_pk')
 def add_diagnosis(request, history_pk):
     medical_history = get_object_or_404(MedicalHistory, pk=history_pk)
     if request.method == 'POST':
@@ -184,6 +199,7 @@ def add_diagnosis(request, history_pk):
             diagnosis = form.save(commit=False)
             diagnosis.medical_history = medical_history
             diagnosis.save()
+            request.audit_object = diagnosis
             messages.success(request, 'Diagnosis added successfully!')
             return redirect('medical_history_detail', pk=medical_history.pk)
     else:
@@ -197,6 +213,7 @@ def add_diagnosis(request, history_pk):
 
 
 @login_required
+@audited('create', 'medical_history', kwarg='history_pk')
 def add_allergy(request, history_pk):
     medical_history = get_object_or_404(MedicalHistory, pk=history_pk)
     if request.method == 'POST':
@@ -205,6 +222,7 @@ def add_allergy(request, history_pk):
             allergy = form.save(commit=False)
             allergy.medical_history = medical_history
             allergy.save()
+            request.audit_object = allergy
             messages.success(request, 'Allergy added successfully!')
             return redirect('medical_history_detail', pk=medical_history.pk)
     else:
@@ -218,6 +236,7 @@ def add_allergy(request, history_pk):
 
 
 @login_required
+@audited('create', 'medical_history', kwarg='history_pk')
 def add_medication(request, history_pk):
     medical_history = get_object_or_404(MedicalHistory, pk=history_pk)
     if request.method == 'POST':
@@ -227,6 +246,7 @@ def add_medication(request, history_pk):
             medication.medical_history = medical_history
             medication.prescribed_by = request.user
             medication.save()
+            request.audit_object = medication
             messages.success(request, 'Medication added successfully!')
             return redirect('medical_history_detail', pk=medical_history.pk)
     else:
@@ -0,0 +1,109 @@
+/*
+ * Patient typeahead picker
+ *
+ * Queries the AJAX patient search endpoint as the user types (debounced)
+ * and stores the chosen patient's pk in the hidden input, so pages never
+ * have to render the full patient list.
+ */
+(function () {
+    const DEBOUNCE_MS = 250;
+    const MIN_QUERY_LENGTH = 2;
+
+    function initTypeahead(container) {
+        const url = container.dataset.url;
+        const valueInput = container.querySelector('.patient-typeahead-value');
+        const textInput = container.querySelector('input[type="text"]');
+        const resultsList = container.querySelector('.patient-typeahead-results');
+        let timer = null;
+        let query = '';
+        let page = 1;
+        let request = null;
+
+        function hideResults() {
+            resultsList.hidden = true;
+            resultsList.innerHTML = '';
+        }
+
+        function addItem(text, onSelect, muted) {
+            const item = document.createElement('li');
+            item.textContent = text;
+            item.style.padding = '0.6rem 1rem';
+            item.style.cursor = 'pointer';
+            if (muted) {
+                item.style.color = '#666';
+                item.style.fontStyle = 'italic';
+            }
+            item.addEventListener('mouseenter', () => { item.style.background = 'rgba(108,92,231,0.1)'; });
+            item.addEventListener('mouseleave', () => { item.style.background = ''; });
+            item.addEventListener('mousedown', (e) => {
+                e.preventDefault();
+                onSelect();
+            });
+            resultsList.appendChild(item);
+        }
+
+        function fetchPage(append) {
+            if (request) {
+                request.abort();
+            }
+            request = new AbortController();
+            const params = new URLSearchParams({ q: query, page: page });
+            fetch(`${url}?${params}`, { signal: request.signal, headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+                .then(response => response.json())
+                .then(data => {
+                    if (!append) {
+                        resultsList.innerHTML = '';
+                    } else if (resultsList.lastChild) {
+                        resultsList.removeChild(resultsList.lastChild);
+                    }
+                    data.results.forEach(patient => {
+                        addItem(patient.text, () => {
+                            valueInput.value = patient.id;
+                            textInput.value = patient.text;
+                            hideResults();
+                        });
+                    });
+                    if (data.pagination && data.pagination.more) {
+                        addItem('Load more...', () => {
+                            page += 1;
+                            fetchPage(true);
+                        }, true);
+                    }
+                    if (!resultsList.children.length) {
+                        addItem('No patients found', hideResults, true);
+                    }
+                    resultsList.hidden = false;
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') {
+                        hideResults();
+                    }
+                });
+        }
+
+        textInput.addEventListener('input', () => {
+            valueInput.value = '';
+            clearTimeout(timer);
+            query = textInput.value.trim();
+            if (query.length < MIN_QUERY_LENGTH) {
+                hideResults();
+                return;
+            }
+            timer = setTimeout(() => {
+                page = 1;
+                fetchPage(false);
+            }, DEBOUNCE_MS);
+        });
+
+        textInput.addEventListener('blur', hideResults);
+        textInput.addEventListener('keydown', (e) => {
+            if (e.key === 'Escape') {
+                hideResults();
+            }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        document.querySelectorAll('.patient-typeahead').forEach(initTypeahead);
+    });
+})();